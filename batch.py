@@ -0,0 +1,481 @@
+"""Lockstep emulation of many Chip8 instances with NumPy.
+
+``BatchChip8`` keeps the state of N machines in arrays with one row per
+instance and follows ``Chip8`` instruction semantics exactly; a batch
+instance and a ``Chip8`` started from the same save state stay
+byte-for-byte identical. Each step classifies every instance's next opcode,
+groups the instances by instruction and executes each group with a handful
+of array operations, so the per-instance cost of a step shrinks as N grows.
+
+Instances that hit an error the interpreter would raise on (a stack
+overflow, a memory access past the end, a key index out of range, ...) are
+marked ``crashed`` and no longer executed. Only the classic instruction set
+is emulated: instances that execute a SUPER-CHIP instruction are marked
+``crashed`` too, and hi-res save states can't be loaded.
+
+Like ``Chip8``, a batch follows one set of quirks, given as a profile name
+or a ``Quirks``. Save states don't record them, so states loaded into a
+batch must come from machines with the same quirks.
+"""
+import numpy as np
+
+from chip8 import (
+    CYCLES_PER_FRAME,
+    HIRES_FONT_START,
+    MEMORY_SIZE,
+    PROGRAM_START,
+    SCREEN_HEIGHT,
+    SCREEN_WIDTH,
+    STATE_MAGIC,
+    STATE_VERSION,
+    STATE_SIZE,
+    _STATE,
+    _FRAMEBUFFER,
+    decode,
+    fontset,
+    hires_fontset,
+    quirk_profile,
+)
+
+_KIND_NAMES = []  # kind number -> handler name, filled with _KIND_TABLE
+_KIND_TABLE = None  # opcode -> kind number
+
+
+def _kind_table():
+    """Classify all 65,536 opcodes by the name of their ``Chip8`` handler.
+
+    Handler names don't depend on the quirks, so one table serves every
+    batch; the ``_op_`` methods apply the batch's quirks themselves.
+    """
+    global _KIND_TABLE
+    if _KIND_TABLE is None:
+        numbers = {}
+        table = np.empty(0x10000, dtype=np.uint8)
+        for opcode in range(0x10000):
+            name = decode(opcode).__name__
+            if name not in numbers:
+                numbers[name] = len(_KIND_NAMES)
+                _KIND_NAMES.append(name)
+            table[opcode] = numbers[name]
+        _KIND_TABLE = table
+    return _KIND_TABLE
+
+
+class BatchChip8:
+    def __init__(self, count, cycles_per_frame=CYCLES_PER_FRAME, seeds=None, quirks="default"):
+        self.count = count
+        self.cycles_per_frame = cycles_per_frame
+        self.quirks = quirk_profile(quirks)
+        self.memory = np.zeros((count, MEMORY_SIZE), dtype=np.uint8)
+        self.memory[:, :len(fontset)] = fontset
+        self.memory[:, HIRES_FONT_START:HIRES_FONT_START + len(hires_fontset)] = hires_fontset
+        self.V = np.zeros((count, 16), dtype=np.uint8)
+        self.I = np.zeros(count, dtype=np.int64)
+        self.pc = np.full(count, PROGRAM_START, dtype=np.int64)
+        self.stack = np.zeros((count, 16), dtype=np.int64)
+        self.sp = np.zeros(count, dtype=np.int64)
+        self.delay_timer = np.zeros(count, dtype=np.uint8)
+        self.sound_timer = np.zeros(count, dtype=np.uint8)
+        self.gfx = np.zeros((count, SCREEN_HEIGHT, SCREEN_WIDTH), dtype=np.uint8)
+        self.draw_flag = np.ones(count, dtype=bool)
+        self.keys = np.zeros((count, 16), dtype=np.uint8)
+        if seeds is None:
+            seeds = np.random.randint(1, 1 << 32, size=count, dtype=np.uint64)
+        self.rng_state = np.asarray(seeds, dtype=np.uint32).copy()
+        self.rng_state[self.rng_state == 0] = 1
+        self.crashed = np.zeros(count, dtype=bool)
+
+        self._kinds = _kind_table()
+        self._handlers = [getattr(self, "_op_" + name) for name in _KIND_NAMES]
+        self._rows = np.arange(count)
+
+    def load_rom(self, filename):
+        """Load the same ROM into every instance."""
+        with open(filename, "rb") as f:
+            rom = np.frombuffer(f.read(), dtype=np.uint8)
+        if len(rom) > MEMORY_SIZE - PROGRAM_START:
+            raise ValueError(f"{filename} is {len(rom)} bytes; at most {MEMORY_SIZE - PROGRAM_START} fit in memory")
+        self.memory[:, PROGRAM_START:PROGRAM_START + len(rom)] = rom
+
+    def load_rom_bytes(self, data):
+        """Load the same ROM image, any bytes-like object, into every instance."""
+        rom = np.frombuffer(data, dtype=np.uint8)
+        if len(rom) > MEMORY_SIZE - PROGRAM_START:
+            raise ValueError(f"ROM is {len(rom)} bytes; at most {MEMORY_SIZE - PROGRAM_START} fit in memory")
+        self.memory[:, PROGRAM_START:PROGRAM_START + len(rom)] = rom
+
+    def load_state(self, index, data):
+        """Set instance ``index`` to a snapshot from ``Chip8.save_state``.
+
+        Snapshots don't record quirks: the machine that took it must have
+        had the batch's, or the instance will diverge from it.
+        """
+        if len(data) != STATE_SIZE:
+            raise ValueError(f"save state is {len(data)} bytes, expected {STATE_SIZE}")
+        fields = _STATE.unpack(data)
+        magic, version, memory, V, I, pc, sp = fields[:7]
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            raise ValueError(f"not a version {STATE_VERSION} Chip8 save state")
+        hires, framebuffer, keys, rng_state, _ = fields[25:]
+        if hires:
+            raise ValueError("BatchChip8 can't run SUPER-CHIP hi-res states")
+        self.memory[index] = np.frombuffer(memory, dtype=np.uint8)
+        self.V[index] = np.frombuffer(V, dtype=np.uint8)
+        self.I[index] = I
+        self.pc[index] = pc
+        self.sp[index] = sp
+        self.stack[index] = fields[7:23]
+        self.delay_timer[index], self.sound_timer[index] = fields[23:25]
+        rows = np.frombuffer(framebuffer, dtype=np.uint8, count=_FRAMEBUFFER.size)
+        self.gfx[index] = np.unpackbits(rows).reshape(SCREEN_HEIGHT, SCREEN_WIDTH)
+        self.keys[index] = np.frombuffer(keys, dtype=np.uint8)
+        self.rng_state[index] = rng_state
+        self.draw_flag[index] = True
+        self.crashed[index] = False
+
+    def save_state(self, index):
+        """Return instance ``index`` as a ``Chip8.save_state`` snapshot."""
+        return _STATE.pack(
+            STATE_MAGIC,
+            STATE_VERSION,
+            self.memory[index].tobytes(),
+            self.V[index].tobytes(),
+            int(self.I[index]),
+            int(self.pc[index]),
+            int(self.sp[index]),
+            *(int(address) for address in self.stack[index]),
+            int(self.delay_timer[index]),
+            int(self.sound_timer[index]),
+            False,
+            self.framebuffer_bytes(index),
+            self.keys[index].tobytes(),
+            int(self.rng_state[index]),
+            bytes(16),
+        )
+
+    def framebuffer_bytes(self, index):
+        """Return instance ``index``'s framebuffer like ``Chip8.framebuffer_bytes``."""
+        return np.packbits(self.gfx[index], axis=1).tobytes()
+
+    def step(self):
+        """Execute one instruction on every instance that has not crashed."""
+        active = self._rows[~self.crashed]
+        pc = self.pc[active]
+        fetchable = pc + 1 < MEMORY_SIZE
+        if not fetchable.all():
+            self.crashed[active[~fetchable]] = True
+            active = active[fetchable]
+            pc = pc[fetchable]
+        if len(active) == 0:
+            return
+        memory = self.memory
+        opcodes = (memory[active, pc].astype(np.int64) << 8) | memory[active, pc + 1]
+        kinds = self._kinds[opcodes]
+
+        order = np.argsort(kinds, kind="stable")
+        kinds = kinds[order]
+        starts = np.flatnonzero(np.r_[True, kinds[1:] != kinds[:-1]])
+        ends = np.append(starts[1:], len(kinds))
+        for start, end in zip(starts, ends):
+            group = order[start:end]
+            self._handlers[kinds[start]](active[group], opcodes[group])
+
+    def run_cycles(self, count):
+        """Execute ``count`` instructions on every instance."""
+        for _ in range(count):
+            self.step()
+
+    def run_frame(self):
+        """Advance every instance by one 60 Hz frame, like ``Chip8.run_frame``."""
+        self.run_cycles(self.cycles_per_frame)
+        self.update_timers()
+
+    def update_timers(self):
+        for timer in (self.delay_timer, self.sound_timer):
+            np.subtract(timer, 1, out=timer, where=timer > 0)
+
+    def _crash(self, idx, failed):
+        """Mark the instances in ``idx`` where ``failed`` is set as crashed.
+
+        Returns the mask of the instances that are still fine.
+        """
+        self.crashed[idx[failed]] = True
+        return ~failed
+
+    # Instruction handlers, named after the ``Chip8`` handler they mirror.
+    # Each receives the indices of the instances executing the instruction
+    # and the opcodes they execute.
+
+    def _op_cls(self, idx, op):  # 00E0
+        self.gfx[idx] = 0
+        self.draw_flag[idx] = True
+        self.pc[idx] += 2
+
+    def _op_ret(self, idx, op):  # 00EE
+        # Like a Python list, the stack accepts indices down to -16.
+        sp = self.sp[idx] - 1
+        ok = self._crash(idx, sp < -16)
+        idx, sp = idx[ok], sp[ok]
+        self.sp[idx] = sp
+        self.pc[idx] = self.stack[idx, sp % 16] + 2
+
+    def _op_jp(self, idx, op):  # 1NNN
+        self.pc[idx] = op & 0x0FFF
+
+    def _op_call(self, idx, op):  # 2NNN
+        sp = self.sp[idx]
+        ok = self._crash(idx, (sp < -16) | (sp > 15))
+        idx, sp, op = idx[ok], sp[ok], op[ok]
+        self.stack[idx, sp % 16] = self.pc[idx]
+        self.sp[idx] = sp + 1
+        self.pc[idx] = op & 0x0FFF
+
+    def _skip_if(self, idx, condition):
+        self.pc[idx] += np.where(condition, 4, 2)
+
+    def _op_se_byte(self, idx, op):  # 3XKK
+        self._skip_if(idx, self.V[idx, (op >> 8) & 0xF] == (op & 0xFF))
+
+    def _op_sne_byte(self, idx, op):  # 4XKK
+        self._skip_if(idx, self.V[idx, (op >> 8) & 0xF] != (op & 0xFF))
+
+    def _op_se_reg(self, idx, op):  # 5XY0
+        self._skip_if(idx, self.V[idx, (op >> 8) & 0xF] == self.V[idx, (op >> 4) & 0xF])
+
+    def _op_sne_reg(self, idx, op):  # 9XY0
+        self._skip_if(idx, self.V[idx, (op >> 8) & 0xF] != self.V[idx, (op >> 4) & 0xF])
+
+    def _op_ld_byte(self, idx, op):  # 6XKK
+        self.V[idx, (op >> 8) & 0xF] = op & 0xFF
+        self.pc[idx] += 2
+
+    def _op_add_byte(self, idx, op):  # 7XKK
+        x = (op >> 8) & 0xF
+        self.V[idx, x] = (self.V[idx, x] + (op & 0xFF)) & 0xFF
+        self.pc[idx] += 2
+
+    def _op_ld_reg(self, idx, op):  # 8XY0
+        self.V[idx, (op >> 8) & 0xF] = self.V[idx, (op >> 4) & 0xF]
+        self.pc[idx] += 2
+
+    def _op_or_(self, idx, op):  # 8XY1
+        x = (op >> 8) & 0xF
+        self.V[idx, x] |= self.V[idx, (op >> 4) & 0xF]
+        if self.quirks.logic_vf:
+            self.V[idx, 0xF] = 0
+        self.pc[idx] += 2
+
+    def _op_and_(self, idx, op):  # 8XY2
+        x = (op >> 8) & 0xF
+        self.V[idx, x] &= self.V[idx, (op >> 4) & 0xF]
+        if self.quirks.logic_vf:
+            self.V[idx, 0xF] = 0
+        self.pc[idx] += 2
+
+    def _op_xor(self, idx, op):  # 8XY3
+        x = (op >> 8) & 0xF
+        self.V[idx, x] ^= self.V[idx, (op >> 4) & 0xF]
+        if self.quirks.logic_vf:
+            self.V[idx, 0xF] = 0
+        self.pc[idx] += 2
+
+    # The flag-setting ALU ops write VF before Vx and re-read their operands
+    # in between, exactly like the interpreter, so X or Y being F behaves
+    # the same.
+
+    def _op_add_reg(self, idx, op):  # 8XY4
+        V = self.V
+        x, y = (op >> 8) & 0xF, (op >> 4) & 0xF
+        result = V[idx, x].astype(np.int64) + V[idx, y]
+        V[idx, 0xF] = result > 0xFF
+        V[idx, x] = result & 0xFF
+        self.pc[idx] += 2
+
+    def _op_sub(self, idx, op):  # 8XY5
+        V = self.V
+        x, y = (op >> 8) & 0xF, (op >> 4) & 0xF
+        V[idx, 0xF] = V[idx, x] > V[idx, y]
+        V[idx, x] = (V[idx, x].astype(np.int64) - V[idx, y]) & 0xFF
+        self.pc[idx] += 2
+
+    def _op_shr(self, idx, op):  # 8XY6
+        V = self.V
+        x = (op >> 8) & 0xF
+        if self.quirks.shift_vy:
+            value = V[idx, (op >> 4) & 0xF]
+            V[idx, x] = value >> 1
+            V[idx, 0xF] = value & 0x1
+        else:
+            V[idx, 0xF] = V[idx, x] & 0x1
+            V[idx, x] = V[idx, x] >> 1
+        self.pc[idx] += 2
+
+    def _op_subn(self, idx, op):  # 8XY7
+        V = self.V
+        x, y = (op >> 8) & 0xF, (op >> 4) & 0xF
+        V[idx, 0xF] = V[idx, y] > V[idx, x]
+        V[idx, x] = (V[idx, y].astype(np.int64) - V[idx, x]) & 0xFF
+        self.pc[idx] += 2
+
+    def _op_shl(self, idx, op):  # 8XYE
+        V = self.V
+        x = (op >> 8) & 0xF
+        if self.quirks.shift_vy:
+            value = V[idx, (op >> 4) & 0xF]
+            V[idx, x] = (value.astype(np.int64) << 1) & 0xFF
+            V[idx, 0xF] = value >> 7
+        else:
+            V[idx, 0xF] = (V[idx, x] & 0x80) >> 7
+            V[idx, x] = (V[idx, x].astype(np.int64) << 1) & 0xFF
+        self.pc[idx] += 2
+
+    def _op_ld_i(self, idx, op):  # ANNN
+        self.I[idx] = op & 0x0FFF
+        self.pc[idx] += 2
+
+    def _op_jp_v0(self, idx, op):  # BNNN (BXNN with jump_vx)
+        register = (op >> 8) & 0xF if self.quirks.jump_vx else 0
+        self.pc[idx] = (op & 0x0FFF) + self.V[idx, register]
+
+    def _op_rnd(self, idx, op):  # CXKK
+        # Same xorshift32 as Chip8.random_byte, on uint32 so shifts wrap.
+        state = self.rng_state[idx]
+        state ^= state << np.uint32(13)
+        state ^= state >> np.uint32(17)
+        state ^= state << np.uint32(5)
+        self.rng_state[idx] = state
+        self.V[idx, (op >> 8) & 0xF] = (state >> np.uint32(24)) & (op & 0xFF)
+        self.pc[idx] += 2
+
+    def _op_drw(self, idx, op):  # DXYN
+        V = self.V
+        wrap = self.quirks.wrap_sprites
+        vx = V[idx, (op >> 8) & 0xF].astype(np.int64)
+        vy = V[idx, (op >> 4) & 0xF].astype(np.int64)
+        if wrap or self.quirks.wrap_start:
+            vx %= SCREEN_WIDTH
+            vy %= SCREEN_HEIGHT
+        height = op & 0xF
+        if self.quirks.lores_large:
+            height = np.where(height == 0, 16, height)  # DXY0 is 8x16 in lo-res mode
+        rows = np.arange(height.max())
+        cols = np.arange(8)
+
+        # Sprite rows that land on screen; unless sprites wrap, rows past
+        # the bottom are clipped and, as in the interpreter, never read
+        # from memory.
+        row_ok = rows < height[:, None]
+        if not wrap:
+            row_ok &= vy[:, None] + rows < SCREEN_HEIGHT
+        addresses = self.I[idx][:, None] + rows
+        ok = self._crash(idx, (row_ok & (addresses >= MEMORY_SIZE)).any(axis=1))
+        idx, vx, vy, row_ok, addresses = idx[ok], vx[ok], vy[ok], row_ok[ok], addresses[ok]
+
+        sprites = self.memory[idx[:, None], np.where(row_ok, addresses, 0)]
+        bits = (sprites[:, :, None] >> (7 - cols)) & 1
+        lit = (bits == 1) & row_ok[:, :, None]
+        if not wrap:
+            lit &= vx[:, None, None] + cols < SCREEN_WIDTH
+        group, row, col = np.nonzero(lit)
+        instance = idx[group]
+        y = (vy[group] + row) % SCREEN_HEIGHT
+        x = (vx[group] + col) % SCREEN_WIDTH
+
+        collision = np.zeros(len(idx), dtype=np.uint8)
+        collision[group[self.gfx[instance, y, x] == 1]] = 1
+        self.gfx[instance, y, x] ^= 1
+        V[idx, 0xF] = collision
+        self.draw_flag[idx] = True
+        self.pc[idx] += 2
+
+    def _key_pressed(self, idx, op):
+        """Return the key state Vx names, crashing on keys out of range."""
+        vx = self.V[idx, (op >> 8) & 0xF]
+        ok = self._crash(idx, vx > 0xF)
+        return idx[ok], self.keys[idx[ok], vx[ok]]
+
+    def _op_skp(self, idx, op):  # EX9E
+        idx, pressed = self._key_pressed(idx, op)
+        self._skip_if(idx, pressed == 1)
+
+    def _op_sknp(self, idx, op):  # EXA1
+        idx, pressed = self._key_pressed(idx, op)
+        self._skip_if(idx, pressed == 0)
+
+    def _op_ld_dt_read(self, idx, op):  # FX07
+        self.V[idx, (op >> 8) & 0xF] = self.delay_timer[idx]
+        self.pc[idx] += 2
+
+    def _op_ld_key(self, idx, op):  # FX0A
+        keys = self.keys[idx] == 1
+        pressed = keys.any(axis=1)
+        # The interpreter keeps the highest-numbered pressed key.
+        highest = 15 - np.argmax(keys[:, ::-1], axis=1)
+        idx, op, highest = idx[pressed], op[pressed], highest[pressed]
+        self.V[idx, (op >> 8) & 0xF] = highest
+        self.pc[idx] += 2
+
+    def _op_ld_dt(self, idx, op):  # FX15
+        self.delay_timer[idx] = self.V[idx, (op >> 8) & 0xF]
+        self.pc[idx] += 2
+
+    def _op_ld_st(self, idx, op):  # FX18
+        self.sound_timer[idx] = self.V[idx, (op >> 8) & 0xF]
+        self.pc[idx] += 2
+
+    def _op_add_i(self, idx, op):  # FX1E
+        self.I[idx] += self.V[idx, (op >> 8) & 0xF]
+        self.pc[idx] += 2
+
+    def _op_ld_font(self, idx, op):  # FX29
+        self.I[idx] = self.V[idx, (op >> 8) & 0xF].astype(np.int64) * 5
+        self.pc[idx] += 2
+
+    def _op_bcd(self, idx, op):  # FX33
+        I = self.I[idx]
+        ok = self._crash(idx, I + 3 > MEMORY_SIZE)
+        idx, op, I = idx[ok], op[ok], I[ok]
+        value = self.V[idx, (op >> 8) & 0xF]
+        self.memory[idx, I] = value // 100
+        self.memory[idx, I + 1] = value // 10 % 10
+        self.memory[idx, I + 2] = value % 10
+        self.pc[idx] += 2
+
+    def _registers_through_x(self, idx, op):
+        """Return ``idx``, ``x``, ``I`` and an (instance, register) mask of
+        V0..Vx for FX55/FX65, crashing instances whose range leaves memory."""
+        x = (op >> 8) & 0xF
+        I = self.I[idx]
+        ok = self._crash(idx, I + x + 1 > MEMORY_SIZE)
+        idx, x, I = idx[ok], x[ok], I[ok]
+        return idx, x, I, np.arange(16) <= x[:, None]
+
+    def _advance_i(self, idx, x, I):
+        """Leave I after FX55/FX65 where the ``load_store`` quirk puts it."""
+        load_store = self.quirks.load_store
+        if load_store != "keep":
+            self.I[idx] = I + x + (load_store == "x+1")
+
+    def _op_store(self, idx, op):  # FX55
+        idx, x, I, through_x = self._registers_through_x(idx, op)
+        group, register = np.nonzero(through_x)
+        self.memory[idx[group], I[group] + register] = self.V[idx[group], register]
+        self._advance_i(idx, x, I)
+        self.pc[idx] += 2
+
+    def _op_load(self, idx, op):  # FX65
+        idx, x, I, through_x = self._registers_through_x(idx, op)
+        group, register = np.nonzero(through_x)
+        self.V[idx[group], register] = self.memory[idx[group], I[group] + register]
+        self._advance_i(idx, x, I)
+        self.pc[idx] += 2
+
+    def _op_unknown(self, idx, op):
+        self.pc[idx] += 2
+
+    def _op_superchip(self, idx, op):  # 00CN, 00FB-00FF, FX30, FX75, FX85
+        self.crashed[idx] = True
+
+    _op_scroll_down = _op_scroll_right = _op_scroll_left = _op_superchip
+    _op_exit = _op_lores = _op_hires = _op_superchip
+    _op_ld_hifont = _op_save_flags = _op_load_flags = _op_superchip
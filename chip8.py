@@ -1,8 +1,47 @@
 import argparse
+import hashlib
+import os
 import random
-import pygame
+import struct
+from collections import namedtuple
 
 
+MEMORY_SIZE = 4096
+PROGRAM_START = 0x200  # Where ROMs are loaded and execution begins
+MAX_ROM_SIZE = MEMORY_SIZE - PROGRAM_START
+
+SCREEN_WIDTH = 64
+SCREEN_HEIGHT = 32
+# SUPER-CHIP high resolution mode, switched on by 00FF.
+HIRES_WIDTH = 128
+HIRES_HEIGHT = 64
+
+# ``Chip8.dirty_rows`` value with a bit set for every row.
+ALL_ROWS = (1 << SCREEN_HEIGHT) - 1
+HIRES_ALL_ROWS = (1 << HIRES_HEIGHT) - 1
+
+# One big-endian 64-bit word per framebuffer row; hi-res rows take two.
+_FRAMEBUFFER = struct.Struct(f">{SCREEN_HEIGHT}Q")
+_HIRES_FRAMEBUFFER = struct.Struct(f">{HIRES_HEIGHT * 2}Q")
+
+# Binary save state layout, see ``Chip8.save_state``.
+STATE_MAGIC = b"C8ST"
+STATE_VERSION = 2
+_STATE = struct.Struct(
+    ">4sB"  # magic, version
+    f"{MEMORY_SIZE}s"  # memory
+    "16s"  # V
+    "IH"  # I, pc
+    "b16H"  # sp, stack
+    "BB"  # delay timer, sound timer
+    "?"  # hi-res mode
+    f"{_HIRES_FRAMEBUFFER.size}s"  # framebuffer_bytes(), zero padded
+    "16s"  # keys
+    "I"  # RNG state
+    "16s"  # SUPER-CHIP flag registers
+)
+STATE_SIZE = _STATE.size
+
 fontset = [0xF0, 0x90, 0x90, 0x90, 0xF0,  # 0
            0x20, 0x60, 0x20, 0x20, 0x70,  # 1
            0xF0, 0x10, 0xF0, 0x80, 0xF0,  # 2
@@ -20,285 +59,1014 @@ fontset = [0xF0, 0x90, 0x90, 0x90, 0xF0,  # 0
            0xF0, 0x80, 0xF0, 0x80, 0xF0,  # E
            0xF0, 0x80, 0xF0, 0x80, 0x80]  # F
 
-# Define a mapping from Pygame key constants to Chip-8 keys
-KEY_MAP = {
-    pygame.K_1: 0x1,
-    pygame.K_2: 0x2,
-    pygame.K_3: 0x3,
-    pygame.K_4: 0xC,
-    pygame.K_q: 0x4,
-    pygame.K_w: 0x5,
-    pygame.K_e: 0x6,
-    pygame.K_r: 0xD,
-    pygame.K_a: 0x7,
-    pygame.K_s: 0x8,
-    pygame.K_d: 0x9,
-    pygame.K_f: 0xE,
-    pygame.K_z: 0xA,
-    pygame.K_x: 0x0,
-    pygame.K_c: 0xB,
-    pygame.K_v: 0xF,
+# SUPER-CHIP 8x10 digits for FX30, stored right after the small font.
+HIRES_FONT_START = len(fontset)
+hires_fontset = [0xFF, 0xFF, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xFF, 0xFF,  # 0
+                 0x18, 0x78, 0x78, 0x18, 0x18, 0x18, 0x18, 0x18, 0xFF, 0xFF,  # 1
+                 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF,  # 2
+                 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF,  # 3
+                 0xC3, 0xC3, 0xC3, 0xC3, 0xFF, 0xFF, 0x03, 0x03, 0x03, 0x03,  # 4
+                 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF,  # 5
+                 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF,  # 6
+                 0xFF, 0xFF, 0x03, 0x03, 0x06, 0x0C, 0x18, 0x18, 0x18, 0x18,  # 7
+                 0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF,  # 8
+                 0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF,  # 9
+                 0x7E, 0xFF, 0xC3, 0xC3, 0xC3, 0xFF, 0xFF, 0xC3, 0xC3, 0xC3,  # A
+                 0xFC, 0xFC, 0xC3, 0xC3, 0xFC, 0xFC, 0xC3, 0xC3, 0xFC, 0xFC,  # B
+                 0x3C, 0xFF, 0xC3, 0xC0, 0xC0, 0xC0, 0xC0, 0xC3, 0xFF, 0x3C,  # C
+                 0xFC, 0xFE, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xFE, 0xFC,  # D
+                 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF,  # E
+                 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC0, 0xC0, 0xC0, 0xC0]  # F
+
+class _IdleLoop(Exception):
+    """Raised by a handler, while ``Chip8.run_frame`` runs, when the machine
+    is spinning in a loop that repeats identically every ``period``
+    instructions until the next timer tick or input change."""
+
+    def __init__(self, period):
+        super().__init__(period)
+        self.period = period
+
+
+# Instructions a busy-wait loop may consist of. None of them writes memory, I,
+# the framebuffer or the timers, and their results only depend on the
+# registers, the delay timer and the keys, which don't change within a frame.
+# So once a pass through such a loop leaves V0-VF as they were, every later
+# pass does the same until the frame ends.
+_IDLE_KINDS = {"jp", "ld_dt_read", "ld_byte", "ld_reg", "se_byte", "sne_byte", "se_reg", "sne_reg", "skp", "sknp"}
+_MAX_IDLE_LOOP = 16  # Longest loop checked, in instructions
+# Spotting an idle loop costs about as much as running a dozen instructions,
+# so at lower speeds frames are simply run in full.
+_FAST_FORWARD_MIN_CYCLES = 50
+
+
+def _parse_idle_loop(start, code):
+    """Return ``{address: (kind, x, y, kk)}`` for the loop in ``code``, or
+    None if it has an instruction outside ``_IDLE_KINDS``."""
+    loop = {}
+    for i in range(0, len(code) - 1, 2):
+        opcode = (code[i] << 8) | code[i + 1]
+        kind = decode(opcode).__name__
+        if kind not in _IDLE_KINDS:
+            return None
+        loop[start + i] = (kind, (opcode & 0x0F00) >> 8, (opcode & 0x00F0) >> 4, opcode & 0x00FF)
+    return loop
+
+
+def _idle_period(chip8, start, end):
+    """Return the length in instructions of the idle loop that the jump at
+    ``end`` closes by jumping back to ``start``, or 0 if it isn't idle."""
+    key = end << 12 | start
+    cached = chip8.idle_loops.get(key)
+    if cached is None or chip8.memory[start:end + 2] != cached[0]:
+        # First time here, or the code changed under a loop found before.
+        # Loops that can't be idle are remembered by address alone: if code
+        # later changes into an idle loop it just won't be fast-forwarded.
+        code = bytes(chip8.memory_view[start:end + 2])
+        loop = _parse_idle_loop(start, code) if end - start < 2 * _MAX_IDLE_LOOP else None
+        cached = chip8.idle_loops[key] = None if loop is None else (code, loop)
+        if cached is None:
+            return 0
+    loop = cached[1]
+
+    # Run one pass on a copy of the registers; the path only moves forward
+    # until the closing jump, so it visits each instruction at most once.
+    V = chip8.V[:]
+    keys = chip8.keys
+    addr = start
+    for steps in range(1, len(loop) + 1):
+        instruction = loop.get(addr)
+        if instruction is None:
+            return 0  # Skipped out of the loop
+        kind, x, y, kk = instruction
+        if kind == "jp":
+            return steps if addr == end and V == chip8.V else 0
+        if kind == "ld_dt_read":
+            V[x] = chip8.delay_timer
+        elif kind == "ld_byte":
+            V[x] = kk
+        elif kind == "ld_reg":
+            V[x] = V[y]
+        else:
+            if kind == "se_byte":
+                skip = V[x] == kk
+            elif kind == "sne_byte":
+                skip = V[x] != kk
+            elif kind == "se_reg":
+                skip = V[x] == V[y]
+            elif kind == "sne_reg":
+                skip = V[x] != V[y]
+            elif V[x] > 0xF:
+                return 0  # Leave the out-of-range key to the real handler
+            else:
+                skip = keys[V[x]] == (1 if kind == "skp" else 0)
+            if skip:
+                addr += 2
+        addr += 2
+    return 0
+
+
+# Instruction handlers. Each factory below receives the operand fields of one
+# opcode and returns a function that executes exactly that opcode on a Chip8,
+# so the fields are extracted once at decode time instead of on every cycle.
+# Handlers are responsible for advancing ``pc``.
+
+def _op_cls():
+    def cls(chip8):  # 00E0 - CLS
+        chip8.gfx[:] = [0] * chip8.height
+        chip8.dirty_rows = chip8.all_rows
+        chip8.draw_flag = True
+        chip8.pc += 2
+    return cls
+
+
+# SUPER-CHIP screen instructions. Scrolls move whole row words: vertical
+# scrolls shift the row list, horizontal ones shift every row's bits.
+# Distances are in pixels of the current resolution.
+
+def _op_scroll_down(n):
+    def scroll_down(chip8):  # 00CN - SCD nibble
+        gfx = chip8.gfx
+        if n:
+            gfx[n:] = gfx[:-n]
+            gfx[:n] = [0] * n
+            chip8.dirty_rows = chip8.all_rows
+            chip8.draw_flag = True
+        chip8.pc += 2
+    return scroll_down
+
+
+def _op_scroll_right():
+    def scroll_right(chip8):  # 00FB - SCR
+        chip8.gfx[:] = [row >> 4 for row in chip8.gfx]
+        chip8.dirty_rows = chip8.all_rows
+        chip8.draw_flag = True
+        chip8.pc += 2
+    return scroll_right
+
+
+def _op_scroll_left():
+    def scroll_left(chip8):  # 00FC - SCL
+        mask = (1 << chip8.width) - 1
+        chip8.gfx[:] = [(row << 4) & mask for row in chip8.gfx]
+        chip8.dirty_rows = chip8.all_rows
+        chip8.draw_flag = True
+        chip8.pc += 2
+    return scroll_left
+
+
+def _op_exit():
+    def exit(chip8):  # 00FD - EXIT
+        # Halts: pc stays here, so the machine idles from now on.
+        if chip8.fast_forward:
+            raise _IdleLoop(1)
+    return exit
+
+
+def _op_lores():
+    def lores(chip8):  # 00FE - LOW
+        chip8.set_resolution(False)
+        chip8.pc += 2
+    return lores
+
+
+def _op_hires():
+    def hires(chip8):  # 00FF - HIGH
+        chip8.set_resolution(True)
+        chip8.pc += 2
+    return hires
+
+
+def _op_ret():
+    def ret(chip8):  # 00EE - RET
+        chip8.sp -= 1
+        chip8.pc = chip8.stack[chip8.sp] + 2
+    return ret
+
+
+def _op_jp(nnn):
+    def jp(chip8):  # 1NNN - JP addr
+        pc = chip8.pc
+        chip8.pc = nnn
+        # Backward jumps that can't close an idle loop are cached as None.
+        if nnn <= pc and chip8.fast_forward and chip8.idle_loops.get(pc << 12 | nnn, 0) is not None:
+            period = _idle_period(chip8, nnn, pc)
+            if period:
+                raise _IdleLoop(period)
+    return jp
+
+
+def _op_call(nnn):
+    def call(chip8):  # 2NNN - CALL addr
+        chip8.stack[chip8.sp] = chip8.pc
+        chip8.sp += 1
+        chip8.pc = nnn
+    return call
+
+
+def _op_se_byte(x, kk):
+    def se_byte(chip8):  # 3XKK - SE Vx, byte
+        if chip8.V[x] == kk:
+            chip8.pc += 4
+        else:
+            chip8.pc += 2
+    return se_byte
+
+
+def _op_sne_byte(x, kk):
+    def sne_byte(chip8):  # 4XKK - SNE Vx, byte
+        if chip8.V[x] != kk:
+            chip8.pc += 4
+        else:
+            chip8.pc += 2
+    return sne_byte
+
+
+def _op_se_reg(x, y):
+    def se_reg(chip8):  # 5XY0 - SE Vx, Vy
+        V = chip8.V
+        if V[x] == V[y]:
+            chip8.pc += 4
+        else:
+            chip8.pc += 2
+    return se_reg
+
+
+def _op_ld_byte(x, kk):
+    def ld_byte(chip8):  # 6XKK - LD Vx, byte
+        chip8.V[x] = kk
+        chip8.pc += 2
+    return ld_byte
+
+
+def _op_add_byte(x, kk):
+    def add_byte(chip8):  # 7XKK - ADD Vx, byte
+        V = chip8.V
+        V[x] = (V[x] + kk) & 0xFF  # Ensure it doesn't exceed 8 bits
+        chip8.pc += 2
+    return add_byte
+
+
+def _op_ld_reg(x, y):
+    def ld_reg(chip8):  # 8XY0 - LD Vx, Vy
+        V = chip8.V
+        V[x] = V[y]
+        chip8.pc += 2
+    return ld_reg
+
+
+def _op_or(x, y, reset_vf=False):
+    if reset_vf:
+        def or_(chip8):  # 8XY1 - OR Vx, Vy; VF = 0 (COSMAC VIP)
+            V = chip8.V
+            V[x] |= V[y]
+            V[0xF] = 0
+            chip8.pc += 2
+        return or_
+
+    def or_(chip8):  # 8XY1 - OR Vx, Vy
+        V = chip8.V
+        V[x] |= V[y]
+        chip8.pc += 2
+    return or_
+
+
+def _op_and(x, y, reset_vf=False):
+    if reset_vf:
+        def and_(chip8):  # 8XY2 - AND Vx, Vy; VF = 0 (COSMAC VIP)
+            V = chip8.V
+            V[x] &= V[y]
+            V[0xF] = 0
+            chip8.pc += 2
+        return and_
+
+    def and_(chip8):  # 8XY2 - AND Vx, Vy
+        V = chip8.V
+        V[x] &= V[y]
+        chip8.pc += 2
+    return and_
+
+
+def _op_xor(x, y, reset_vf=False):
+    if reset_vf:
+        def xor(chip8):  # 8XY3 - XOR Vx, Vy; VF = 0 (COSMAC VIP)
+            V = chip8.V
+            V[x] ^= V[y]
+            V[0xF] = 0
+            chip8.pc += 2
+        return xor
+
+    def xor(chip8):  # 8XY3 - XOR Vx, Vy
+        V = chip8.V
+        V[x] ^= V[y]
+        chip8.pc += 2
+    return xor
+
+
+def _op_add_reg(x, y):
+    def add_reg(chip8):  # 8XY4 - ADD Vx, Vy with carry
+        V = chip8.V
+        result = V[x] + V[y]
+        V[0xF] = 1 if result > 0xFF else 0  # Set VF to 1 if there's a carry
+        V[x] = result & 0xFF
+        chip8.pc += 2
+    return add_reg
+
+
+def _op_sub(x, y):
+    def sub(chip8):  # 8XY5 - SUB Vx, Vy
+        V = chip8.V
+        V[0xF] = 1 if V[x] > V[y] else 0
+        V[x] = (V[x] - V[y]) & 0xFF
+        chip8.pc += 2
+    return sub
+
+
+def _op_shr(x, y, shift_vy=False):
+    if shift_vy:
+        def shr(chip8):  # 8XY6 - SHR Vx, Vy: Vx = Vy >> 1 (COSMAC VIP)
+            V = chip8.V
+            value = V[y]
+            V[x] = value >> 1
+            V[0xF] = value & 0x1
+            chip8.pc += 2
+        return shr
+
+    def shr(chip8):  # 8XY6 - SHR Vx {, Vy}
+        V = chip8.V
+        V[0xF] = V[x] & 0x1
+        V[x] >>= 1
+        chip8.pc += 2
+    return shr
+
+
+def _op_subn(x, y):
+    def subn(chip8):  # 8XY7 - SUBN Vx, Vy
+        V = chip8.V
+        V[0xF] = 1 if V[y] > V[x] else 0
+        V[x] = (V[y] - V[x]) & 0xFF
+        chip8.pc += 2
+    return subn
+
+
+def _op_shl(x, y, shift_vy=False):
+    if shift_vy:
+        def shl(chip8):  # 8XYE - SHL Vx, Vy: Vx = Vy << 1 (COSMAC VIP)
+            V = chip8.V
+            value = V[y]
+            V[x] = (value << 1) & 0xFF
+            V[0xF] = value >> 7
+            chip8.pc += 2
+        return shl
+
+    def shl(chip8):  # 8XYE - SHL Vx {, Vy}
+        V = chip8.V
+        V[0xF] = (V[x] & 0x80) >> 7
+        V[x] = (V[x] << 1) & 0xFF
+        chip8.pc += 2
+    return shl
+
+
+def _op_sne_reg(x, y):
+    def sne_reg(chip8):  # 9XY0 - SNE Vx, Vy
+        V = chip8.V
+        if V[x] != V[y]:
+            chip8.pc += 4
+        else:
+            chip8.pc += 2
+    return sne_reg
+
+
+def _op_ld_i(nnn):
+    def ld_i(chip8):  # ANNN - LD I, addr
+        chip8.I = nnn
+        chip8.pc += 2
+    return ld_i
+
+
+def _op_jp_v0(nnn, register=0):
+    # CHIP-48 and SUPER-CHIP read BXNN as JP XNN + VX: ``register`` is X.
+    def jp_v0(chip8):  # BNNN - JP V0, addr
+        chip8.pc = nnn + chip8.V[register]
+    return jp_v0
+
+
+def _op_rnd(x, kk):
+    def rnd(chip8):  # CXKK - RND Vx, byte
+        chip8.V[x] = chip8.random_byte() & kk
+        chip8.pc += 2
+    return rnd
+
+
+def _op_drw(x, y, height, wrap=False, wrap_start=False, lores_large=False):
+    if wrap:
+        return _op_drw_wrapping(x, y, height, lores_large)
+    if height == 0:
+        return _op_drw_large(x, y, wrap_start, lores_large)
+    # ANDing Vx and Vy with the screen size minus one (a power of two) and
+    # ``keep`` wraps the start coordinate only when ``keep`` is 0.
+    keep = 0 if wrap_start else 0xFF
+
+    def drw(chip8):  # DXYN - DRW Vx, Vy, nibble
+        V = chip8.V
+        memory = chip8.memory
+        gfx = chip8.gfx
+        I = chip8.I
+        vx = V[x] & (chip8.width - 1 | keep)
+        vy = V[y] & (chip8.height - 1 | keep)
+        # Lines the sprite byte up with columns vx..vx+7 of a row word; any
+        # columns past the right edge are shifted out and so clipped.
+        shift = chip8.width - 8 - vx
+        collision = 0
+        rows = min(height, chip8.height - vy)
+        for row in range(rows):
+            sprite = memory[I + row]
+            bits = sprite << shift if shift >= 0 else sprite >> -shift
+            line = gfx[vy + row]
+            if line & bits:
+                collision = 1
+            gfx[vy + row] = line ^ bits
+        V[0xF] = collision
+        if rows > 0:
+            chip8.dirty_rows |= ((1 << rows) - 1) << vy
+        chip8.draw_flag = True
+        chip8.pc += 2
+    return drw
+
+
+def _op_drw_large(x, y, wrap_start=False, lores_large=False):
+    keep = 0 if wrap_start else 0xFF  # As in _op_drw
+    # SUPER-CHIP draws DXY0 in lo-res mode as an 8x16 sprite, a DXYN 16 tall.
+    lores = _op_drw(x, y, 16, wrap_start=wrap_start) if lores_large else None
+
+    def drw(chip8):  # DXY0 - DRW Vx, Vy, 0
+        # In hi-res mode, a 16x16 sprite of 2 bytes per row, each row drawn
+        # with one XOR like DXYN. In lo-res mode it draws nothing, or the
+        # 8x16 sprite with lores_large.
+        if lores is not None and not chip8.hires:
+            return lores(chip8)
+        V = chip8.V
+        vy = V[y] & (chip8.height - 1 | keep)
+        rows = min(16, chip8.height - vy) if chip8.hires else 0
+        collision = 0
+        if rows > 0:
+            memory = chip8.memory
+            gfx = chip8.gfx
+            I = chip8.I
+            shift = chip8.width - 16 - (V[x] & (chip8.width - 1 | keep))
+            for row in range(rows):
+                sprite = (memory[I + 2 * row] << 8) | memory[I + 2 * row + 1]
+                bits = sprite << shift if shift >= 0 else sprite >> -shift
+                line = gfx[vy + row]
+                if line & bits:
+                    collision = 1
+                gfx[vy + row] = line ^ bits
+            chip8.dirty_rows |= ((1 << rows) - 1) << vy
+        V[0xF] = collision
+        chip8.draw_flag = True
+        chip8.pc += 2
+    return drw
+
+
+def _op_drw_wrapping(x, y, height, lores_large=False):
+
+    def drw(chip8):  # DXYN / DXY0 - DRW Vx, Vy, nibble, wrapping around the edges
+        # The sprite starts at (Vx, Vy) modulo the screen size, and pixels
+        # past an edge reappear at the opposite one: each row is placed in
+        # a double-width word whose halves are then folded together.
+        V = chip8.V
+        # DXY0 is 16x16 in hi-res mode and 8x16 or nothing in lo-res mode.
+        large = height == 0 and chip8.hires
+        rows = height or (16 if large or lores_large else 0)
+        collision = 0
+        if rows:
+            memory = chip8.memory
+            gfx = chip8.gfx
+            I = chip8.I
+            width = chip8.width
+            screen_height = chip8.height
+            mask = (1 << width) - 1
+            vy = V[y] % screen_height
+            shift = 2 * width - (16 if large else 8) - V[x] % width
+            dirty = 0
+            for row in range(rows):
+                if large:
+                    sprite = (memory[I + 2 * row] << 8) | memory[I + 2 * row + 1]
+                else:
+                    sprite = memory[I + row]
+                placed = sprite << shift
+                bits = (placed | placed >> width) & mask
+                line_y = (vy + row) % screen_height
+                line = gfx[line_y]
+                if line & bits:
+                    collision = 1
+                gfx[line_y] = line ^ bits
+                dirty |= 1 << line_y
+            chip8.dirty_rows |= dirty
+        V[0xF] = collision
+        chip8.draw_flag = True
+        chip8.pc += 2
+    return drw
+
+
+def _op_skp(x):
+    def skp(chip8):  # EX9E - SKP Vx
+        if chip8.keys[chip8.V[x]] == 1:
+            chip8.pc += 4
+        else:
+            chip8.pc += 2
+    return skp
+
+
+def _op_sknp(x):
+    def sknp(chip8):  # EXA1 - SKNP Vx
+        if chip8.keys[chip8.V[x]] == 0:
+            chip8.pc += 4
+        else:
+            chip8.pc += 2
+    return sknp
+
+
+def _op_ld_dt_read(x):
+    def ld_dt_read(chip8):  # FX07 - LD Vx, DT
+        chip8.V[x] = chip8.delay_timer
+        chip8.pc += 2
+    return ld_dt_read
+
+
+def _op_ld_key(x):
+    def ld_key(chip8):  # FX0A - LD Vx, K
+        key_pressed = False
+        for i, pressed in enumerate(chip8.keys):
+            if pressed == 1:
+                chip8.V[x] = i
+                key_pressed = True
+        if key_pressed:
+            chip8.waiting_for_key = False
+            chip8.pc += 2
+        else:
+            # Blocked: pc stays here until a key is down.
+            chip8.waiting_for_key = True
+            if chip8.fast_forward:
+                raise _IdleLoop(1)
+    return ld_key
+
+
+def _op_ld_dt(x):
+    def ld_dt(chip8):  # FX15 - LD DT, Vx
+        chip8.delay_timer = chip8.V[x]
+        chip8.pc += 2
+    return ld_dt
+
+
+def _op_ld_st(x):
+    def ld_st(chip8):  # FX18 - LD ST, Vx
+        chip8.sound_timer = chip8.V[x]
+        chip8.pc += 2
+    return ld_st
+
+
+def _op_add_i(x):
+    def add_i(chip8):  # FX1E - ADD I, Vx
+        chip8.I += chip8.V[x]
+        chip8.pc += 2
+    return add_i
+
+
+def _op_ld_font(x):
+    def ld_font(chip8):  # FX29 - LD F, Vx
+        chip8.I = chip8.V[x] * 5
+        chip8.pc += 2
+    return ld_font
+
+
+def _op_ld_hifont(x):
+    def ld_hifont(chip8):  # FX30 - LD HF, Vx
+        chip8.I = HIRES_FONT_START + chip8.V[x] * 10
+        chip8.pc += 2
+    return ld_hifont
+
+
+def _op_bcd(x):
+    def bcd(chip8):  # FX33 - LD B, Vx
+        I = chip8.I
+        if I + 3 > MEMORY_SIZE:
+            raise IndexError(f"FX33 writes past the end of memory (I = {I:#05x})")
+        value = chip8.V[x]
+        chip8.memory[I:I + 3] = bytes((value // 100, value // 10 % 10, value % 10))
+        chip8.pc += 2
+    return bcd
+
+
+def _op_store(x, advance=0):
+    # ``advance`` is added to I afterwards: x + 1 on the COSMAC VIP, x on
+    # the CHIP-48, while SUPER-CHIP leaves I alone.
+    if advance:
+        def store(chip8):  # FX55 - LD [I], Vx; I += advance
+            I = chip8.I
+            if I + x + 1 > MEMORY_SIZE:
+                raise IndexError(f"FX55 writes past the end of memory (I = {I:#05x})")
+            chip8.memory[I:I + x + 1] = bytes(chip8.V[:x + 1])
+            chip8.I = I + advance
+            chip8.pc += 2
+        return store
+
+    def store(chip8):  # FX55 - LD [I], Vx
+        I = chip8.I
+        if I + x + 1 > MEMORY_SIZE:
+            raise IndexError(f"FX55 writes past the end of memory (I = {I:#05x})")
+        chip8.memory[I:I + x + 1] = bytes(chip8.V[:x + 1])
+        chip8.pc += 2
+    return store
+
+
+def _op_load(x, advance=0):
+    # See _op_store for ``advance``.
+    if advance:
+        def load(chip8):  # FX65 - LD Vx, [I]; I += advance
+            I = chip8.I
+            if I + x + 1 > MEMORY_SIZE:
+                raise IndexError(f"FX65 reads past the end of memory (I = {I:#05x})")
+            chip8.V[:x + 1] = chip8.memory[I:I + x + 1]
+            chip8.I = I + advance
+            chip8.pc += 2
+        return load
+
+    def load(chip8):  # FX65 - LD Vx, [I]
+        I = chip8.I
+        if I + x + 1 > MEMORY_SIZE:
+            raise IndexError(f"FX65 reads past the end of memory (I = {I:#05x})")
+        chip8.V[:x + 1] = chip8.memory[I:I + x + 1]
+        chip8.pc += 2
+    return load
+
+
+def _op_save_flags(x):
+    def save_flags(chip8):  # FX75 - LD R, Vx
+        chip8.flags[:x + 1] = chip8.V[:x + 1]
+        chip8.pc += 2
+    return save_flags
+
+
+def _op_load_flags(x):
+    def load_flags(chip8):  # FX85 - LD Vx, R
+        chip8.V[:x + 1] = chip8.flags[:x + 1]
+        chip8.pc += 2
+    return load_flags
+
+
+def _op_unknown(opcode):
+    def unknown(chip8):
+        print(f"Unknown opcode: {opcode:04X}")
+        chip8.pc += 2
+    return unknown
+
+
+# Factories for the opcodes whose low nibble or byte selects the instruction.
+_ALU_OPS = {
+    0x0: _op_ld_reg,
+    0x1: _op_or,
+    0x2: _op_and,
+    0x3: _op_xor,
+    0x4: _op_add_reg,
+    0x5: _op_sub,
+    0x6: _op_shr,
+    0x7: _op_subn,
+    0xE: _op_shl,
+}
+
+_KEY_OPS = {
+    0x9E: _op_skp,
+    0xA1: _op_sknp,
+}
+
+_MISC_OPS = {
+    0x07: _op_ld_dt_read,
+    0x0A: _op_ld_key,
+    0x15: _op_ld_dt,
+    0x18: _op_ld_st,
+    0x1E: _op_add_i,
+    0x29: _op_ld_font,
+    0x30: _op_ld_hifont,
+    0x33: _op_bcd,
+    0x55: _op_store,
+    0x65: _op_load,
+    0x75: _op_save_flags,
+    0x85: _op_load_flags,
+}
+
+# SUPER-CHIP 00XX instructions besides 00CN.
+_SCREEN_OPS = {
+    0xFB: _op_scroll_right,
+    0xFC: _op_scroll_left,
+    0xFD: _op_exit,
+    0xFE: _op_lores,
+    0xFF: _op_hires,
+}
+
+# Behaviours that differ between CHIP-8 interpreters:
+# shift_vy: 8XY6/8XYE shift Vy into Vx rather than shifting Vx in place.
+# load_store: what FX55/FX65 leave in I: "keep" (unchanged), "x" (I + X)
+#     or "x+1" (I + X + 1).
+# jump_vx: BNNN jumps to NNN + VX (read as BXNN) rather than NNN + V0.
+# wrap_sprites: sprites wrap around the screen edges instead of being clipped.
+# logic_vf: 8XY1/8XY2/8XY3 reset VF to 0.
+# wrap_start: clipped sprites start at (Vx, Vy) modulo the screen size
+#     rather than drawing nothing when it is off screen.
+# lores_large: DXY0 draws an 8x16 sprite in lo-res mode instead of nothing.
+# ``decode`` builds handlers for one set of choices, so none of them is
+# checked while instructions execute.
+Quirks = namedtuple("Quirks", "shift_vy load_store jump_vx wrap_sprites logic_vf wrap_start lores_large")
+
+QUIRK_PROFILES = {
+    "default": Quirks(shift_vy=False, load_store="keep", jump_vx=False,
+                      wrap_sprites=False, logic_vf=False, wrap_start=False, lores_large=False),
+    "vip": Quirks(shift_vy=True, load_store="x+1", jump_vx=False,
+                  wrap_sprites=False, logic_vf=True, wrap_start=True, lores_large=False),
+    "chip48": Quirks(shift_vy=False, load_store="x", jump_vx=True,
+                     wrap_sprites=False, logic_vf=False, wrap_start=True, lores_large=False),
+    "schip": Quirks(shift_vy=False, load_store="keep", jump_vx=True,
+                    wrap_sprites=False, logic_vf=False, wrap_start=True, lores_large=True),
 }
+DEFAULT_QUIRKS = QUIRK_PROFILES["default"]
+_LOAD_STORE_ADVANCE = {"keep": lambda x: 0, "x": lambda x: x, "x+1": lambda x: x + 1}
+
+
+def quirk_profile(quirks):
+    """Return the ``Quirks`` for a profile name, or ``quirks`` if it is one.
+
+    Raises ``ValueError`` for an unknown profile or ``load_store`` value.
+    """
+    if isinstance(quirks, str):
+        if quirks not in QUIRK_PROFILES:
+            raise ValueError(f"unknown quirk profile '{quirks}'; choose from {', '.join(QUIRK_PROFILES)}")
+        return QUIRK_PROFILES[quirks]
+    if quirks.load_store not in _LOAD_STORE_ADVANCE:
+        raise ValueError(f"load_store must be one of {', '.join(_LOAD_STORE_ADVANCE)}, not '{quirks.load_store}'")
+    return quirks
+
+
+def decode(opcode, quirks=DEFAULT_QUIRKS):
+    """Return a handler that executes ``opcode`` when called with a Chip8.
+
+    The handler behaves as the interpreter described by ``quirks`` does.
+    """
+    nibble = opcode >> 12
+    x = (opcode & 0x0F00) >> 8
+    y = (opcode & 0x00F0) >> 4
+    n = opcode & 0x000F
+    kk = opcode & 0x00FF
+    nnn = opcode & 0x0FFF
+
+    if nibble == 0x0:
+        if opcode == 0x00E0:
+            return _op_cls()
+        if opcode == 0x00EE:
+            return _op_ret()
+        if opcode & 0xFFF0 == 0x00C0:
+            return _op_scroll_down(n)
+        if x == 0 and kk in _SCREEN_OPS:
+            return _SCREEN_OPS[kk]()
+    elif nibble == 0x1:
+        return _op_jp(nnn)
+    elif nibble == 0x2:
+        return _op_call(nnn)
+    elif nibble == 0x3:
+        return _op_se_byte(x, kk)
+    elif nibble == 0x4:
+        return _op_sne_byte(x, kk)
+    elif nibble == 0x5:
+        return _op_se_reg(x, y)
+    elif nibble == 0x6:
+        return _op_ld_byte(x, kk)
+    elif nibble == 0x7:
+        return _op_add_byte(x, kk)
+    elif nibble == 0x8:
+        if n in (0x1, 0x2, 0x3):
+            return _ALU_OPS[n](x, y, reset_vf=quirks.logic_vf)
+        if n in (0x6, 0xE):
+            return _ALU_OPS[n](x, y, shift_vy=quirks.shift_vy)
+        if n in _ALU_OPS:
+            return _ALU_OPS[n](x, y)
+    elif nibble == 0x9:
+        if n == 0x0:
+            return _op_sne_reg(x, y)
+    elif nibble == 0xA:
+        return _op_ld_i(nnn)
+    elif nibble == 0xB:
+        return _op_jp_v0(nnn, x if quirks.jump_vx else 0)
+    elif nibble == 0xC:
+        return _op_rnd(x, kk)
+    elif nibble == 0xD:
+        return _op_drw(x, y, n, quirks.wrap_sprites, quirks.wrap_start, quirks.lores_large)
+    elif nibble == 0xE:
+        if kk in _KEY_OPS:
+            return _KEY_OPS[kk](x)
+    elif nibble == 0xF:
+        if kk in (0x55, 0x65):
+            return _MISC_OPS[kk](x, _LOAD_STORE_ADVANCE[quirks.load_store](x))
+        if kk in _MISC_OPS:
+            return _MISC_OPS[kk](x)
+
+    return _op_unknown(opcode)
+
+
+def _decode_on_first_use(chip8):
+    """Placeholder table entry: decode the opcode at ``pc``, cache and run it."""
+    memory = chip8.memory
+    pc = chip8.pc
+    opcode = (memory[pc] << 8) | memory[pc + 1]
+    handler = chip8.decode_table[opcode] = decode(opcode, chip8.quirks)
+    handler(chip8)
+
+
+# Opcode -> handler for all 65,536 opcodes. Entries start out as a placeholder
+# and are replaced by their decoded handler the first time they execute, so
+# startup stays cheap and only opcodes a ROM actually uses are ever built.
+DECODE_TABLE = [_decode_on_first_use] * 0x10000
+# One such table per set of quirks in use, shared by all machines using it.
+_DECODE_TABLES = {DEFAULT_QUIRKS: DECODE_TABLE}
+
+
+def decode_table(quirks=DEFAULT_QUIRKS):
+    """Return the lazily filled opcode -> handler table for ``quirks``."""
+    table = _DECODE_TABLES.get(quirks)
+    if table is None:
+        table = _DECODE_TABLES[quirks] = [_decode_on_first_use] * 0x10000
+    return table
+
+
+# Instructions executed per 60 Hz frame unless configured otherwise (600 Hz).
+CYCLES_PER_FRAME = 10
 
 
 class Chip8:
-    def __init__(self):
+    def __init__(self, cycles_per_frame=CYCLES_PER_FRAME, seed=None, quirks="default"):
+        self.cycles_per_frame = cycles_per_frame
+        # Interpreter behaviours to emulate: a ``QUIRK_PROFILES`` name or a
+        # ``Quirks``. Like cycles_per_frame it is configuration, not state.
+        self.quirks = quirk_profile(quirks)
+        self.decode_table = decode_table(self.quirks)
         self.opcode = 0
-        self.memory = [0] * 4096
+        self.memory = bytearray(MEMORY_SIZE)
+        # Zero-copy view of memory for snapshots and tools. Holding it also
+        # pins the bytearray's size, so a stray slice assignment can never
+        # grow or shrink the machine's memory.
+        self.memory_view = memoryview(self.memory)
         self.V = [0] * 16  # V registers
         self.I = 0  # Index register
-        self.pc = 0x200  # Program counter starts at 0x200
-        self.gfx = [[0 for _ in range(64)] for _ in range(32)]
+        self.pc = PROGRAM_START  # Program counter starts at 0x200
+        # Display mode; see set_resolution.
+        self.hires = False
+        self.width = SCREEN_WIDTH
+        self.height = SCREEN_HEIGHT
+        self.all_rows = ALL_ROWS
+        # One int per row, bit width - 1 being the leftmost pixel (x = 0).
+        self.gfx = [0] * SCREEN_HEIGHT
+        # Bit y is set when row y changed since the frontend last drew it.
+        self.dirty_rows = ALL_ROWS
         self.delay_timer = 0
         self.sound_timer = 0
         self.stack = [0] * 16
         self.sp = 0  # Stack pointer
         self.draw_flag = True
         self.keys = [0] * 16
-        for i in range(80):  # Load fontset
-            self.memory[i] = fontset[i]
+        # SUPER-CHIP flag registers, written by FX75 and read by FX85.
+        self.flags = [0] * 16
+        # Set while FX0A is blocked waiting for a key press.
+        self.waiting_for_key = False
+        # True if the last frame ended in a busy-wait loop or blocked FX0A.
+        self.idle = False
+        # Lets handlers report idle loops; only set while run_frame runs.
+        self.fast_forward = False
+        # Closing jump address << 12 | loop start -> (code, parsed loop), or
+        # None for loops that can't be idle; see _idle_period.
+        self.idle_loops = {}
+        # xorshift32 state behind CXKK; kept per machine so it can be saved.
+        # A given seed makes runs reproducible; xorshift can't use zero.
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.rng_state = (seed & 0xFFFFFFFF) or 1
+        self.memory[:len(fontset)] = bytes(fontset)  # Load fontset
+        self.memory[HIRES_FONT_START:HIRES_FONT_START + len(hires_fontset)] = bytes(hires_fontset)
 
     def load_rom(self, filename):
-        """Load a Chip-8 ROM into memory."""
+        """Load a Chip-8 ROM into memory at 0x200.
+
+        The file is read straight into machine memory. Raises ``ValueError``
+        if it is larger than the 3,584 bytes available to programs.
+        """
         with open(filename, "rb") as f:
-            rom_data = f.read()
-            for i, byte in enumerate(rom_data):
-                self.memory[0x200 + i] = byte
+            size = os.fstat(f.fileno()).st_size
+            if size > MAX_ROM_SIZE:
+                raise ValueError(f"{filename} is {size} bytes; at most {MAX_ROM_SIZE} fit in memory")
+            f.readinto(self.memory_view[PROGRAM_START:PROGRAM_START + size])
+        self.idle_loops.clear()
 
-    def emulate_cycle(self):
-        """Fetch, decode, and execute one opcode."""
-        # Fetch
-        opcode = (self.memory[self.pc] << 8) | self.memory[self.pc + 1]
+    def load_rom_bytes(self, data):
+        """Load a ROM image, any bytes-like object, into memory at 0x200.
 
-        # Decode & Execute
-        if opcode & 0xF000 == 0x1000:  # JP addr
-            self.pc = opcode & 0x0FFF
+        Raises ``ValueError`` if it is larger than the memory available to
+        programs.
+        """
+        size = len(data)
+        if size > MAX_ROM_SIZE:
+            raise ValueError(f"ROM is {size} bytes; at most {MAX_ROM_SIZE} fit in memory")
+        self.memory_view[PROGRAM_START:PROGRAM_START + size] = data
+        self.idle_loops.clear()
 
-        # Clear the screen
-        elif opcode == 0x00E0:
-            self.screen = [[0] * 64 for _ in range(32)]
-            self.pc += 2
+    def handler(self, opcode):
+        """Return the handler that executes ``opcode`` on this machine.
 
-        elif opcode == 0x00EE:  # RET opcode
-            self.sp -= 1
-            self.pc = self.stack[self.sp]
-            self.pc += 2
+        Decodes it into the machine's table if it has not run before, so
+        tools stepping through instructions themselves see the real handler.
+        """
+        handler = self.decode_table[opcode]
+        if handler is _decode_on_first_use:
+            handler = self.decode_table[opcode] = decode(opcode, self.quirks)
+        return handler
 
+    def emulate_cycle(self):
+        """Fetch, decode, and execute one opcode."""
+        memory = self.memory
+        pc = self.pc
+        self.decode_table[(memory[pc] << 8) | memory[pc + 1]](self)
 
-        elif opcode & 0xF000 == 0x2000:  # CALL addr
-            self.stack[self.sp] = self.pc
-            self.sp += 1
-            self.pc = opcode & 0x0FFF
+    def random_byte(self):
+        """Advance the machine's xorshift32 generator and return a byte."""
+        state = self.rng_state
+        state ^= (state << 13) & 0xFFFFFFFF
+        state ^= state >> 17
+        state ^= (state << 5) & 0xFFFFFFFF
+        self.rng_state = state
+        return state >> 24
 
-        elif opcode & 0xF000 == 0x3000:  # SE Vx, byte
-            reg = (opcode & 0x0F00) >> 8
-            if self.V[reg] == (opcode & 0x00FF):
-                self.pc += 4
-            else:
-                self.pc += 2
+    def set_resolution(self, hires):
+        """Switch between 64x32 and SUPER-CHIP 128x64 mode and clear the screen.
 
-        elif opcode & 0xF000 == 0x4000:  # SNE Vx, byte
-            reg = (opcode & 0x0F00) >> 8
-            if self.V[reg] != (opcode & 0x00FF):
-                self.pc += 4
-            else:
-                self.pc += 2
+        ``gfx`` is resized in place, so references to it stay valid; each
+        row is a ``width``-bit int either way.
+        """
+        self.hires = hires
+        self.width, self.height = (HIRES_WIDTH, HIRES_HEIGHT) if hires else (SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.all_rows = HIRES_ALL_ROWS if hires else ALL_ROWS
+        self.gfx[:] = [0] * self.height
+        self.dirty_rows = self.all_rows
+        self.draw_flag = True
 
-        elif opcode & 0xF000 == 0x5000:  # SE Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            if self.V[x] == self.V[y]:
-                self.pc += 4
-            else:
-                self.pc += 2
-
-        elif opcode & 0xF000 == 0x6000:  # LD Vx, byte
-            x = (opcode & 0x0F00) >> 8
-            self.V[x] = opcode & 0x00FF
-            self.pc += 2
-
-        elif opcode & 0xF000 == 0x7000:  # ADD Vx, byte
-            x = (opcode & 0x0F00) >> 8
-            self.V[x] += opcode & 0x00FF
-            self.V[x] &= 0xFF  # Ensure it doesn't exceed 8 bits
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x8000:  # LD Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            self.V[x] = self.V[y]
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x8001:  # OR Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            self.V[x] |= self.V[y]
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x8002:  # AND Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            self.V[x] &= self.V[y]
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x8003:  # XOR Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            self.V[x] ^= self.V[y]
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x8004:  # ADD Vx, Vy with carry
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            result = self.V[x] + self.V[y]
-            self.V[0xF] = (
-                1 if result > 0xFF else 0
-            )  # Set VF to 1 if there's a carry, else 0
-            self.V[x] = result & 0xFF
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xE09E:  # SKP Vx
-            x = (opcode & 0x0F00) >> 8
-            if self.keys[self.V[x]] == 1:
-                self.pc += 4
-            else:
-                self.pc += 2
+    def save_state(self):
+        """Return the whole machine state as a compact binary snapshot.
 
-        elif opcode & 0xF0FF == 0xE0A1:  # SKNP Vx
-            x = (opcode & 0x0F00) >> 8
-            if self.keys[self.V[x]] == 0:
-                self.pc += 4
-            else:
-                self.pc += 2
-
-        elif opcode & 0xF00F == 0x8005:  # SUB Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            self.V[0xF] = 1 if self.V[x] > self.V[y] else 0
-            self.V[x] -= self.V[y]
-            self.V[x] &= 0xFF
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x8006:  # SHR Vx {, Vy}
-            x = (opcode & 0x0F00) >> 8
-            self.V[0xF] = self.V[x] & 0x1
-            self.V[x] >>= 1
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x8007:  # SUBN Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            self.V[0xF] = 1 if self.V[y] > self.V[x] else 0
-            self.V[x] = self.V[y] - self.V[x]
-            self.V[x] &= 0xFF
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x800E:  # SHL Vx {, Vy}
-            x = (opcode & 0x0F00) >> 8
-            self.V[0xF] = (self.V[x] & 0x80) >> 7
-            self.V[x] <<= 1
-            self.V[x] &= 0xFF
-            self.pc += 2
-
-        elif opcode & 0xF00F == 0x9000:  # SNE Vx, Vy
-            x = (opcode & 0x0F00) >> 8
-            y = (opcode & 0x00F0) >> 4
-            if self.V[x] != self.V[y]:
-                self.pc += 4
-            else:
-                self.pc += 2
-
-        elif opcode & 0xF000 == 0xA000:  # LD I, addr
-            self.I = opcode & 0x0FFF
-            self.pc += 2
-
-        elif opcode & 0xF000 == 0xB000:  # JP V0, addr
-            self.pc = (opcode & 0x0FFF) + self.V[0]
-
-        elif opcode & 0xF000 == 0xC000:  # RND Vx, byte
-            x = (opcode & 0x0F00) >> 8
-            byte_val = opcode & 0x00FF
-            self.V[x] = random.randint(0, 255) & byte_val
-            self.pc += 2
-
-        elif opcode & 0xF000 == 0xD000:  # DRW Vx, Vy, nibble
-            x = self.V[(opcode & 0x0F00) >> 8]
-            y = self.V[(opcode & 0x00F0) >> 4]
-            height = opcode & 0x000F
-            self.V[0xF] = 0
-            for row in range(height):
-                sprite = self.memory[self.I + row]
-                for col in range(8):
-                    if 0 <= (y + row) < 32 and 0 <= (x + col) < 64:  # Boundary check
-                        if (sprite & (0x80 >> col)) != 0:
-                            if self.gfx[y + row][x + col] == 1:
-                                self.V[0xF] = 1
-                            self.gfx[y + row][x + col] ^= 1
-            self.draw_flag = True
-            self.pc += 2
-
-
-        elif opcode & 0xF0FF == 0xF007:  # LD Vx, DT
-            x = (opcode & 0x0F00) >> 8
-            self.V[x] = self.delay_timer
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF00A:  # LD Vx, K
-            x = (opcode & 0x0F00) >> 8
-            key_pressed = False
-            for i in range(len(self.keys)):
-                if self.keys[i] == 1:
-                    self.V[x] = i
-                    key_pressed = True
-            if not key_pressed:
-                return
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF015:  # LD DT, Vx
-            x = (opcode & 0x0F00) >> 8
-            self.delay_timer = self.V[x]
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF018:  # LD ST, Vx
-            x = (opcode & 0x0F00) >> 8
-            self.sound_timer = self.V[x]
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF01E:  # ADD I, Vx
-            x = (opcode & 0x0F00) >> 8
-            self.I += self.V[x]
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF029:  # LD F, Vx
-            x = (opcode & 0x0F00) >> 8
-            self.I = self.V[x] * 5
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF033:  # LD B, Vx
-            x = (opcode & 0x0F00) >> 8
-            value = self.V[x]
-            self.memory[self.I + 2] = value % 10
-            value //= 10
-            self.memory[self.I + 1] = value % 10
-            value //= 10
-            self.memory[self.I] = value % 10
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF055:  # LD [I], Vx
-            x = (opcode & 0x0F00) >> 8
-            for i in range(x + 1):
-                self.memory[self.I + i] = self.V[i]
-            self.pc += 2
-
-        elif opcode & 0xF0FF == 0xF065:  # LD Vx, [I]
-            x = (opcode & 0x0F00) >> 8
-            for i in range(x + 1):
-                self.V[i] = self.memory[self.I + i]
-            self.pc += 2
+        The snapshot covers memory, registers, stack, timers, display mode
+        and framebuffer, keys, RNG state and flag registers;
+        ``cycles_per_frame`` is configuration and is not included. It is
+        always ``STATE_SIZE`` bytes long.
+        """
+        return _STATE.pack(
+            STATE_MAGIC,
+            STATE_VERSION,
+            self.memory,
+            bytes(self.V),
+            self.I,
+            self.pc,
+            self.sp,
+            *self.stack,
+            self.delay_timer,
+            self.sound_timer,
+            self.hires,
+            self.framebuffer_bytes(),
+            bytes(self.keys),
+            self.rng_state,
+            bytes(self.flags),
+        )
 
-        else:
-            print(f"Unknown opcode: {opcode:04X}")
-            self.pc += 2
+    def load_state(self, data):
+        """Restore a snapshot made by ``save_state``.
+
+        State is copied into the existing memory, register and framebuffer
+        objects, so views and references to them stay valid. An attached
+        ``Recompiler`` must be invalidated afterwards.
+        """
+        if len(data) != _STATE.size:
+            raise ValueError(f"save state is {len(data)} bytes, expected {STATE_SIZE}")
+        fields = _STATE.unpack(data)
+        magic, version, memory, V, self.I, self.pc, self.sp = fields[:7]
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            raise ValueError(f"not a version {STATE_VERSION} Chip8 save state")
+        self.memory[:] = memory
+        self.V[:] = V
+        self.stack[:] = fields[7:23]
+        self.delay_timer, self.sound_timer = fields[23:25]
+        hires, framebuffer, keys, self.rng_state, flags = fields[25:]
+        self.set_resolution(hires)
+        self.load_framebuffer(framebuffer[:self.height * self.width // 8])
+        self.keys[:] = keys
+        self.flags[:] = flags
+        self.idle_loops.clear()
+        # Not part of the snapshot: a blocked FX0A at pc sets it again when
+        # it next runs, so a state restored out of one isn't left blocked.
+        self.waiting_for_key = False
+        self.idle = False
 
     def update_timers(self):
         if self.delay_timer > 0:
@@ -306,53 +1074,246 @@ class Chip8:
         if self.sound_timer > 0:
             self.sound_timer -= 1
 
-    def run(self):
-        pygame.init()
-        window_size = (640, 320)
-        screen = pygame.display.set_mode(window_size)
-        pygame.display.set_caption("Chip-8 Emulator")
-        clock = pygame.time.Clock()
-
-        running = True
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
-                    key_action = 1 if event.type == pygame.KEYDOWN else 0
-                    if event.key in KEY_MAP:
-                        self.keys[KEY_MAP[event.key]] = key_action
-
-            self.emulate_cycle()
+    def run_cycles(self, count):
+        """Execute ``count`` instructions without touching the timers."""
+        # emulate_cycle, inlined with the machine's decode table held locally.
+        memory = self.memory
+        table = self.decode_table
+        for _ in range(count):
+            pc = self.pc
+            table[(memory[pc] << 8) | memory[pc + 1]](self)
+
+    def run_frame(self):
+        """Advance the machine by one 60 Hz frame.
+
+        Runs ``cycles_per_frame`` instructions and then ticks the delay and
+        sound timers once, so timers count at 60 Hz of emulated time whatever
+        the CPU speed is.
+
+        Busy-wait loops polling the delay timer or keys, and FX0A waiting for
+        a key, can't make progress before the frame ends, as timers and keys
+        only change between frames. Once the machine is in one, whole passes
+        of the loop are skipped instead of executed, leaving the machine in
+        exactly the state running them would have, and ``idle`` is set.
+        This only pays off at speeds of 50 or more instructions per frame,
+        below which frames always run in full.
+        """
+        cycles = self.cycles_per_frame
+        if cycles < _FAST_FORWARD_MIN_CYCLES:
+            self.run_cycles(cycles)
             self.update_timers()
+            return
+        memory = self.memory
+        table = self.decode_table
+        self.idle = False
+        self.fast_forward = True
+        done = 0
+        try:
+            while done < cycles:
+                try:
+                    for done in range(done, cycles):
+                        pc = self.pc
+                        table[(memory[pc] << 8) | memory[pc + 1]](self)
+                    done = cycles
+                except _IdleLoop as loop:
+                    remaining = cycles - done - 1
+                    done = cycles - remaining % loop.period
+                    self.idle = True
+        finally:
+            self.fast_forward = False
+        self.update_timers()
+
+    def press_key(self, key):
+        """Press keypad ``key``; a blocked FX0A completes on the next cycle."""
+        self.keys[key] = 1
+        self.waiting_for_key = False
+
+    def release_key(self, key):
+        """Release keypad ``key``."""
+        self.keys[key] = 0
+
+    def blocked(self):
+        """Return True if nothing can happen until a key is pressed.
 
-            if self.draw_flag:
-                self.draw_graphics(screen)
-                pygame.display.flip()
-                self.draw_flag = False
+        That is the case while FX0A waits for a key with both timers at zero.
+        """
+        return self.waiting_for_key and not self.delay_timer and not self.sound_timer
+
+    def pixel(self, x, y):
+        """Return 1 if the pixel at column ``x`` of row ``y`` is lit, else 0."""
+        return (self.gfx[y] >> (self.width - 1 - x)) & 1
+
+    def framebuffer_bytes(self):
+        """Return the framebuffer packed as ``width // 8`` bytes per row, MSB leftmost."""
+        if not self.hires:
+            return _FRAMEBUFFER.pack(*self.gfx)
+        return _HIRES_FRAMEBUFFER.pack(*(word for row in self.gfx for word in (row >> 64, row & 0xFFFFFFFFFFFFFFFF)))
+
+    def load_framebuffer(self, data):
+        """Replace the framebuffer with bytes from ``framebuffer_bytes``.
+
+        The display mode follows the size of ``data``.
+        """
+        hires = len(data) == _HIRES_FRAMEBUFFER.size
+        if hires != self.hires:
+            self.set_resolution(hires)
+        if hires:
+            words = _HIRES_FRAMEBUFFER.unpack(data)
+            self.gfx[:] = [high << 64 | low for high, low in zip(words[::2], words[1::2])]
+        else:
+            self.gfx[:] = _FRAMEBUFFER.unpack(data)
+        self.dirty_rows = self.all_rows
+        self.draw_flag = True
 
-            clock.tick(60)  # Capping the frame rate at 60fps.
+    def framebuffer_hash(self):
+        """Return a SHA-1 hex digest of the current framebuffer."""
+        return hashlib.sha1(self.framebuffer_bytes()).hexdigest()
 
-        pygame.quit()
+    def run(self, turbo=False, scale=10, palette="classic", recorder=None, mute=False, debugger=None):
+        """Run the loaded ROM in a pygame window.
 
+        With ``turbo`` the emulation is not capped at 60 frames per second.
+        Each Chip-8 pixel is drawn ``scale`` window pixels wide, in the
+        colours of the named ``palette`` (see ``frontend.PALETTES``). Input
+        is logged to ``recorder``, a ``replay.InputRecorder``, if given.
+        ``mute`` silences the beep. Frames run through ``debugger``, a
+        ``debugger.Debugger`` wrapping this machine, if given.
+        """
+        from frontend import run  # Deferred so the core runs without pygame
 
-    def draw_graphics(self, screen):
-        # If experiencing flickering, consider clearing the screen here.
-        for y in range(32):
-            for x in range(64):
-                color = (255, 255, 255) if self.gfx[y][x] == 1 else (0, 0, 0)
-                pygame.draw.rect(screen, color, pygame.Rect(x * 10, y * 10, 10, 10))
+        run(self, turbo=turbo, scale=scale, palette=palette, recorder=recorder, mute=mute, debugger=debugger)
+
+
+def run_headless(chip8, cycles=None, frames=None, runner=None):
+    """Run ``chip8`` without a window and return its framebuffer hash.
+
+    Runs ``frames`` frames if given, otherwise ``cycles`` instructions with
+    the timers ticking once every ``cycles_per_frame`` of them. ``runner``
+    is an alternative execution path with ``run_frame`` and ``run_cycles``
+    methods, such as a ``tracer.Tracer`` wrapping ``chip8``.
+    """
+    if runner is None:
+        runner = chip8
+    if frames is None:
+        frames, cycles = divmod(cycles, chip8.cycles_per_frame)
+    else:
+        cycles = 0
+    run_frame = runner.run_frame
+    for _ in range(frames):
+        if runner is chip8 and chip8.blocked():
+            break  # No keys are pressed headless, so it stays blocked
+        run_frame()
+    runner.run_cycles(cycles)
+    return chip8.framebuffer_hash()
 
 
 def main():
     parser = argparse.ArgumentParser(description='Chip8 Emulator')
-    parser.add_argument('rom', type=str, help='The ROM file to load into the emulator')
+    parser.add_argument('rom', type=str,
+                        help='The ROM file to load, or the name or SHA-1 of a ROM in the library')
+    parser.add_argument('--library', type=str, action='append',
+                        help='Directory or zip archive of ROMs to look the ROM up in (default: games_roms); repeatable')
+    parser.add_argument('--headless', action='store_true',
+                        help='Run without a window and print the final framebuffer hash')
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument('--cycles', type=int, help='Instructions to run in headless mode')
+    limit.add_argument('--frames', type=int, help='Frames to run in headless mode')
+    parser.add_argument('--speed', type=int, default=CYCLES_PER_FRAME,
+                        help='Instructions executed per 60 Hz frame')
+    parser.add_argument('--turbo', action='store_true',
+                        help='Run as fast as the host allows instead of at 60 frames per second')
+    parser.add_argument('--scale', type=int, default=10,
+                        help='Window pixels per Chip-8 pixel')
+    parser.add_argument('--palette', type=str, default='classic',
+                        help='Colour palette: classic, amber, green or lcd')
+    parser.add_argument('--mute', action='store_true',
+                        help='Do not play the beep')
+    parser.add_argument('--quirks', type=str, default='default', choices=list(QUIRK_PROFILES),
+                        help='Interpreter whose behaviour to emulate where they differ: '
+                             'vip (COSMAC VIP), chip48 or schip (SUPER-CHIP); '
+                             'a replay uses the quirks it was recorded with')
+    parser.add_argument('--seed', type=int,
+                        help='Seed for the random number generator, to make runs reproducible')
+    parser.add_argument('--record', type=str,
+                        help='Record the keys pressed in the window to this file')
+    parser.add_argument('--replay', type=str,
+                        help='Replay a recording headless at full speed and print the final framebuffer hash')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='Stream frames to TCP viewers on this local port instead of opening a window')
+    parser.add_argument('--trace', type=str,
+                        help='In headless mode, write a binary trace of every instruction to this file')
+    parser.add_argument('--debug', action='store_true',
+                        help='Run under the debugger: F10 in the window opens its REPL in the terminal; '
+                             'with --headless the REPL starts at once')
+    parser.add_argument('--break', type=lambda text: int(text, 16), action='append', dest='breakpoints',
+                        metavar='ADDR', help='Set a breakpoint at this hex address (implies --debug); repeatable')
 
     args = parser.parse_args()
+    args.debug = args.debug or bool(args.breakpoints)
+    if args.debug and (args.replay or args.record or args.serve is not None or args.trace):
+        parser.error('--debug cannot be combined with replay, record, serve or trace modes')
+    if args.headless and args.cycles is None and args.frames is None and not args.replay and not args.debug:
+        parser.error('--headless requires --cycles or --frames')
+    if args.serve is not None and (args.headless or args.replay or args.record):
+        parser.error('--serve runs on its own and cannot be combined with headless, replay or record modes')
+    if args.record and (args.headless or args.replay):
+        parser.error('--record only works in a window')
+    if args.trace and not args.headless:
+        parser.error('--trace requires --headless')
+
+    from library import DEFAULT_ROM_DIR, load_rom
+
+    quirks = args.quirks
+    if args.replay:
+        from replay import load_recording
+
+        try:
+            recording = load_recording(args.replay)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        quirks = recording.quirks  # Replays run as they were recorded
+    chip8 = Chip8(cycles_per_frame=args.speed, seed=args.seed, quirks=quirks)
+    try:
+        load_rom(chip8, args.rom, args.library or [DEFAULT_ROM_DIR])
+    except ValueError as e:
+        parser.error(str(e))
+    debugger = None
+    if args.debug:
+        from debugger import Debugger, DebuggerShell
+
+        debugger = Debugger(chip8)
+        for address in args.breakpoints or ():
+            debugger.add_breakpoint(address)
+    if args.headless and debugger is not None:
+        DebuggerShell(debugger, headless=True).cmdloop()
+        print(chip8.framebuffer_hash())
+    elif args.replay:
+        from replay import replay
+
+        hashes = replay(chip8, recording)
+        print(hashes[max(hashes)])
+    elif args.headless and args.trace:
+        from tracer import Tracer
+
+        with Tracer(chip8, path=args.trace) as tracer:
+            print(run_headless(chip8, cycles=args.cycles, frames=args.frames, runner=tracer))
+    elif args.headless:
+        print(run_headless(chip8, cycles=args.cycles, frames=args.frames))
+    elif args.serve is not None:
+        from server import FrameServer
+
+        FrameServer(chip8, port=args.serve, fps=None if args.turbo else 60).run()
+    elif args.record:
+        from replay import InputRecorder
+
+        recorder = InputRecorder(chip8)
+        try:
+            chip8.run(turbo=args.turbo, scale=args.scale, palette=args.palette, recorder=recorder, mute=args.mute)
+        finally:
+            recorder.save(args.record)
+    else:
+        chip8.run(turbo=args.turbo, scale=args.scale, palette=args.palette, mute=args.mute, debugger=debugger)
 
-    chip8 = Chip8()
-    chip8.load_rom(args.rom)
-    chip8.run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,356 @@
+"""Breakpoints, watchpoints and stepping for a Chip8, and a terminal REPL.
+
+``Debugger`` wraps a machine like ``profiler.Profiler`` does. While no
+breakpoint or watchpoint is set it hands frames straight to
+``Chip8.run_frame``, so an attached but idle debugger costs nothing; only
+while one is set do instructions go through its own checking loop.
+"""
+import cmd
+from collections import namedtuple
+
+from chip8 import decode
+
+# Why execution stopped: "breakpoint", "watchpoint", "step" or "pause".
+# ``pc`` is the address of the instruction that is next (for a breakpoint,
+# step or pause) or that triggered the stop (for a watchpoint).
+Stop = namedtuple("Stop", "reason pc message")
+
+# Handlers that write memory, with the number of bytes they write from I.
+_MEMORY_WRITES = {
+    "store": lambda opcode: ((opcode >> 8) & 0xF) + 1,  # FX55
+    "bcd": lambda opcode: 3,  # FX33
+}
+
+
+def _condition_namespace(chip8):
+    """Names a breakpoint condition can use: V (and V0-VF), I, pc, sp, DT, ST."""
+    namespace = {f"V{i:X}": value for i, value in enumerate(chip8.V)}
+    namespace.update(V=chip8.V, I=chip8.I, pc=chip8.pc, sp=chip8.sp, DT=chip8.delay_timer, ST=chip8.sound_timer)
+    return namespace
+
+
+class Debugger:
+    """Debugging execution path for a Chip8.
+
+    Breakpoints stop before the instruction at their address runs, if their
+    condition (a Python expression over ``V``, ``V0``-``VF``, ``I``, ``pc``,
+    ``sp``, ``DT`` and ``ST``) holds. Watchpoints stop after ``FX55`` or
+    ``FX33`` writes to a watched address range. ``run_frame`` returns the
+    ``Stop`` that interrupted the frame, or None; the next call finishes
+    the interrupted frame before the timers tick.
+    """
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+        self.breakpoints = {}  # address -> (condition text, compiled) or None
+        self.watchpoints = {}  # start address -> end address (exclusive)
+        self.frame_cycles = 0  # Instructions run so far in the current frame
+        self.paused = False  # Stop before the next instruction
+        self.resume_at = None  # Where execution last stopped; its breakpoint is passed once
+
+    def add_breakpoint(self, address, condition=None):
+        """Stop before the instruction at ``address`` runs, if ``condition`` holds.
+
+        Raises ``SyntaxError`` for a malformed condition.
+        """
+        compiled = None
+        if condition:
+            compiled = (condition, compile(condition, f"<breakpoint 0x{address:03X}>", "eval"))
+        self.breakpoints[address] = compiled
+
+    def remove_breakpoint(self, address):
+        self.breakpoints.pop(address, None)
+
+    def add_watchpoint(self, start, end=None):
+        """Stop after an instruction writes memory in ``[start, end)``."""
+        self.watchpoints[start] = start + 1 if end is None else end
+
+    def remove_watchpoint(self, start):
+        self.watchpoints.pop(start, None)
+
+    def pause(self):
+        """Stop before the next instruction; safe to call from another thread."""
+        self.paused = True
+
+    def checking(self):
+        """Return True if instructions must go through the checking loop."""
+        return bool(self.breakpoints or self.watchpoints or self.paused)
+
+    def run_frame(self):
+        """Run the rest of the current frame; returns a ``Stop`` or None."""
+        chip8 = self.chip8
+        remaining = chip8.cycles_per_frame - self.frame_cycles
+        if not self.checking():
+            self.resume_at = None
+            if remaining == chip8.cycles_per_frame:
+                chip8.run_frame()
+                return None
+            chip8.run_cycles(remaining)
+        else:
+            stop = self._run(remaining)
+            if stop is not None:
+                return stop
+        self.frame_cycles = 0
+        chip8.update_timers()
+        return None
+
+    def step(self):
+        """Execute one instruction, ignoring any breakpoint on it."""
+        self.resume_at = self.chip8.pc
+        stop = self._run(1, until=lambda: True)
+        if self.frame_cycles == self.chip8.cycles_per_frame:
+            self.frame_cycles = 0
+            self.chip8.update_timers()
+        return stop
+
+    def step_over(self):
+        """Execute one instruction, running a called subroutine to its return."""
+        chip8 = self.chip8
+        pc, sp = chip8.pc, chip8.sp
+        if chip8.handler((chip8.memory[pc] << 8) | chip8.memory[pc + 1]).__name__ != "call":
+            return self.step()
+        self.resume_at = pc
+        return self._run_until(lambda: chip8.sp == sp and chip8.pc == pc + 2)
+
+    def step_out(self):
+        """Run until the current subroutine returns (or one step at top level)."""
+        chip8 = self.chip8
+        sp = chip8.sp
+        if sp <= 0:
+            return self.step()
+        self.resume_at = chip8.pc
+        return self._run_until(lambda: chip8.sp < sp)
+
+    def _run_until(self, until):
+        """Run frames until ``until()`` holds after an instruction, or a stop."""
+        chip8 = self.chip8
+        while True:
+            stop = self._run(chip8.cycles_per_frame - self.frame_cycles, until)
+            if stop is not None:
+                return stop
+            self.frame_cycles = 0
+            chip8.update_timers()
+
+    def _run(self, count, until=None):
+        """Execute up to ``count`` instructions with every check on.
+
+        Returns the ``Stop`` that ended the run early, or None.
+        """
+        chip8 = self.chip8
+        memory = chip8.memory
+        breakpoints = self.breakpoints
+        watchpoints = self.watchpoints
+        handler_for = chip8.handler
+        for _ in range(count):
+            pc = chip8.pc
+            if self.paused:
+                self.paused = False
+                self.resume_at = pc
+                return Stop("pause", pc, "paused")
+            if pc in breakpoints and pc != self.resume_at:
+                condition = breakpoints[pc]
+                if condition is None or eval(condition[1], {"__builtins__": {}}, _condition_namespace(chip8)):
+                    text = f" if {condition[0]}" if condition else ""
+                    self.resume_at = pc
+                    return Stop("breakpoint", pc, f"breakpoint at 0x{pc:03X}{text}")
+            self.resume_at = None
+
+            opcode = (memory[pc] << 8) | memory[pc + 1]
+            handler = handler_for(opcode)
+            written = None
+            if watchpoints and handler.__name__ in _MEMORY_WRITES:
+                start = chip8.I
+                end = start + _MEMORY_WRITES[handler.__name__](opcode)
+                if any(start < watch_end and watch_start < end for watch_start, watch_end in watchpoints.items()):
+                    written = (start, end, bytes(memory[start:end]))
+            handler(chip8)
+            self.frame_cycles += 1
+
+            if written is not None:
+                self.resume_at = chip8.pc
+                start, end, old = written
+                new = bytes(memory[start:end])
+                return Stop(
+                    "watchpoint", pc,
+                    f"{opcode:04X} at 0x{pc:03X} wrote 0x{start:03X}-0x{end - 1:03X}: {old.hex()} -> {new.hex()}",
+                )
+            if until is not None and until():
+                self.resume_at = chip8.pc
+                return Stop("step", chip8.pc, f"at 0x{chip8.pc:03X}")
+        return None
+
+
+def _number(text):
+    """Parse a hex number as the assembler writes them: 2A0, 0x2A0, #2A0 or $2A0."""
+    return int(text.lstrip("#$"), 16)
+
+
+class DebuggerShell(cmd.Cmd):
+    """Terminal REPL for a ``Debugger``.
+
+    Numbers are hexadecimal. In ``headless`` mode ``continue`` runs frames
+    here until a stop; otherwise it leaves the REPL so the caller (the
+    window) resumes emulation. ``quit`` sets ``quit`` and leaves the REPL.
+    """
+
+    intro = "Chip-8 debugger; type help or ? for commands."
+    prompt = "(chip8) "
+
+    def __init__(self, debugger, headless=False, redraw=None, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self.debugger = debugger
+        self.chip8 = debugger.chip8
+        self.headless = headless
+        self.redraw = redraw  # Called after every command, e.g. to update a window
+        self.quit = False
+
+    def describe(self, stop):
+        """Return a report of ``stop`` (or None) and the instruction at pc."""
+        lines = [self._instruction(self.chip8.pc)]
+        if stop is not None:
+            lines.insert(0, f"stopped: {stop.message}")
+        return "\n".join(lines)
+
+    def _print(self, text):
+        self.stdout.write(text + "\n")
+
+    def _report(self, stop):
+        self._print(self.describe(stop))
+
+    def _instruction(self, address):
+        memory = self.chip8.memory
+        opcode = (memory[address] << 8) | memory[address + 1]
+        return f"0x{address:03X}: {opcode:04X}  {decode(opcode, self.chip8.quirks).__name__}"
+
+    def onecmd(self, line):
+        try:
+            return super().onecmd(line)
+        except (ValueError, IndexError, SyntaxError) as e:
+            self._print(f"error: {e}")
+        except KeyboardInterrupt:
+            self.debugger.paused = False
+            self._print("interrupted")
+            self._report(None)
+
+    def postcmd(self, stop, line):
+        if self.redraw is not None:
+            self.redraw()
+        return stop
+
+    def emptyline(self):
+        pass  # Don't repeat the last command
+
+    def do_break(self, arg):
+        """break [ADDR [if CONDITION]]: set a breakpoint, or list breakpoints and watchpoints."""
+        if not arg:
+            for address, condition in sorted(self.debugger.breakpoints.items()):
+                self._print(f"break 0x{address:03X}" + (f" if {condition[0]}" if condition else ""))
+            for start, end in sorted(self.debugger.watchpoints.items()):
+                self._print(f"watch 0x{start:03X}-0x{end - 1:03X}")
+            return
+        address, _, condition = arg.partition(" if ")
+        self.debugger.add_breakpoint(_number(address.strip()), condition.strip() or None)
+
+    do_b = do_break
+
+    def do_watch(self, arg):
+        """watch START [END]: stop when FX55 or FX33 writes START (through END)."""
+        args = arg.split()
+        start = _number(args[0])
+        self.debugger.add_watchpoint(start, _number(args[1]) + 1 if len(args) > 1 else None)
+
+    def do_delete(self, arg):
+        """delete ADDR: remove the breakpoint or watchpoint at ADDR."""
+        address = _number(arg)
+        self.debugger.remove_breakpoint(address)
+        self.debugger.remove_watchpoint(address)
+
+    def do_step(self, arg):
+        """step [N]: execute N instructions (default 1)."""
+        stop = None
+        for _ in range(_number(arg) if arg else 1):
+            stop = self.debugger.step()
+            if stop.reason != "step":
+                break
+        self._report(stop if stop.reason != "step" else None)
+
+    do_s = do_step
+
+    def do_next(self, arg):
+        """next: step over a CALL, running the subroutine to its return."""
+        stop = self.debugger.step_over()
+        self._report(stop if stop.reason != "step" else None)
+
+    do_n = do_next
+
+    def do_finish(self, arg):
+        """finish: run until the current subroutine returns."""
+        stop = self.debugger.step_out()
+        self._report(stop if stop.reason != "step" else None)
+
+    def do_continue(self, arg):
+        """continue [FRAMES]: resume; headless, run up to FRAMES frames (default: until a stop)."""
+        if not self.headless:
+            return True
+        frames = _number(arg) if arg else None
+        run = 0
+        while frames is None or run < frames:
+            if self.chip8.blocked():
+                self._print("blocked waiting for a key; use press")
+                break
+            stop = self.debugger.run_frame()
+            run += 1
+            if stop is not None:
+                self._report(stop)
+                return
+        self._report(None)
+
+    do_c = do_continue
+
+    def do_regs(self, arg):
+        """regs: show registers, timers and the stack."""
+        chip8 = self.chip8
+        self._print(" ".join(f"V{i:X}={value:02X}" for i, value in enumerate(chip8.V)))
+        self._print(f"I={chip8.I:03X} pc={chip8.pc:03X} sp={chip8.sp} DT={chip8.delay_timer} ST={chip8.sound_timer}")
+        self._print("stack: " + " ".join(f"{address:03X}" for address in chip8.stack[:chip8.sp]))
+
+    def do_mem(self, arg):
+        """mem ADDR [LENGTH]: dump memory (default 16 bytes)."""
+        args = arg.split()
+        start = _number(args[0])
+        length = _number(args[1]) if len(args) > 1 else 16
+        memory = self.chip8.memory
+        for row in range(start, min(start + length, len(memory)), 16):
+            data = memory[row:min(row + 16, start + length)]
+            self._print(f"0x{row:03X}: {data.hex(' ')}")
+
+    def do_list(self, arg):
+        """list [ADDR [COUNT]]: show COUNT instructions from ADDR (default: 8 from pc)."""
+        args = arg.split()
+        address = _number(args[0]) if args else self.chip8.pc
+        count = _number(args[1]) if len(args) > 1 else 8
+        for i in range(count):
+            if address + 2 * i + 1 >= len(self.chip8.memory):
+                break
+            marker = ">" if address + 2 * i == self.chip8.pc else " "
+            self._print(marker + " " + self._instruction(address + 2 * i))
+
+    do_l = do_list
+
+    def do_press(self, arg):
+        """press KEY: hold down keypad KEY (0-F)."""
+        self.chip8.press_key(_number(arg))
+
+    def do_release(self, arg):
+        """release KEY: let go of keypad KEY (0-F)."""
+        self.chip8.release_key(_number(arg))
+
+    def do_quit(self, arg):
+        """quit: stop the emulator."""
+        self.quit = True
+        return True
+
+    do_q = do_quit
+    do_EOF = do_quit
@@ -0,0 +1,254 @@
+"""Automatic exploration of the states a ROM can reach.
+
+Starting from a machine's state, ``explore`` runs the ROM and, wherever its
+future depends on the outside world, forks: at ``SKP``/``SKNP`` once with
+the key up and once with it down, at ``FX0A`` once per key and at ``CXKK``
+once per value the draw can produce. Keys only change between frames, as
+in the window, so a key tested twice in one frame forks only once. States are ``Chip8.save_state``
+snapshots, so copying one is a single ``struct.pack`` and restoring it a
+``load_state``; each is identified by a BLAKE2 digest, and a state seen
+before is not explored again. The search is breadth first, each layer
+spread over a pool of worker processes, and reports which addresses ran
+and every way found to crash the machine, with the inputs that lead there.
+"""
+import contextlib
+import hashlib
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from chip8 import MEMORY_SIZE, Chip8
+
+# Instructions run from a state before it is treated as a new state even
+# without a decision, so loops with no input still end up deduplicated.
+SEGMENT_CYCLES = 600
+# CXKK forks at most this many ways; masks allowing more values are sampled.
+RANDOM_BRANCHES = 16
+MAX_STATES = 10000
+
+# ``path`` is the decisions, from the starting state, that lead to the
+# instruction at ``pc``; ``state`` is the snapshot just before it runs.
+Crash = namedtuple("Crash", "message pc opcode path state")
+# ``states`` were explored; ``pending`` were found but not explored before
+# ``max_states`` ran out (0 if the search finished). ``coverage`` is the
+# set of addresses of every instruction executed.
+Exploration = namedtuple("Exploration", "states pending coverage crashes")
+
+# Handlers that read or write memory from I, with the number of bytes.
+_I_ACCESS = {
+    "drw": lambda chip8, opcode: (opcode & 0xF) or (32 if chip8.hires else 16 if chip8.quirks.lores_large else 0),
+    "bcd": lambda chip8, opcode: 3,
+    "store": lambda chip8, opcode: ((opcode >> 8) & 0xF) + 1,
+    "load": lambda chip8, opcode: ((opcode >> 8) & 0xF) + 1,
+}
+
+# Handlers whose outcome depends on the keys or the random generator.
+_DECISIONS = {"skp", "sknp", "ld_key", "rnd"}
+_ALL_KEYS = 0xFFFF
+
+_machine = None  # Each worker process restores states into one machine
+
+
+def state_digest(snapshot, phase, fixed_keys):
+    """Return the identity of a state: a snapshot ``phase`` cycles into a
+    frame in which the keys in the ``fixed_keys`` bitmask can't change."""
+    extra = phase.to_bytes(4, "big") + fixed_keys.to_bytes(2, "big")
+    return hashlib.blake2b(snapshot + extra, digest_size=16).digest()
+
+
+def _crash_check(chip8, name, opcode):
+    """Return why running handler ``name`` now would crash the machine, or None.
+
+    Covers what the core lets through silently (a RET with an empty stack
+    wraps around) as well as what it raises for, with clearer messages.
+    """
+    if name == "unknown":
+        return f"unknown opcode {opcode:04X}"
+    if name == "call" and chip8.sp >= len(chip8.stack):
+        return "stack overflow"
+    if name == "ret" and chip8.sp <= 0:
+        return "stack underflow"
+    if name in _I_ACCESS:
+        size = _I_ACCESS[name](chip8, opcode)
+        if size and chip8.I + size > MEMORY_SIZE:
+            return f"I out of range (I = {chip8.I:#05x}, {size} bytes)"
+    if name in ("skp", "sknp") and chip8.V[(opcode >> 8) & 0xF] > 0xF:
+        return f"key out of range (V{(opcode >> 8) & 0xF:X} = {chip8.V[(opcode >> 8) & 0xF]:#04x})"
+    return None
+
+
+def _random_values(kk, limit):
+    """Return the values ``CXKK`` can produce, at most ``limit`` of them, spread out."""
+    values = sorted({value & kk for value in range(256)})
+    if len(values) <= limit:
+        return values
+    return [values[i * (len(values) - 1) // (limit - 1)] for i in range(limit)] if limit > 1 else values[:1]
+
+
+def _outcomes(chip8, name, opcode, random_branches):
+    """Yield ``(decision, setup, fixed)`` for each way the instruction can go.
+
+    ``setup(chip8, handler)`` runs the instruction with that outcome, which
+    fixes the keys in the bitmask ``fixed`` until the frame ends.
+    """
+    x = (opcode >> 8) & 0xF
+    if name in ("skp", "sknp"):
+        key = chip8.V[x]
+        for pressed in (0, 1):
+            def setup(chip8, handler, key=key, pressed=pressed):
+                chip8.keys[key] = pressed
+                handler(chip8)
+            yield f"key {key:X} {'down' if pressed else 'up'}", setup, 1 << key
+    elif name == "ld_key":
+        for key in range(16):
+            def setup(chip8, handler, key=key):
+                chip8.keys[:] = [0] * 16
+                chip8.keys[key] = 1
+                handler(chip8)
+            yield f"press {key:X}", setup, _ALL_KEYS
+    else:  # rnd
+        for value in _random_values(opcode & 0xFF, random_branches):
+            def setup(chip8, handler, value=value):
+                # The generator is left alone, so it can't tell apart
+                # states the explored values have made identical.
+                chip8.V[x] = value
+                chip8.pc += 2
+            yield f"random {value:02X}", setup, 0
+
+
+def _decided(chip8, name, opcode, fixed_keys):
+    """Return True if the outcome of decision ``name`` is already fixed."""
+    if name in ("skp", "sknp"):
+        return bool(fixed_keys >> chip8.V[(opcode >> 8) & 0xF] & 1)
+    if name == "ld_key":
+        # Keys are fixed for this frame: FX0A goes on as they are.
+        return fixed_keys == _ALL_KEYS
+    return False
+
+
+def _advance(chip8, phase, fixed_keys):
+    """Count one instruction into the frame, ticking the timers and freeing
+    the keys at its end; returns the new ``(phase, fixed_keys)``."""
+    phase += 1
+    if phase == chip8.cycles_per_frame:
+        chip8.update_timers()
+        return 0, 0
+    return phase, fixed_keys
+
+
+def run_segment(task):
+    """Run one state until its next decision, a crash or ``SEGMENT_CYCLES``.
+
+    ``task`` is ``(snapshot, phase, fixed_keys, cycles_per_frame, quirks,
+    segment_cycles, random_branches)``. Returns ``(coverage, children,
+    crash)``: the addresses executed, ``(digest, decision, snapshot, phase,
+    fixed_keys)`` for each
+    state it leads to and a ``(message, pc, opcode, snapshot)`` tuple if it
+    crashed. Runs in worker processes.
+    """
+    global _machine
+    snapshot, phase, fixed_keys, cycles_per_frame, quirks, segment_cycles, random_branches = task
+    if _machine is None or _machine.quirks != quirks:
+        _machine = Chip8(seed=1, quirks=quirks)
+    chip8 = _machine
+    chip8.cycles_per_frame = cycles_per_frame
+    chip8.load_state(snapshot)
+    memory = chip8.memory
+    handler_for = chip8.handler
+    coverage = set()
+    start = (phase, fixed_keys)
+    executed = 0
+    for _ in range(segment_cycles):
+        pc = chip8.pc
+        if pc > MEMORY_SIZE - 2:
+            return coverage, [], (f"pc out of range ({pc:#05x})", pc, 0, chip8.save_state())
+        opcode = (memory[pc] << 8) | memory[pc + 1]
+        handler = handler_for(opcode)
+        name = handler.__name__
+        coverage.add(pc)
+        message = _crash_check(chip8, name, opcode)
+        if message is not None:
+            return coverage, [], (message, pc, opcode, chip8.save_state())
+        if name in _DECISIONS and not _decided(chip8, name, opcode, fixed_keys):
+            before = chip8.save_state()
+            children = []
+            for decision, setup, fixed in _outcomes(chip8, name, opcode, random_branches):
+                chip8.load_state(before)
+                setup(chip8, handler)
+                child_phase, child_keys = _advance(chip8, phase, fixed_keys | fixed)
+                child = chip8.save_state()
+                digest = state_digest(child, child_phase, child_keys)
+                children.append((digest, f"0x{pc:03X} {decision}", child, child_phase, child_keys))
+            return coverage, children, None
+        try:
+            handler(chip8)
+        except Exception as e:
+            # The handler may have half run, so rebuild the state before it
+            # by running the segment again; there were no decisions in it.
+            chip8.load_state(snapshot)
+            for _ in range(executed):
+                chip8.emulate_cycle()
+                start = _advance(chip8, *start)
+            return coverage, [], (f"{type(e).__name__}: {e}", pc, opcode, chip8.save_state())
+        executed += 1
+        phase, fixed_keys = _advance(chip8, phase, fixed_keys)
+    child = chip8.save_state()
+    return coverage, [(state_digest(child, phase, fixed_keys), None, child, phase, fixed_keys)], None
+
+
+def explore(chip8, max_states=MAX_STATES, jobs=None, segment_cycles=SEGMENT_CYCLES,
+            random_branches=RANDOM_BRANCHES, progress=None):
+    """Explore the states reachable from ``chip8``'s current state.
+
+    Explores at most ``max_states`` distinct states, over ``jobs`` worker
+    processes (default: all cores; 1 runs in this process). ``progress``,
+    if given, is called with ``(explored, pending)`` after each layer of
+    the search. ``chip8`` itself is not changed. Returns an
+    ``Exploration``; each distinct crash (message and address) is reported
+    once, with the shortest input path that leads to it.
+    """
+    root = chip8.save_state()
+    root_digest = state_digest(root, 0, 0)
+    parents = {root_digest: (None, None)}  # digest -> (parent digest, decision)
+    frontier = [(root_digest, root, 0, 0)]
+    coverage = set()
+    crashes = {}
+    explored = 0
+    settings = (chip8.cycles_per_frame, chip8.quirks, segment_cycles, random_branches)
+
+    def path(digest):
+        decisions = []
+        while digest is not None:
+            digest, decision = parents[digest]
+            if decision is not None:
+                decisions.append(decision)
+        return decisions[::-1]
+
+    with contextlib.ExitStack() as stack:
+        if jobs == 1:
+            run = map
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            workers = jobs or os.cpu_count() or 1
+
+            def run(function, tasks):
+                return pool.map(function, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+        while frontier and explored < max_states:
+            layer, frontier = frontier[:max_states - explored], frontier[max_states - explored:]
+            explored += len(layer)
+            tasks = [(snapshot, phase, fixed_keys, *settings) for _, snapshot, phase, fixed_keys in layer]
+            for (digest, *_), (covered, children, crash) in zip(layer, run(run_segment, tasks)):
+                coverage |= covered
+                if crash is not None:
+                    message, pc, opcode, state = crash
+                    if (message, pc) not in crashes:
+                        crashes[message, pc] = Crash(message, pc, opcode, path(digest), state)
+                for child_digest, decision, *child in children:
+                    if child_digest not in parents:
+                        parents[child_digest] = (digest, decision)
+                        frontier.append((child_digest, *child))
+            if progress is not None:
+                progress(explored, len(frontier))
+    return Exploration(explored, len(frontier), coverage, list(crashes.values()))
+
@@ -0,0 +1,331 @@
+"""Pygame window, keyboard and rendering for a Chip8.
+
+Kept apart from ``chip8`` so the CPU core can be imported and run without
+pygame; ``Chip8.run`` imports this module only when a window is opened.
+"""
+import asyncio
+import sys
+import time
+
+import pygame
+
+from chip8 import SCREEN_HEIGHT, SCREEN_WIDTH
+from rewind import RewindBuffer
+from sound import MIXER_BUFFER, SAMPLE_RATE, Beeper, open_backend
+
+# Define a mapping from Pygame key constants to Chip-8 keys
+KEY_MAP = {
+    pygame.K_1: 0x1,
+    pygame.K_2: 0x2,
+    pygame.K_3: 0x3,
+    pygame.K_4: 0xC,
+    pygame.K_q: 0x4,
+    pygame.K_w: 0x5,
+    pygame.K_e: 0x6,
+    pygame.K_r: 0xD,
+    pygame.K_a: 0x7,
+    pygame.K_s: 0x8,
+    pygame.K_d: 0x9,
+    pygame.K_f: 0xE,
+    pygame.K_z: 0xA,
+    pygame.K_x: 0x0,
+    pygame.K_c: 0xB,
+    pygame.K_v: 0xF,
+}
+
+# Emulator controls, outside the Chip-8 keypad.
+REWIND_KEY = pygame.K_BACKSPACE  # Hold to step back one frame at a time
+QUICKSAVE_KEY = pygame.K_F5
+QUICKLOAD_KEY = pygame.K_F9
+DEBUG_KEY = pygame.K_F10  # Break into the debugger, if there is one
+
+
+FPS = 60
+
+# Named (background, foreground) colour pairs.
+PALETTES = {
+    "classic": ((0, 0, 0), (255, 255, 255)),
+    "amber": ((40, 20, 0), (255, 176, 0)),
+    "green": ((0, 24, 0), (51, 255, 51)),
+    "lcd": ((155, 188, 15), (15, 56, 15)),
+}
+
+
+class Renderer:
+    """Draws a Chip8 framebuffer into a window surface.
+
+    The framebuffer is mirrored in a native surface of the machine's
+    resolution (64x32, or 128x64 in SUPER-CHIP hi-res mode) with the
+    window's pixel format. Only rows flagged in ``Chip8.dirty_rows`` are
+    re-uploaded to it, straight into its pixel buffer, and the window is
+    then produced with a single scaled blit.
+    """
+
+    def __init__(self, screen, palette="classic"):
+        self.screen = screen
+        self._resize(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.set_palette(palette)
+
+    def _resize(self, width, height):
+        self.native = pygame.Surface((width, height), 0, self.screen)
+        self.pitch = self.native.get_pitch()
+        self.stale = True
+
+    def set_palette(self, palette):
+        """Switch to a palette name from ``PALETTES`` or an (off, on) pair."""
+        if isinstance(palette, str):
+            palette = PALETTES[palette]
+        size = self.native.get_bytesize()
+        off, on = (self.native.map_rgb(color).to_bytes(size, sys.byteorder) for color in palette)
+        # Native pixels for each value of a framebuffer byte (8 columns).
+        self.byte_pixels = [
+            b"".join(on if byte & (0x80 >> bit) else off for bit in range(8))
+            for byte in range(256)
+        ]
+        self.stale = True  # Every row needs redrawing in the new colours
+
+    def draw(self, chip8):
+        """Upload the rows ``chip8`` changed and blit them to the window."""
+        if self.native.get_size() != (chip8.width, chip8.height):
+            self._resize(chip8.width, chip8.height)
+        dirty = chip8.dirty_rows
+        if self.stale:
+            dirty = chip8.all_rows
+            self.stale = False
+        if dirty:
+            byte_pixels = self.byte_pixels
+            pitch = self.pitch
+            row_bytes = chip8.width // 8
+            buffer = self.native.get_buffer()
+            for y, row in enumerate(chip8.gfx):
+                if dirty >> y & 1:
+                    pixels = b"".join([byte_pixels[byte] for byte in row.to_bytes(row_bytes, "big")])
+                    buffer.write(pixels, y * pitch)
+            del buffer  # Unlocks the surface for the blit below
+            chip8.dirty_rows = 0
+        pygame.transform.scale(self.native, self.screen.get_size(), self.screen)
+
+
+# Window events are polled this often; key presses reach the CPU before
+# its next frame.
+INPUT_INTERVAL = 1 / 250
+
+# Bound on key events waiting for the CPU. The input task waits when it is
+# full rather than dropping presses.
+MAX_PENDING_INPUT = 64
+
+# In turbo mode the CPU runs frames back to back for this long (seconds)
+# before yielding to the other tasks.
+TURBO_SLICE = 0.002
+
+
+class Frontend:
+    """Runs a Chip8 in a window as cooperating asyncio tasks, driven by ``run``.
+
+    ``run`` owns the ``input``, ``emulate``, ``render`` and (unless in turbo
+    mode) ``clock`` tasks, and returns once the window is closed or the
+    debugger quits, cancelling the rest.
+
+    Each frame ``emulate`` runs is recorded in a ``RewindBuffer``, which
+    holding ``REWIND_KEY`` plays back in reverse, one frame per step;
+    ``QUICKSAVE_KEY`` and ``QUICKLOAD_KEY`` keep a single state.
+
+    A ``replay.InputRecorder`` sees every emulated frame's keys just before
+    the frame runs; rewinding and quickloading are then disabled, as they
+    would make the recording impossible to replay.
+
+    The ``sound.Beeper`` is updated after every frame, and silenced while
+    emulation stands still in the debugger.
+
+    Given a ``debugger.Debugger``, frames run through it instead. When it
+    stops, or ``DEBUG_KEY`` is pressed, its REPL runs in a worker thread
+    while the window stays live; window keys are ignored until it returns.
+    """
+
+    def __init__(self, chip8, screen, turbo=False, palette="classic", recorder=None, mute=False, debugger=None):
+        if recorder is not None and debugger is not None:
+            raise ValueError("a recorded session can't be debugged, as stops split frames")
+        self.chip8 = chip8
+        self.renderer = Renderer(screen, palette)
+        self.beeper = Beeper(chip8, open_backend(mute))
+        self.turbo = turbo
+        self.recorder = recorder
+        self.debugger = debugger
+        self.history = RewindBuffer(chip8)
+        self.quicksave = None
+        self.rewinding = False
+        self.debugging = False  # The debugger REPL owns the machine
+        self.key_events = asyncio.Queue(MAX_PENDING_INPUT)  # (key, pressed)
+        self.ticks = asyncio.Queue(1)
+        self.frames = asyncio.Queue(1)  # Frames waiting to be presented
+        self.woken = asyncio.Event()  # Set whenever window events arrive
+
+    async def run(self):
+        """Run until the window is closed; re-raises any task's error."""
+        coroutines = [self.input(), self.emulate(), self.render()]
+        if not self.turbo:
+            coroutines.append(self.clock())
+        tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.beeper.close()
+        for task in done:
+            task.result()
+
+    async def input(self):
+        """Queue keypad changes and apply emulator controls; returns on quit."""
+        chip8 = self.chip8
+        while True:
+            events = pygame.event.get()
+            for event in events:
+                if event.type == pygame.QUIT:
+                    return
+                if event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
+                    key_action = 1 if event.type == pygame.KEYDOWN else 0
+                    if self.debugging:
+                        pass  # The REPL has the machine; press and release it there
+                    elif event.key in KEY_MAP:
+                        await self.key_events.put((KEY_MAP[event.key], key_action))
+                    elif self.recorder is not None:
+                        pass  # Keep the recording replayable
+                    elif event.key == REWIND_KEY:
+                        self.rewinding = bool(key_action)
+                    elif event.key == QUICKSAVE_KEY and key_action:
+                        self.quicksave = chip8.save_state()
+                    elif event.key == QUICKLOAD_KEY and key_action and self.quicksave:
+                        chip8.load_state(self.quicksave)
+                        self.history.clear()
+                    elif event.key == DEBUG_KEY and key_action and self.debugger is not None:
+                        self.debugger.pause()
+            if events:
+                self.woken.set()
+            # Nothing runs while the ROM waits for a key, so poll less often.
+            await asyncio.sleep(1 / FPS if chip8.blocked() else INPUT_INTERVAL)
+
+    async def clock(self):
+        """Tick 60 times per second; ticks the CPU hasn't taken are dropped."""
+        loop = asyncio.get_running_loop()
+        interval = 1 / FPS
+        deadline = loop.time()
+        while True:
+            if not self.ticks.full():
+                self.ticks.put_nowait(None)
+            deadline += interval
+            delay = deadline - loop.time()
+            if delay < 0:
+                deadline -= delay  # Fell behind; don't try to catch up
+            await asyncio.sleep(max(delay, 0))
+
+    def _apply_key(self, key, pressed):
+        if pressed:
+            self.chip8.press_key(key)
+        else:
+            self.chip8.release_key(key)
+
+    def _step(self):
+        """Emulate, or rewind, one frame; returns the debugger's ``Stop``, if any."""
+        stop = None
+        if self.rewinding:
+            self.history.rewind(1)
+        else:
+            if self.debugger is not None:
+                stop = self.debugger.run_frame()
+            else:
+                if self.recorder is not None:
+                    self.recorder.record_frame()
+                self.chip8.run_frame()
+            if stop is None:  # A stopped frame is recorded once it finishes
+                self.history.record()
+        self.beeper.update()
+        return stop
+
+    def _present(self):
+        if not self.frames.full():
+            self.frames.put_nowait(None)
+
+    async def _debug(self, stop):
+        """Run the debugger REPL in a worker thread; returns False on quit."""
+        from debugger import DebuggerShell
+
+        loop = asyncio.get_running_loop()
+        self.beeper.silence()  # Emulated time stands still meanwhile
+        shell = DebuggerShell(self.debugger, redraw=lambda: loop.call_soon_threadsafe(self._present))
+        self.debugging = True
+        try:
+            await loop.run_in_executor(None, shell.cmdloop, shell.describe(stop))
+        finally:
+            self.debugging = False
+        # Ticks and key events that piled up meanwhile are stale.
+        for queue in (self.ticks, self.key_events):
+            while not queue.empty():
+                queue.get_nowait()
+        return not shell.quit
+
+    async def emulate(self):
+        """Run one frame per clock tick (or back to back in turbo mode)."""
+        chip8 = self.chip8
+        key_events = self.key_events
+        while True:
+            if self.turbo:
+                await asyncio.sleep(0)
+            else:
+                await self.ticks.get()
+            if chip8.blocked() and not self.rewinding and key_events.empty():
+                # FX0A is waiting and no timer is running, so nothing
+                # changes until the next window event: sleep until one.
+                self.woken.clear()
+                await self.woken.wait()
+            while not key_events.empty():
+                self._apply_key(*key_events.get_nowait())
+
+            stop = self._step()
+            if self.turbo:
+                deadline = time.perf_counter() + TURBO_SLICE
+                while stop is None and time.perf_counter() < deadline and not chip8.blocked():
+                    stop = self._step()
+            self._present()
+            if stop is not None and not await self._debug(stop):
+                return
+
+    async def render(self):
+        """Present frames from the CPU, at most 60 times per second.
+
+        The clock already paces the CPU to that; in turbo mode the frames
+        that arrive in between are dropped.
+        """
+        chip8 = self.chip8
+        loop = asyncio.get_running_loop()
+        interval = 1 / FPS
+        while True:
+            await self.frames.get()
+            presented = loop.time()
+            if chip8.draw_flag:
+                self.renderer.draw(chip8)
+                pygame.display.flip()
+                chip8.draw_flag = False
+            if self.turbo:
+                await asyncio.sleep(presented + interval - loop.time())
+
+
+def run(chip8, turbo=False, scale=10, palette="classic", recorder=None, mute=False, debugger=None):
+    """Run ``chip8`` in a pygame window until the window is closed.
+
+    Normally emulation is held to 60 frames per second; in ``turbo`` mode
+    frames are emulated as fast as the host allows while the window is
+    still presented at most 60 times per second. See ``Frontend`` for how
+    the work is split, for the rewind and quicksave keys and for running
+    under a ``debugger``.
+    """
+    pygame.mixer.pre_init(SAMPLE_RATE, -16, 1, MIXER_BUFFER)
+    pygame.init()
+    window_size = (SCREEN_WIDTH * scale, SCREEN_HEIGHT * scale)
+    screen = pygame.display.set_mode(window_size)
+    pygame.display.set_caption("Chip-8 Emulator")
+    try:
+        asyncio.run(Frontend(chip8, screen, turbo, palette, recorder, mute, debugger).run())
+    finally:
+        pygame.quit()
@@ -0,0 +1,267 @@
+"""An index of ROMs in directories and zip archives, keyed by content hash.
+
+``RomLibrary`` scans its sources once and caches the result on disk, so
+later runs only stat each source: a directory or archive whose modification
+time hasn't changed is not read again. ROMs are found by file name or by
+SHA-1 (or a prefix of at least ``MIN_HASH_PREFIX`` hex digits) and loaded
+straight into a machine, through ``mmap`` for plain files or from the
+archive for zip members, without extracting anything.
+"""
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import zipfile
+from collections import namedtuple
+
+from chip8 import MAX_ROM_SIZE
+
+DEFAULT_ROM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games_roms")
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "chyp-8", "roms.json")
+CACHE_VERSION = 1
+MIN_HASH_PREFIX = 6
+
+_HEX = re.compile(r"[0-9a-f]+")
+
+# ``source`` is the ROM file itself, or the zip archive holding ``member``.
+# ``mtime_ns`` is the file's modification time when it was hashed (None for
+# archive members, which are checked through their archive).
+RomEntry = namedtuple("RomEntry", "name sha1 size source member mtime_ns")
+
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _hash_file(path, name):
+    """Return a ``RomEntry`` for the plain file at ``path``."""
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    return RomEntry(name, _sha1(data), len(data), path, None, stat.st_mtime_ns)
+
+
+def _scan_archive(path):
+    """Return the entries of the ROM-sized members of a zip archive."""
+    entries = []
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not 0 < info.file_size <= MAX_ROM_SIZE:
+                continue
+            data = archive.read(info)
+            entries.append(RomEntry(os.path.basename(info.filename), _sha1(data), len(data), path, info.filename, None))
+    return entries
+
+
+@contextlib.contextmanager
+def open_rom(entry, archives=None):
+    """Yield the bytes of ``entry`` as a read-only buffer.
+
+    Plain files are memory-mapped; archive members are read from the
+    archive, through ``archives`` (a dict of open ``ZipFile`` objects by
+    path, which is filled in) if given.
+    """
+    if entry.member is not None:
+        archive = archives.get(entry.source) if archives is not None else None
+        if archive is None:
+            archive = zipfile.ZipFile(entry.source)
+            if archives is not None:
+                archives[entry.source] = archive
+        try:
+            yield archive.read(entry.member)
+        finally:
+            if archives is None:
+                archive.close()
+        return
+    with open(entry.source, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def read_rom(entry):
+    """Return the bytes of ``entry``."""
+    with open_rom(entry) as data:
+        return bytes(data)
+
+
+class RomLibrary:
+    """The ROMs in ``paths``, each a directory or a zip archive.
+
+    Directories are indexed one level deep; zip archives inside them are
+    indexed too. The index is cached in the JSON file ``cache`` (None
+    disables caching) and only sources changed since are rescanned. A file
+    edited in place without its directory changing is caught when it is
+    loaded, as its modification time no longer matches.
+    """
+
+    def __init__(self, paths=(DEFAULT_ROM_DIR,), cache=DEFAULT_CACHE):
+        self.cache = cache
+        self.sources = {}  # path -> {"mtime_ns", "entries", "archives"}
+        self.archives = {}  # path -> open ZipFile, for loading members
+        self.changed = False
+        self.cached = self._read_cache()  # Other libraries' sources are kept
+        for path in paths:
+            self._index(os.path.abspath(path), self.cached)
+        if self.changed:
+            self.save()
+        self.entries = self._collect(os.path.abspath(path) for path in paths)
+
+    def _read_cache(self):
+        if self.cache is None:
+            return {}
+        try:
+            with open(self.cache) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data["sources"]
+
+    def _index(self, path, cached):
+        """Index ``path``, reusing its cached index if it hasn't changed."""
+        if path in self.sources:
+            return
+        mtime_ns = os.stat(path).st_mtime_ns
+        source = cached.get(path)
+        if source is not None and source["mtime_ns"] == mtime_ns:
+            source = dict(source, entries=[RomEntry(*entry) for entry in source["entries"]])
+        elif zipfile.is_zipfile(path):
+            source = {"mtime_ns": mtime_ns, "entries": _scan_archive(path), "archives": []}
+            self.changed = True
+        else:
+            entries = []
+            archives = []
+            with os.scandir(path) as it:
+                for item in sorted(it, key=lambda item: item.name):
+                    if item.name.startswith(".") or not item.is_file():
+                        continue
+                    if zipfile.is_zipfile(item.path):
+                        archives.append(item.path)
+                    elif 0 < item.stat().st_size <= MAX_ROM_SIZE:
+                        entries.append(_hash_file(item.path, item.name))
+            source = {"mtime_ns": mtime_ns, "entries": entries, "archives": archives}
+            self.changed = True
+        self.sources[path] = source
+        for archive in source["archives"]:
+            self._index(archive, cached)
+
+    def _collect(self, paths):
+        """Return the entries of ``paths`` and the archives inside them, in order."""
+        entries = []
+        for path in paths:
+            source = self.sources[path]
+            entries.extend(source["entries"])
+            entries.extend(self._collect(source["archives"]))
+        return entries
+
+    def save(self):
+        """Write the index to the cache file, replacing it atomically."""
+        if self.cache is None:
+            return
+        sources = dict(self.cached)
+        for path, source in self.sources.items():
+            sources[path] = dict(source, entries=[list(entry) for entry in source["entries"]])
+        directory = os.path.dirname(self.cache)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+                json.dump({"version": CACHE_VERSION, "sources": sources}, f)
+            os.replace(f.name, self.cache)
+        except OSError:
+            pass  # A read-only cache only costs a rescan next time
+        self.changed = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def unique(self):
+        """Return one entry per distinct ROM, the first found for each hash."""
+        seen = set()
+        unique = []
+        for entry in self.entries:
+            if entry.sha1 not in seen:
+                seen.add(entry.sha1)
+                unique.append(entry)
+        return unique
+
+    def find(self, ref):
+        """Return the entry for ``ref``, a file name or a SHA-1 or prefix of one.
+
+        Names match case-insensitively, with or without their extension,
+        preferring the closest match. Raises ``ValueError`` if nothing matches or ``ref`` names different
+        ROMs.
+        """
+        lowered = ref.lower()
+        # The exact name wins, then names differing in case, then names
+        # without their extension.
+        matches = (
+            [entry for entry in self.entries if entry.name == ref]
+            or [entry for entry in self.entries if entry.name.lower() == lowered]
+            or [entry for entry in self.entries if os.path.splitext(entry.name)[0].lower() == lowered]
+        )
+        if not matches and len(lowered) >= MIN_HASH_PREFIX and _HEX.fullmatch(lowered):
+            matches = [entry for entry in self.entries if entry.sha1.startswith(lowered)]
+        if not matches:
+            raise ValueError(f"no ROM named or hashed '{ref}' in the library")
+        if len({entry.sha1 for entry in matches}) > 1:
+            found = ", ".join(f"{entry.name} ({entry.sha1[:8]})" for entry in matches)
+            raise ValueError(f"'{ref}' matches different ROMs: {found}")
+        return matches[0]
+
+    @contextlib.contextmanager
+    def open(self, ref):
+        """Yield the entry for ``ref`` and its bytes as a read-only buffer.
+
+        A plain file changed since it was indexed is hashed again first.
+        """
+        entry = self.find(ref) if isinstance(ref, str) else ref
+        if entry.member is None and os.stat(entry.source).st_mtime_ns != entry.mtime_ns:
+            entry = self._rehash(entry)
+        with open_rom(entry, self.archives) as data:
+            yield entry, data
+
+    def _rehash(self, entry):
+        fresh = _hash_file(entry.source, entry.name)
+        self.entries = [fresh if known == entry else known for known in self.entries]
+        for source in self.sources.values():
+            source["entries"] = [fresh if known == entry else known for known in source["entries"]]
+        self.save()
+        return fresh
+
+    def load(self, machine, ref):
+        """Load ROM ``ref`` into ``machine`` (a ``Chip8`` or ``BatchChip8``).
+
+        Returns its entry.
+        """
+        with self.open(ref) as (entry, data):
+            machine.load_rom_bytes(data)
+        return entry
+
+    def close(self):
+        """Close the archives opened for loading."""
+        for archive in self.archives.values():
+            archive.close()
+        self.archives.clear()
+
+
+def load_rom(machine, ref, paths=(DEFAULT_ROM_DIR,), cache=DEFAULT_CACHE):
+    """Load ``ref`` into ``machine``: a ROM file path, or else a name or hash
+    looked up in a ``RomLibrary`` of ``paths``.
+
+    Returns the name of the ROM.
+    """
+    if os.path.isfile(ref):
+        machine.load_rom(ref)
+        return os.path.basename(ref)
+    library = RomLibrary(paths, cache)
+    try:
+        return library.load(machine, ref).name
+    finally:
+        library.close()
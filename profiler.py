@@ -0,0 +1,68 @@
+from collections import Counter
+from time import perf_counter_ns
+
+
+class Profiler:
+    """Instrumented execution path for a Chip8.
+
+    Runs the machine through its own fetch/decode/execute loop that counts
+    executions per handler (``ld_byte``, ``drw``, ...) and per ``pc`` and
+    times every handler call. ``Chip8.run_cycles`` is left untouched, so a
+    machine that is not being profiled pays nothing for it.
+    """
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+        self.opcode_counts = Counter()  # handler name -> executions
+        self.pc_counts = Counter()  # address -> executions
+        self.family_time = Counter()  # handler name -> nanoseconds
+
+    def run_cycles(self, count):
+        """Execute ``count`` instructions, recording each one."""
+        chip8 = self.chip8
+        memory = chip8.memory
+        opcode_counts = self.opcode_counts
+        pc_counts = self.pc_counts
+        family_time = self.family_time
+        handler_for = chip8.handler
+        for _ in range(count):
+            pc = chip8.pc
+            # Decoded up front, so decoding is not timed as the opcode.
+            handler = handler_for((memory[pc] << 8) | memory[pc + 1])
+            name = handler.__name__
+            start = perf_counter_ns()
+            handler(chip8)
+            family_time[name] += perf_counter_ns() - start
+            opcode_counts[name] += 1
+            pc_counts[pc] += 1
+
+    def run_frame(self):
+        """Profile one 60 Hz frame, like ``Chip8.run_frame``."""
+        self.run_cycles(self.chip8.cycles_per_frame)
+        self.chip8.update_timers()
+
+    def hotspots(self, count=20):
+        """Return the ``count`` most executed addresses.
+
+        Each entry is ``(address, executions, opcode)``, where ``opcode`` is
+        what memory holds at the address now.
+        """
+        memory = self.chip8.memory
+        return [
+            (pc, executions, (memory[pc] << 8) | memory[pc + 1])
+            for pc, executions in self.pc_counts.most_common(count)
+        ]
+
+    def families(self):
+        """Return ``(name, executions, nanoseconds)`` per handler, slowest first."""
+        return sorted(
+            ((name, executions, self.family_time[name]) for name, executions in self.opcode_counts.items()),
+            key=lambda entry: entry[2],
+            reverse=True,
+        )
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.opcode_counts.clear()
+        self.pc_counts.clear()
+        self.family_time.clear()
@@ -0,0 +1,194 @@
+from chip8 import decode
+
+# Longest run of instructions translated into a single block.
+MAX_BLOCK_LENGTH = 32
+
+# Straight-line instructions translated inline. Keys are the names of the
+# handlers ``chip8.decode`` returns, so the recompiler classifies opcodes
+# exactly like the interpreter does.
+_INLINE = {
+    "ld_byte": "V[{x}] = {kk}",
+    "add_byte": "V[{x}] = (V[{x}] + {kk}) & 0xFF",
+    "ld_reg": "V[{x}] = V[{y}]",
+    "or_": "V[{x}] |= V[{y}]",
+    "and_": "V[{x}] &= V[{y}]",
+    "xor": "V[{x}] ^= V[{y}]",
+    "add_reg": "r = V[{x}] + V[{y}]\n"
+               "V[15] = 1 if r > 0xFF else 0\n"
+               "V[{x}] = r & 0xFF",
+    "sub": "V[15] = 1 if V[{x}] > V[{y}] else 0\n"
+           "V[{x}] = (V[{x}] - V[{y}]) & 0xFF",
+    "shr": "V[15] = V[{x}] & 0x1\n"
+           "V[{x}] >>= 1",
+    "subn": "V[15] = 1 if V[{y}] > V[{x}] else 0\n"
+            "V[{x}] = (V[{y}] - V[{x}]) & 0xFF",
+    "shl": "V[15] = (V[{x}] & 0x80) >> 7\n"
+           "V[{x}] = (V[{x}] << 1) & 0xFF",
+    "ld_i": "c.I = {nnn}",
+    "ld_dt_read": "V[{x}] = c.delay_timer",
+    "ld_dt": "c.delay_timer = V[{x}]",
+    "ld_st": "c.sound_timer = V[{x}]",
+    "add_i": "c.I += V[{x}]",
+    "ld_font": "c.I = V[{x}] * 5",
+}
+
+# Control flow instructions that end a block by setting ``pc``.
+_TERMINATORS = {
+    "jp": "c.pc = {nnn}",
+    "call": "c.stack[c.sp] = {addr}\n"
+            "c.sp += 1\n"
+            "c.pc = {nnn}",
+    "ret": "c.sp -= 1\n"
+           "c.pc = c.stack[c.sp] + 2",
+    "jp_v0": "c.pc = {nnn} + V[0]",
+    "se_byte": "c.pc = {skip} if V[{x}] == {kk} else {next}",
+    "sne_byte": "c.pc = {skip} if V[{x}] != {kk} else {next}",
+    "se_reg": "c.pc = {skip} if V[{x}] == V[{y}] else {next}",
+    "sne_reg": "c.pc = {skip} if V[{x}] != V[{y}] else {next}",
+    "skp": "c.pc = {skip} if c.keys[V[{x}]] == 1 else {next}",
+    "sknp": "c.pc = {skip} if c.keys[V[{x}]] == 0 else {next}",
+}
+
+
+def _templates(quirks):
+    """Return the ``(inline, terminators)`` templates for a set of ``chip8.Quirks``.
+
+    Like ``chip8.decode``, this picks each behaviour once, when blocks are
+    translated, never while they run.
+    """
+    inline = dict(_INLINE)
+    terminators = dict(_TERMINATORS)
+    if quirks.shift_vy:
+        inline["shr"] = ("r = V[{y}]\n"
+                         "V[{x}] = r >> 1\n"
+                         "V[15] = r & 0x1")
+        inline["shl"] = ("r = V[{y}]\n"
+                         "V[{x}] = (r << 1) & 0xFF\n"
+                         "V[15] = r >> 7")
+    if quirks.logic_vf:
+        for kind in ("or_", "and_", "xor"):
+            inline[kind] += "\nV[15] = 0"
+    if quirks.jump_vx:
+        terminators["jp_v0"] = "c.pc = {nnn} + V[{x}]"
+    return inline, terminators
+
+
+# Instructions run through their interpreter handler that must end the block:
+# FX0A and 00FD may leave ``pc`` where it is, and memory writes may modify
+# code that follows them, so the block after them has to be looked up afresh.
+_BLOCKING = {"ld_key", "exit"}
+_MEMORY_WRITES = {"store": "{x} + 1", "bcd": "3"}
+
+
+class Recompiler:
+    """Execution engine that runs a Chip8 a basic block at a time.
+
+    Straight-line runs of instructions ending at a jump, call, return or skip
+    are translated into Python functions with ``compile()`` and cached by
+    start address, so tight game loops skip fetch and decode entirely. Blocks
+    covering memory written by ``FX55`` or ``FX33`` are invalidated so
+    self-modifying ROMs keep working.
+
+    Memory changed behind the recompiler's back (loading a ROM or a saved
+    state) must be followed by a call to ``invalidate_all``.
+    """
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+        self.inline, self.terminators = _templates(chip8.quirks)
+        self.blocks = {}  # start address -> compiled block
+        self.spans = {}  # start address -> end address (exclusive)
+        self.covered = bytearray(len(chip8.memory))  # blocks covering each byte
+
+    def run(self, cycles):
+        """Execute whole blocks until at least ``cycles`` instructions ran.
+
+        Returns the number of instructions actually executed, which may
+        exceed ``cycles`` by less than one block.
+        """
+        chip8 = self.chip8
+        blocks = self.blocks
+        executed = 0
+        while executed < cycles:
+            block = blocks.get(chip8.pc)
+            if block is None:
+                block = self.compile_block(chip8.pc)
+            executed += block(chip8)
+        return executed
+
+    def compile_block(self, start):
+        """Translate the block starting at ``start`` and cache it."""
+        memory = self.chip8.memory
+        lines = ["def block(c):", "    V = c.V"]
+        namespace = {"invalidate": self.invalidate}
+        addr = start
+        count = 0
+        ended = False
+
+        while not ended and count < MAX_BLOCK_LENGTH and addr + 1 < len(memory):
+            opcode = (memory[addr] << 8) | memory[addr + 1]
+            handler = decode(opcode, self.chip8.quirks)
+            kind = handler.__name__
+            fields = {
+                "addr": addr,
+                "next": addr + 2,
+                "skip": addr + 4,
+                "x": (opcode & 0x0F00) >> 8,
+                "y": (opcode & 0x00F0) >> 4,
+                "kk": opcode & 0x00FF,
+                "nnn": opcode & 0x0FFF,
+            }
+            count += 1
+
+            if kind in self.inline:
+                body = self.inline[kind].format(**fields)
+            elif kind in self.terminators:
+                body = self.terminators[kind].format(**fields)
+                ended = True
+            else:
+                name = f"h{addr:03X}"
+                namespace[name] = handler
+                body = f"c.pc = {addr}\n{name}(c)"
+                if kind in _MEMORY_WRITES:
+                    length = _MEMORY_WRITES[kind].format(**fields)
+                    body = f"i = c.I\n{body}\ninvalidate(i, i + {length})"
+                ended = kind in _BLOCKING or kind in _MEMORY_WRITES
+
+            lines.extend("    " + line for line in body.split("\n"))
+            addr += 2
+
+        if count == 0:
+            raise IndexError(f"pc 0x{start:03X} is outside of memory")
+
+        if not ended:
+            lines.append(f"    c.pc = {addr}")
+        lines.append(f"    return {count}")
+
+        code = compile("\n".join(lines), f"<block 0x{start:03X}>", "exec")
+        exec(code, namespace)
+        block = namespace["block"]
+
+        self.blocks[start] = block
+        self.spans[start] = addr
+        covered = self.covered
+        for i in range(start, min(addr, len(covered))):
+            covered[i] += 1
+        return block
+
+    def invalidate(self, start, end):
+        """Drop every cached block overlapping memory in ``[start, end)``."""
+        if not any(self.covered[start:end]):
+            return
+        for block_start, block_end in list(self.spans.items()):
+            if block_start < end and start < block_end:
+                del self.blocks[block_start]
+                del self.spans[block_start]
+                covered = self.covered
+                for i in range(block_start, min(block_end, len(covered))):
+                    covered[i] -= 1
+
+    def invalidate_all(self):
+        """Forget every compiled block."""
+        self.blocks.clear()
+        self.spans.clear()
+        self.covered = bytearray(len(self.chip8.memory))
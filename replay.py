@@ -0,0 +1,147 @@
+import hashlib
+import struct
+from collections import namedtuple
+
+from chip8 import Quirks
+
+RECORDING_MAGIC = b"C8IN"
+RECORDING_VERSION = 3
+
+# Header: magic, version, initial RNG state, cycles per frame, the quirks
+# (a byte of flags and a byte for load_store), SHA-1 of the machine's memory
+# when recording started (identifying the ROM) and the number of frames
+# recorded. Each event after it is a frame number and a byte holding the
+# key in the low nibble and 0x80 if it went down.
+_HEADER = struct.Struct(">4sBIHBB20sI")
+_EVENT = struct.Struct(">IB")
+_PRESSED = 0x80
+# Bit n of the flags byte is the nth of these; adding a quirk changes the
+# format, so RECORDING_VERSION must go up with it.
+_QUIRK_FLAGS = tuple(name for name in Quirks._fields if name != "load_store")
+_LOAD_STORE = ("keep", "x", "x+1")
+
+Recording = namedtuple("Recording", "seed cycles_per_frame quirks memory_hash frames events")
+
+
+def _memory_hash(chip8):
+    return hashlib.sha1(chip8.memory).digest()
+
+
+def _pack_quirks(quirks):
+    flags = sum(1 << bit for bit, name in enumerate(_QUIRK_FLAGS) if getattr(quirks, name))
+    return flags, _LOAD_STORE.index(quirks.load_store)
+
+
+def _unpack_quirks(flags, load_store):
+    fields = {name: bool(flags >> bit & 1) for bit, name in enumerate(_QUIRK_FLAGS)}
+    return Quirks(load_store=_LOAD_STORE[load_store], **fields)
+
+
+class InputRecorder:
+    """Logs the key changes a Chip8 sees, frame by frame.
+
+    Create it right after loading the ROM, before the first frame, and call
+    ``record_frame`` before each ``Chip8.run_frame``. Together with the
+    machine's RNG state and memory at the start, which are captured here,
+    the key changes determine the whole run, so ``replay`` can reproduce it
+    on a machine with the same quirks.
+    """
+
+    def __init__(self, chip8):
+        self.chip8 = chip8
+        self.seed = chip8.rng_state
+        self.memory_hash = _memory_hash(chip8)
+        self.frames = 0
+        self.events = []  # (frame, key, pressed)
+        self.keys = [0] * 16  # Keys as of the last recorded frame
+
+    def record_frame(self):
+        """Log the keys that changed since the last frame; call once per frame."""
+        keys = self.chip8.keys
+        if keys != self.keys:
+            for key, (before, now) in enumerate(zip(self.keys, keys)):
+                if before != now:
+                    self.events.append((self.frames, key, bool(now)))
+            self.keys = keys[:]
+        self.frames += 1
+
+    def recording(self):
+        """Return what has been recorded so far as a ``Recording``."""
+        return Recording(self.seed, self.chip8.cycles_per_frame, self.chip8.quirks, self.memory_hash,
+                         self.frames, tuple(self.events))
+
+    def save(self, path):
+        """Write the recording to ``path``."""
+        save_recording(self.recording(), path)
+
+
+def save_recording(recording, path):
+    """Write a ``Recording`` to ``path`` in the compact binary format."""
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(
+            RECORDING_MAGIC,
+            RECORDING_VERSION,
+            recording.seed,
+            recording.cycles_per_frame,
+            *_pack_quirks(recording.quirks),
+            recording.memory_hash,
+            recording.frames,
+        ))
+        f.write(b"".join(
+            _EVENT.pack(frame, key | (_PRESSED if pressed else 0)) for frame, key, pressed in recording.events
+        ))
+
+
+def load_recording(path):
+    """Read a ``Recording`` from ``path``.
+
+    Raises ``ValueError`` if the file is not a recording.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size or (len(data) - _HEADER.size) % _EVENT.size:
+        raise ValueError(f"{path} is not a Chip8 input recording")
+    magic, version, seed, cycles_per_frame, flags, load_store, memory_hash, frames = _HEADER.unpack_from(data)
+    if magic != RECORDING_MAGIC or version != RECORDING_VERSION or load_store >= len(_LOAD_STORE):
+        raise ValueError(f"{path} is not a version {RECORDING_VERSION} Chip8 input recording")
+    events = tuple(
+        (frame, value & 0xF, bool(value & _PRESSED))
+        for frame, value in _EVENT.iter_unpack(memoryview(data)[_HEADER.size:])
+    )
+    return Recording(seed, cycles_per_frame, _unpack_quirks(flags, load_store), memory_hash, frames, events)
+
+
+def replay(chip8, recording, checkpoints=()):
+    """Feed ``recording`` to ``chip8`` headless, as fast as the host allows.
+
+    ``chip8`` must have the recorded ROM freshly loaded and be built with
+    the recording's quirks; its RNG state and speed are set from the
+    recording. Returns a dict mapping each frame in ``checkpoints``, and the
+    last frame, to the framebuffer hash after it. Raises ``ValueError`` if
+    the machine's memory or quirks don't match the recording's.
+    """
+    if _memory_hash(chip8) != recording.memory_hash:
+        raise ValueError("the loaded ROM is not the one the recording was made with")
+    if chip8.quirks != recording.quirks:
+        raise ValueError(f"the recording was made with quirks {recording.quirks}, not {chip8.quirks}")
+    chip8.rng_state = recording.seed
+    chip8.cycles_per_frame = recording.cycles_per_frame
+
+    checkpoints = set(checkpoints)
+    hashes = {}
+    events = recording.events
+    next_event = 0
+    run_frame = chip8.run_frame
+    for frame in range(recording.frames):
+        while next_event < len(events) and events[next_event][0] == frame:
+            _, key, pressed = events[next_event]
+            if pressed:
+                chip8.press_key(key)
+            else:
+                chip8.release_key(key)
+            next_event += 1
+        run_frame()
+        if frame + 1 in checkpoints:
+            hashes[frame + 1] = chip8.framebuffer_hash()
+    hashes[recording.frames] = chip8.framebuffer_hash()
+    return hashes
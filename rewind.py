@@ -0,0 +1,86 @@
+from collections import deque
+
+# States are compared in segments of this many bytes; only segments that
+# changed are XORed and stored.
+_SEGMENT = 256
+
+
+def _xor(a, b):
+    """XOR two equal-length byte strings."""
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+
+def diff_states(old, new):
+    """Return the delta between two save states.
+
+    The delta is a tuple of ``(offset, xor)`` pairs, one for each changed
+    segment, where ``xor`` is the XOR of the old and new bytes with zero
+    bytes trimmed off both ends. It is its own inverse: applying it to
+    either state gives the other.
+    """
+    runs = []
+    for start in range(0, len(new), _SEGMENT):
+        end = start + _SEGMENT
+        if old[start:end] != new[start:end]:
+            segment = _xor(old[start:end], new[start:end])
+            trimmed = segment.lstrip(b"\0")
+            runs.append((start + len(segment) - len(trimmed), trimmed.rstrip(b"\0")))
+    return tuple(runs)
+
+
+def apply_delta(state, delta):
+    """Apply a delta from ``diff_states`` to ``state`` and return the result."""
+    state = bytearray(state)
+    for offset, xor in delta:
+        end = offset + len(xor)
+        state[offset:end] = _xor(state[offset:end], xor)
+    return bytes(state)
+
+
+class RewindBuffer:
+    """Bounded history of a Chip8's past frames.
+
+    Only the most recent save state is kept in full. Every older frame is
+    stored as a delta from the frame after it, holding just the bytes that
+    changed, and stepping back a frame applies the newest delta to the
+    current state. Once ``capacity`` deltas are held the oldest is dropped,
+    so memory use stays flat however long the session runs.
+    """
+
+    def __init__(self, chip8, capacity=600):
+        self.chip8 = chip8
+        self.deltas = deque(maxlen=capacity)
+        self.latest = None
+
+    def __len__(self):
+        """Number of frames that can be rewound."""
+        return len(self.deltas)
+
+    def record(self):
+        """Remember the machine's current state; call once per frame."""
+        state = self.chip8.save_state()
+        if self.latest is not None:
+            self.deltas.append(diff_states(self.latest, state))
+        self.latest = state
+
+    def rewind(self, frames=1):
+        """Restore the state from ``frames`` recordings ago.
+
+        Returns how many frames were actually rewound, which is less than
+        ``frames`` when the history is shorter.
+        """
+        if self.latest is None:
+            return 0
+        state = self.latest
+        rewound = 0
+        while rewound < frames and self.deltas:
+            state = apply_delta(state, self.deltas.pop())
+            rewound += 1
+        self.latest = state
+        self.chip8.load_state(state)
+        return rewound
+
+    def clear(self):
+        """Forget all recorded history."""
+        self.deltas.clear()
+        self.latest = None
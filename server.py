@@ -0,0 +1,212 @@
+"""Streams a Chip8's framebuffer to TCP viewers without rendering it.
+
+The CPU runs in its own thread at 60 frames per second while an asyncio loop
+in the calling thread owns every socket, so a slow or stalled viewer can
+never hold up emulation.
+
+Each frame that changed is sent to every viewer as one message: a header
+``kind`` (``KEYFRAME`` or ``DELTA``), width in pixels, frame number and a
+64-bit row mask, followed by one row of pixels (MSB leftmost) for each row
+set in the mask, top to bottom: 8 bytes per row for the 64x32 screen and 16
+for SUPER-CHIP's 128x64 one. A delta holds only the rows that changed since
+the previous message; a keyframe holds all of them and is sent every
+``keyframe_interval`` frames, when the resolution changes, to viewers as
+they connect, and to viewers that fell behind.
+
+The first connected viewer controls the machine: it sends 2-byte messages,
+a key (0-F) and 1 for pressed or 0 for released. Key messages from other
+viewers are ignored. When the controller leaves, the next oldest viewer
+takes over.
+"""
+import asyncio
+import logging
+import struct
+import threading
+import time
+
+from chip8 import HIRES_HEIGHT, SCREEN_WIDTH
+
+KEYFRAME = 1
+DELTA = 2
+
+FRAME_HEADER = struct.Struct(">BBIQ")  # kind, width, frame number, row mask
+KEY_EVENT = struct.Struct(">BB")  # key, pressed
+
+# Viewers with more than this many bytes queued in their socket get no
+# deltas until it drains, and then a keyframe to catch up.
+MAX_BACKLOG = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def encode_frame(kind, frame, mask, gfx, width=SCREEN_WIDTH):
+    """Return the message for the rows of ``gfx`` selected by ``mask``."""
+    row_bytes = width // 8
+    rows = b"".join(row.to_bytes(row_bytes, "big") for y, row in enumerate(gfx) if mask >> y & 1)
+    return FRAME_HEADER.pack(kind, width, frame, mask) + rows
+
+
+async def read_frame(reader):
+    """Read one frame message from a server.
+
+    Returns ``(kind, frame, mask, rows, width)``, where ``rows`` maps row
+    numbers to their ``width``-bit pixel values.
+    """
+    kind, width, frame, mask = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    row_bytes = width // 8
+    present = [y for y in range(HIRES_HEIGHT) if mask >> y & 1]
+    data = await reader.readexactly(len(present) * row_bytes)
+    rows = {
+        y: int.from_bytes(data[i * row_bytes:(i + 1) * row_bytes], "big")
+        for i, y in enumerate(present)
+    }
+    return kind, frame, mask, rows, width
+
+
+class _Viewer:
+    def __init__(self, writer):
+        self.writer = writer
+        self.behind = False  # Skipped a delta; needs a keyframe
+
+
+class FrameServer:
+    """Runs ``chip8`` and publishes its frames to TCP viewers.
+
+    ``fps`` caps the emulation speed; None runs frames as fast as the host
+    allows.
+    """
+
+    def __init__(self, chip8, host="127.0.0.1", port=8088, keyframe_interval=60, fps=60):
+        self.chip8 = chip8
+        self.host = host
+        self.port = port
+        self.keyframe_interval = keyframe_interval
+        self.fps = fps
+        self.viewers = []  # In order of connection; the first one controls
+        self.frame = 0
+        self.screen = list(chip8.gfx)  # Framebuffer as last published
+        self.width = chip8.width
+        self.running = False
+
+    def run(self):
+        """Serve until interrupted or until the machine raises an error."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self):
+        """Start the CPU thread and accept viewers until cancelled.
+
+        If the machine raises an error, the CPU thread logs it and cancels
+        this coroutine, which then returns.
+        """
+        loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._handle_viewer, self.host, self.port)
+        self.running = True
+        crashed = threading.Event()
+        cpu = threading.Thread(target=self._run_cpu, args=(loop, asyncio.current_task(), crashed),
+                               name="chip8-cpu", daemon=True)
+        cpu.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            if not crashed.is_set():
+                raise
+        finally:
+            self.running = False
+            cpu.join()
+
+    def _run_cpu(self, loop, task, crashed):
+        """Run ``_emulate``; if the machine raises, log it and stop ``task``."""
+        try:
+            self._emulate(loop)
+        except Exception:
+            logger.exception("Stopped serving: the machine raised an error at pc 0x%03X", self.chip8.pc)
+            crashed.set()
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # The event loop has already shut down
+
+    def _emulate(self, loop):
+        """Emulate frames and hand each changed one to the event loop."""
+        chip8 = self.chip8
+        sent = list(chip8.gfx)  # Framebuffer as of the last message
+        sent_width = chip8.width
+        interval = 1 / self.fps if self.fps else 0
+        deadline = time.perf_counter()
+        frame = 0
+        while self.running:
+            chip8.run_frame()
+            frame += 1
+            gfx = chip8.gfx
+            width = chip8.width
+            if frame % self.keyframe_interval == 0 or width != sent_width:
+                kind, mask = KEYFRAME, chip8.all_rows
+            else:
+                kind, mask = DELTA, 0
+                dirty = chip8.dirty_rows
+                for y, row in enumerate(gfx):
+                    if dirty >> y & 1 and row != sent[y]:
+                        mask |= 1 << y
+            chip8.dirty_rows = 0
+            if mask:
+                sent[:] = gfx
+                sent_width = width
+                message = encode_frame(kind, frame, mask, gfx, width)
+                try:
+                    loop.call_soon_threadsafe(self._publish, kind, frame, message, tuple(gfx), width)
+                except RuntimeError:
+                    break  # The event loop has shut down
+
+            if interval:
+                deadline += interval
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    deadline = time.perf_counter()  # Fell behind; don't try to catch up
+
+    def _publish(self, kind, frame, message, gfx, width):
+        """Send a frame message to every viewer that keeps up (event loop)."""
+        self.frame = frame
+        self.screen[:] = gfx
+        self.width = width
+        keyframe = None
+        for viewer in self.viewers:
+            transport = viewer.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > MAX_BACKLOG:
+                viewer.behind = True
+            elif viewer.behind and kind == DELTA:
+                if keyframe is None:
+                    keyframe = encode_frame(KEYFRAME, frame, (1 << len(gfx)) - 1, gfx, width)
+                viewer.writer.write(keyframe)
+                viewer.behind = False
+            else:
+                viewer.writer.write(message)
+                viewer.behind = False
+
+    async def _handle_viewer(self, reader, writer):
+        viewer = _Viewer(writer)
+        self.viewers.append(viewer)
+        writer.write(encode_frame(KEYFRAME, self.frame, (1 << len(self.screen)) - 1, self.screen, self.width))
+        try:
+            while True:
+                key, pressed = KEY_EVENT.unpack(await reader.readexactly(KEY_EVENT.size))
+                if viewer is self.viewers[0] and key < 16:
+                    if pressed:
+                        self.chip8.press_key(key)
+                    else:
+                        self.chip8.release_key(key)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if viewer is self.viewers[0]:
+                for key in range(16):
+                    self.chip8.release_key(key)  # Don't leave its keys held down
+            self.viewers.remove(viewer)
+            writer.close()
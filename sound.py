@@ -0,0 +1,115 @@
+"""The Chip-8 beep: a tone that plays while ``Chip8.sound_timer`` is non-zero.
+
+The CPU core knows nothing about audio. A ``Beeper`` watches the timer from
+outside, once per frame, and only tells its backend to start or stop on the
+frames where the timer turns on or off, so headless and batch runs, which
+never create one, pay nothing for sound.
+"""
+import array
+
+TONE_FREQUENCY = 440  # Hz
+SAMPLE_RATE = 44100
+# Mixer buffer in samples; small so the beep starts within ~12 ms.
+MIXER_BUFFER = 512
+VOLUME = 0.25
+
+
+def square_wave(frequency=TONE_FREQUENCY, sample_rate=SAMPLE_RATE, channels=1, duration=0.1):
+    """Return signed 16-bit samples of a square wave that loops seamlessly.
+
+    The buffer holds a whole number of periods, each a whole number of
+    samples, lasting about ``duration`` seconds; channels are interleaved.
+    """
+    period = max(2, round(sample_rate / frequency))
+    high = round(32767 * VOLUME)
+    wave = [high] * (period // 2) + [-high] * (period - period // 2)
+    samples = array.array("h", (sample for sample in wave for _ in range(channels)))
+    return samples * max(1, round(duration * sample_rate / period))
+
+
+class NullBackend:
+    """Swallows start and stop; used when muted or no audio device exists."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MixerBackend:
+    """Plays the beep through ``pygame.mixer``.
+
+    The tone is synthesised once into a looping ``Sound``; starting and
+    stopping it only queue commands for the mixer thread, so neither ever
+    waits on the audio device.
+    """
+
+    def __init__(self, frequency=TONE_FREQUENCY):
+        import pygame  # Deferred so this module imports without pygame
+
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(frequency=SAMPLE_RATE, size=-16, channels=1, buffer=MIXER_BUFFER)
+        sample_rate, size, channels = pygame.mixer.get_init()
+        if size != -16:
+            pygame.mixer.quit()
+            raise pygame.error(f"mixer opened with {size}-bit samples; the beep needs signed 16-bit")
+        self.sound = pygame.mixer.Sound(buffer=square_wave(frequency, sample_rate, channels).tobytes())
+
+    def start(self):
+        self.sound.play(loops=-1)
+
+    def stop(self):
+        self.sound.stop()
+
+    def close(self):
+        self.stop()
+
+
+def open_backend(mute=False):
+    """Return a ``MixerBackend``, or a ``NullBackend`` if muted or audio is unavailable."""
+    if mute:
+        return NullBackend()
+    try:
+        import pygame
+    except ImportError:
+        return NullBackend()
+    try:
+        return MixerBackend()
+    except pygame.error:  # No audio device
+        return NullBackend()
+
+
+class Beeper:
+    """Starts and stops ``backend`` as ``chip8``'s sound timer turns on and off.
+
+    Call ``update`` once per frame, after ``Chip8.run_frame``.
+    """
+
+    def __init__(self, chip8, backend):
+        self.chip8 = chip8
+        self.backend = backend
+        self.playing = False
+
+    def update(self):
+        """Start or stop the tone if the sound timer changed state."""
+        if (self.chip8.sound_timer > 0) != self.playing:
+            self.playing = not self.playing
+            if self.playing:
+                self.backend.start()
+            else:
+                self.backend.stop()
+
+    def silence(self):
+        """Stop the tone; the next ``update`` restarts it if the timer still runs."""
+        if self.playing:
+            self.playing = False
+            self.backend.stop()
+
+    def close(self):
+        """Silence the tone and release the backend."""
+        self.playing = False
+        self.backend.close()
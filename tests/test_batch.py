@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from batch import BatchChip8  # noqa: E402
+from chip8 import QUIRK_PROFILES, Chip8  # noqa: E402
+
+
+def test_fresh_instance_matches_fresh_chip8():
+    chip8 = Chip8(seed=7)
+    batch = BatchChip8(1, seeds=[7])
+    assert batch.save_state(0) == chip8.save_state()
+
+
+# Draws across the bottom-right corner and off screen, then runs 8XY6,
+# 8XYE, 8XY1, FX55, FX65 and BNNN, which all behave differently under
+# some quirks.
+QUIRKY = bytes([
+    0xA2, 0x20, 0x60, 0x3E, 0x61, 0x1E, 0xD0, 0x15, 0x60, 0x46, 0x61, 0x28, 0xD0, 0x15,
+    0x62, 0xF3, 0x63, 0x05, 0x82, 0x36, 0x84, 0x3E, 0x85, 0x31, 0xF2, 0x55, 0xF1, 0x65,
+    0xB3, 0x00, 0x00, 0x00, 0xF0, 0x90, 0xF0, 0x90, 0xF0,
+])
+
+
+@pytest.mark.parametrize("quirks", [
+    "default", "vip", "chip48", "schip", QUIRK_PROFILES["default"]._replace(wrap_sprites=True),
+])
+def test_batch_follows_quirks(quirks):
+    chip8 = Chip8(cycles_per_frame=15, seed=1, quirks=quirks)
+    chip8.load_rom_bytes(QUIRKY)
+    batch = BatchChip8(1, cycles_per_frame=15, seeds=[1], quirks=quirks)
+    batch.load_rom_bytes(QUIRKY)
+    chip8.run_frame()
+    batch.run_frame()
+    assert not batch.crashed[0]
+    assert batch.save_state(0) == chip8.save_state()
+
+
+@pytest.mark.parametrize("quirks", ["default", "schip", QUIRK_PROFILES["schip"]._replace(wrap_sprites=True)])
+def test_batch_lores_large_sprite(quirks):
+    # 603C 6114 D010 1206: DXY0 at (60, 20) in lo-res mode.
+    rom = bytes([0x60, 0x3C, 0x61, 0x14, 0xD0, 0x10, 0x12, 0x06])
+    chip8 = Chip8(seed=1, quirks=quirks)
+    chip8.load_rom_bytes(rom)
+    batch = BatchChip8(1, seeds=[1], quirks=quirks)
+    batch.load_rom_bytes(rom)
+    chip8.run_frame()
+    batch.run_frame()
+    assert batch.save_state(0) == chip8.save_state()
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chip8 import Chip8, run_headless  # noqa: E402
+from rewind import RewindBuffer  # noqa: E402
+
+# F00A 7101 1202: wait for a key, then count up in V1 forever.
+WAIT_THEN_COUNT = bytes([0xF0, 0x0A, 0x71, 0x01, 0x12, 0x02])
+
+
+def test_quickload_out_of_key_wait_unblocks():
+    chip8 = Chip8(seed=1)
+    chip8.load_rom_bytes(WAIT_THEN_COUNT)
+    chip8.pc = 0x202
+    running = chip8.save_state()
+    chip8.pc = 0x200
+    chip8.run_frame()
+    assert chip8.blocked()
+
+    chip8.load_state(running)
+    assert not chip8.blocked()
+    run_headless(chip8, frames=100)
+    assert chip8.V[1] > 0
+
+
+def test_rewind_out_of_key_wait_unblocks():
+    # F00A 7101 F10A: count once after a key, then wait for another.
+    chip8 = Chip8(seed=1)
+    chip8.load_rom_bytes(bytes([0xF0, 0x0A, 0x71, 0x01, 0xF1, 0x0A, 0x12, 0x02]))
+    history = RewindBuffer(chip8)
+    chip8.press_key(5)
+    chip8.run_cycles(2)  # Past the first FX0A, key still down
+    history.record()
+    chip8.release_key(5)
+    chip8.run_frame()  # Blocks in the second FX0A
+    history.record()
+    assert chip8.blocked()
+
+    history.rewind(1)  # Back to key 5 down, so both waits go through
+    assert not chip8.blocked()
+    run_headless(chip8, frames=10)
+    assert chip8.V[1] > 1
+
+
+def test_blocked_state_blocks_again_after_load():
+    chip8 = Chip8(seed=1)
+    chip8.load_rom_bytes(WAIT_THEN_COUNT)
+    chip8.run_frame()
+    blocked = chip8.save_state()
+    chip8.load_state(blocked)
+    chip8.run_frame()
+    assert chip8.blocked()
+
+
+# A20A 6046 6128 D011 1208 80: draw a one-pixel sprite at (70, 40), then spin.
+DRAW_OFF_SCREEN = bytes([0xA2, 0x0A, 0x60, 0x46, 0x61, 0x28, 0xD0, 0x11, 0x12, 0x08, 0x80])
+
+
+@pytest.mark.parametrize("profile", ["vip", "chip48", "schip"])
+def test_sprite_start_wraps(profile):
+    chip8 = Chip8(seed=1, quirks=profile)
+    chip8.load_rom_bytes(DRAW_OFF_SCREEN)
+    chip8.run_frame()
+    assert chip8.gfx[40 % 32] == 1 << (63 - 70 % 64)
+    assert sum(map(bool, chip8.gfx)) == 1
+
+
+def test_sprite_off_screen_draws_nothing_by_default():
+    chip8 = Chip8(seed=1)
+    chip8.load_rom_bytes(DRAW_OFF_SCREEN)
+    chip8.run_frame()
+    assert not any(chip8.gfx)
+
+
+# 603C 6114 D010 1206: draw DXY0 from the font at (60, 20) in lo-res mode.
+DRAW_LORES_LARGE = bytes([0x60, 0x3C, 0x61, 0x14, 0xD0, 0x10, 0x12, 0x06])
+
+
+def test_lores_large_sprite_under_schip():
+    chip8 = Chip8(seed=1, quirks="schip")
+    chip8.load_rom_bytes(DRAW_LORES_LARGE)
+    chip8.run_frame()
+    # An 8x16 sprite from the first 16 font bytes, clipped at the right
+    # and bottom edges.
+    expected = [chip8.memory[row] >> 4 for row in range(12)]
+    assert chip8.gfx[20:] == expected
+    assert not any(chip8.gfx[:20])
+
+
+def test_lores_large_sprite_draws_nothing_by_default():
+    chip8 = Chip8(seed=1)
+    chip8.load_rom_bytes(DRAW_LORES_LARGE)
+    chip8.run_frame()
+    assert not any(chip8.gfx)
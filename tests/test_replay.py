@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chip8 import QUIRK_PROFILES, Chip8  # noqa: E402
+from replay import InputRecorder, load_recording, replay  # noqa: E402
+
+# 6005 6103 8016 1206: V0 = 5, V1 = 3, then V0 >>= 1 (V0 = V1 >> 1 under
+# vip) and spin, so the registers depend on the quirks.
+SHIFT = bytes([0x60, 0x05, 0x61, 0x03, 0x80, 0x16, 0x12, 0x06])
+
+
+def _record(quirks, path):
+    chip8 = Chip8(seed=1, quirks=quirks)
+    chip8.load_rom_bytes(SHIFT)
+    recorder = InputRecorder(chip8)
+    for frame in range(5):
+        recorder.record_frame()
+        chip8.run_frame()
+    recorder.save(path)
+    return chip8.save_state()
+
+
+@pytest.mark.parametrize("profile", list(QUIRK_PROFILES))
+def test_recording_keeps_quirks(tmp_path, profile):
+    path = tmp_path / "session.rec"
+    expected = _record(profile, path)
+    recording = load_recording(path)
+    assert recording.quirks == QUIRK_PROFILES[profile]
+
+    chip8 = Chip8(quirks=recording.quirks)
+    chip8.load_rom_bytes(SHIFT)
+    replay(chip8, recording)
+    assert chip8.save_state() == expected
+
+
+def test_replay_refuses_other_quirks(tmp_path):
+    path = tmp_path / "session.rec"
+    _record("vip", path)
+    chip8 = Chip8()
+    chip8.load_rom_bytes(SHIFT)
+    with pytest.raises(ValueError):
+        replay(chip8, load_recording(path))
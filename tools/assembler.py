@@ -1,144 +1,226 @@
 import argparse
-from abc import ABC, abstractmethod
-
-
-class OpcodeHandler(ABC):
-    def __init__(self, next_handler=None):
-        self.next_handler = next_handler
-
-    def handle(self, instruction: str):
-        if self._check_opcode(instruction):
-            return self._generate_bytes(instruction)
-        elif self.next_handler:
-            return self.next_handler.handle(instruction)
-        else:
-            raise ValueError(f"Unknown instruction: {instruction}")
-
-    @abstractmethod
-    def _check_opcode(self, instruction):
-        pass
-
-    @abstractmethod
-    def _generate_bytes(self, instruction):
-        pass
-
-
-class ClsHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        return instruction == "CLS"
-
-    def _generate_bytes(self, instruction):
-        return (0x00E0).to_bytes(2, "big")
-
-
-class RetHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        return instruction == "RET"
-
-    def _generate_bytes(self, instruction):
-        return (0x00EE).to_bytes(2, "big")
-
-
-class JpHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        parts = instruction.split()
-        return parts[0] == "JP" and len(parts) == 2
-
-    def _generate_bytes(self, instruction):
-        parts = instruction.split()
-        addr = int(parts[1], 16)
-        opcode = 0x1000 | addr
-        return opcode.to_bytes(2, "big")
-
-
-class CallHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        parts = instruction.split()
-        return parts[0] == "CALL" and len(parts) == 2
-
-    def _generate_bytes(self, instruction):
-        parts = instruction.split()
-        addr = int(parts[1], 16)
-        opcode = 0x2000 | addr
-        return opcode.to_bytes(2, "big")
-
-
-class DxynHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        parts = instruction.split()
-        return parts[0].startswith("D") and len(parts[0]) == 4
-
-    def _generate_bytes(self, instruction):
-        parts = instruction.split()
-        x = int(parts[0][1], 16)
-        y = int(parts[0][2], 16)
-        n = int(parts[0][3], 16)
-        opcode = 0xD000 | (x << 8) | (y << 4) | n
-        return opcode.to_bytes(2, "big")
-
-
-class LdHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        parts = instruction.split()
-        return parts[0] == "LD" and len(parts) == 3
-
-    def _generate_bytes(self, instruction):
-        parts = instruction.split()
-        register = int(parts[1][1:], 16)
-        value = int(parts[2], 16)
-        opcode = 0x6000 | (register << 8) | value
-        return opcode.to_bytes(2, "big")
-
-
-class LdIHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        parts = instruction.split()
-        return parts[0] == "LD" and parts[1] == "I" and len(parts) == 3
-
-    def _generate_bytes(self, instruction):
-        parts = instruction.split()
-        addr = int(parts[2], 16)
-        opcode = 0xA000 | addr
-        return opcode.to_bytes(2, "big")
-
-
-class SknpHandler(OpcodeHandler):
-    def _check_opcode(self, instruction):
-        parts = instruction.split()
-        return parts[0] == "SKNP" and len(parts) == 2
-
-    def _generate_bytes(self, instruction):
-        parts = instruction.split()
-        register = int(parts[1][1:], 16)  # Extract the 'x' from 'Vx'
-        opcode = 0xE0A1 | (register << 8)
-        return opcode.to_bytes(2, "big")
-
-
-# Update the OpcodeEmitter class
-class OpcodeEmitter:
-    def __init__(self):
-        # TODO - Add all the handlers
-        self.handlers = ClsHandler(
-            RetHandler(
-                JpHandler(
-                    CallHandler(DxynHandler(LdIHandler(LdHandler(SknpHandler()))))
-                )
-            )
-        )
-
-    def emit(self, instruction):
-        return self.handlers.handle(instruction)
-
-
-def assemble_chip8_program(program_str: str):
-    instructions = program_str.strip().split("\n")
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chip8 import MAX_ROM_SIZE, PROGRAM_START  # noqa: E402
+
+# Numbers are hexadecimal, written bare ("1F", "206") or with a "0x", "#" or
+# "$" prefix. Any other operand that isn't a register or keyword is a label.
+_NUMBER = re.compile(r"(?:0X|#|\$)?([0-9A-F]+)")
+_LABEL = re.compile(r"[A-Za-z_.][A-Za-z0-9_.]*")
+_REGISTERS = {f"V{i:X}": i for i in range(16)}
+_KEYWORDS = {"I", "DT", "ST", "K", "F", "HF", "B", "R", "[I]"}
+# Keywords that are also hex digits, as in "DRW V0, V1, F".
+_HEX_KEYWORDS = {"F": 0xF, "B": 0xB}
+
+# (mnemonic, operand kinds) -> (base opcode, field of each operand). Kinds are
+# "V" for a register, "n" for a number or label, or the keyword itself.
+# Fields say where an operand's value goes: x (bits 8-11), y (bits 4-7), kk
+# (low byte), nnn (low 12 bits, may be a label), n (low nibble), v0 (must be
+# V0) or None for keywords.
+_ENCODINGS = {
+    ("CLS",): (0x00E0, ()),
+    ("RET",): (0x00EE, ()),
+    ("SCD", "n"): (0x00C0, ("n",)),
+    ("SCR",): (0x00FB, ()),
+    ("SCL",): (0x00FC, ()),
+    ("EXIT",): (0x00FD, ()),
+    ("LOW",): (0x00FE, ()),
+    ("HIGH",): (0x00FF, ()),
+    ("SYS", "n"): (0x0000, ("nnn",)),
+    ("JP", "n"): (0x1000, ("nnn",)),
+    ("CALL", "n"): (0x2000, ("nnn",)),
+    ("SE", "V", "n"): (0x3000, ("x", "kk")),
+    ("SNE", "V", "n"): (0x4000, ("x", "kk")),
+    ("SE", "V", "V"): (0x5000, ("x", "y")),
+    ("LD", "V", "n"): (0x6000, ("x", "kk")),
+    ("ADD", "V", "n"): (0x7000, ("x", "kk")),
+    ("LD", "V", "V"): (0x8000, ("x", "y")),
+    ("OR", "V", "V"): (0x8001, ("x", "y")),
+    ("AND", "V", "V"): (0x8002, ("x", "y")),
+    ("XOR", "V", "V"): (0x8003, ("x", "y")),
+    ("ADD", "V", "V"): (0x8004, ("x", "y")),
+    ("SUB", "V", "V"): (0x8005, ("x", "y")),
+    ("SHR", "V"): (0x8006, ("x",)),
+    ("SHR", "V", "V"): (0x8006, ("x", "y")),
+    ("SUBN", "V", "V"): (0x8007, ("x", "y")),
+    ("SHL", "V"): (0x800E, ("x",)),
+    ("SHL", "V", "V"): (0x800E, ("x", "y")),
+    ("SNE", "V", "V"): (0x9000, ("x", "y")),
+    ("LD", "I", "n"): (0xA000, (None, "nnn")),
+    ("JP", "V", "n"): (0xB000, ("v0", "nnn")),
+    ("RND", "V", "n"): (0xC000, ("x", "kk")),
+    ("DRW", "V", "V", "n"): (0xD000, ("x", "y", "n")),
+    ("SKP", "V"): (0xE09E, ("x",)),
+    ("SKNP", "V"): (0xE0A1, ("x",)),
+    ("LD", "V", "DT"): (0xF007, ("x", None)),
+    ("LD", "V", "K"): (0xF00A, ("x", None)),
+    ("LD", "DT", "V"): (0xF015, (None, "x")),
+    ("LD", "ST", "V"): (0xF018, (None, "x")),
+    ("ADD", "I", "V"): (0xF01E, (None, "x")),
+    ("LD", "F", "V"): (0xF029, (None, "x")),
+    ("LD", "HF", "V"): (0xF030, (None, "x")),
+    ("LD", "B", "V"): (0xF033, (None, "x")),
+    ("LD", "[I]", "V"): (0xF055, (None, "x")),
+    ("LD", "V", "[I]"): (0xF065, ("x", None)),
+    ("LD", "R", "V"): (0xF075, (None, "x")),
+    ("LD", "V", "R"): (0xF085, ("x", None)),
+}
+
+_MNEMONICS = {key[0] for key in _ENCODINGS}
+
+# Field -> (shift, largest value).
+_FIELDS = {
+    "x": (8, 0xF),
+    "y": (4, 0xF),
+    "kk": (0, 0xFF),
+    "nnn": (0, 0xFFF),
+    "n": (0, 0xF),
+}
+
+
+def _error(line_number, message):
+    return ValueError(f"line {line_number}: {message}")
+
+
+def _classify(operand):
+    """Return ``(kind, value)`` for an operand token.
+
+    ``value`` is the register number, the number, the label name, or None
+    for keywords.
+    """
+    upper = operand.upper()
+    if upper in _REGISTERS:
+        return "V", _REGISTERS[upper]
+    if upper in _KEYWORDS:
+        return upper, None
+    match = _NUMBER.fullmatch(upper)
+    if match:
+        return "n", int(match.group(1), 16)
+    return "n", operand
+
+
+def _value(value, limit, line_number):
+    """Check that a number operand fits in ``limit``; labels are rejected."""
+    if isinstance(value, str):
+        raise _error(line_number, f"expected a number, got '{value}'")
+    if value > limit:
+        raise _error(line_number, f"{value:X} does not fit in {limit.bit_length()} bits")
+    return value
+
+
+def assemble_chip8_program(program_str: str, origin=PROGRAM_START):
+    """Assemble source text into a ROM image loaded at ``origin``.
+
+    Each line holds an optional ``label:``, then an instruction, a ``DB``
+    (bytes) or ``DW`` (words) directive, or a bare four-digit opcode such as
+    ``D011``; ``;`` starts a comment. Operands may be separated by commas or
+    spaces. Lines are tokenised and encoded in one pass; label references
+    are patched in afterwards, so labels can be used before they are
+    defined. Raises ``ValueError`` naming the line of the first error.
+    """
     bytecode = bytearray()
-    emitter = OpcodeEmitter()
-
-    for instruction in instructions:
-        opcode_bytes = emitter.emit(instruction)
-        bytecode.extend(opcode_bytes)
-
+    # Generated sources repeat the same lines and operands over and over, so
+    # encoded lines without label references and classified operands are
+    # cached.
+    encoded = {}  # line text -> bytes
+    classified = {}  # operand token -> _classify(token)
+    labels = {}
+    fixups = []  # (offset in bytecode, field, label, line number)
+
+    for line_number, line in enumerate(program_str.split("\n"), 1):
+        line = line.split(";", 1)[0]
+        if ":" in line:
+            label, line = line.split(":", 1)
+            label = label.strip()
+            if not _LABEL.fullmatch(label) or _NUMBER.fullmatch(label.upper()) or label.upper() in _REGISTERS:
+                raise _error(line_number, f"invalid label name '{label}'")
+            if label in labels:
+                raise _error(line_number, f"label '{label}' is already defined")
+            labels[label] = origin + len(bytecode)
+        line = line.strip()
+        if not line:
+            continue
+        cached = encoded.get(line)
+        if cached is not None:
+            bytecode += cached
+            continue
+        tokens = line.replace(",", " ").split()
+        mnemonic = tokens[0].upper()
+        operands = []
+        for token in tokens[1:]:
+            operand = classified.get(token)
+            if operand is None:
+                operand = classified[token] = _classify(token)
+            operands.append(operand)
+
+        if mnemonic == "DB":
+            if not operands:
+                raise _error(line_number, "DB needs at least one byte")
+            data = encoded[line] = bytes(_value(value, 0xFF, line_number) for _, value in operands)
+            bytecode += data
+            continue
+        if mnemonic == "DW":
+            if not operands:
+                raise _error(line_number, "DW needs at least one word")
+            for _, value in operands:
+                if isinstance(value, str):
+                    fixups.append((len(bytecode), "word", value, line_number))
+                    value = 0
+                bytecode += _value(value, 0xFFFF, line_number).to_bytes(2, "big")
+            continue
+
+        encoding = _ENCODINGS.get((mnemonic, *(kind for kind, _ in operands)))
+        if encoding is None and any(kind in _HEX_KEYWORDS for kind, _ in operands):
+            operands = [
+                ("n", _HEX_KEYWORDS[kind]) if kind in _HEX_KEYWORDS else (kind, value)
+                for kind, value in operands
+            ]
+            encoding = _ENCODINGS.get((mnemonic, *(kind for kind, _ in operands)))
+        if encoding is None:
+            if not operands and len(mnemonic) == 4 and _NUMBER.fullmatch(mnemonic):
+                data = encoded[line] = int(mnemonic, 16).to_bytes(2, "big")  # Raw opcode, e.g. D011
+                bytecode += data
+                continue
+            if mnemonic not in _MNEMONICS:
+                raise _error(line_number, f"unknown instruction '{tokens[0]}'")
+            raise _error(line_number, f"invalid operands for {mnemonic}: {' '.join(tokens[1:])}")
+
+        opcode, fields = encoding
+        cacheable = True
+        for field, (_, value) in zip(fields, operands):
+            if field is None:
+                continue
+            if field == "v0":
+                if value != 0:
+                    raise _error(line_number, "JP with a register only takes V0")
+                continue
+            if field == "nnn" and isinstance(value, str):
+                fixups.append((len(bytecode), "nnn", value, line_number))
+                cacheable = False
+                continue
+            shift, limit = _FIELDS[field]
+            opcode |= _value(value, limit, line_number) << shift
+        data = opcode.to_bytes(2, "big")
+        if cacheable:
+            encoded[line] = data
+        bytecode += data
+
+    if len(bytecode) > MAX_ROM_SIZE:
+        raise ValueError(f"program is {len(bytecode)} bytes; at most {MAX_ROM_SIZE} fit in memory")
+
+    for offset, field, label, line_number in fixups:
+        if label not in labels:
+            raise _error(line_number, f"undefined label '{label}'")
+        address = labels[label]
+        if field == "nnn":
+            bytecode[offset] |= address >> 8
+            bytecode[offset + 1] = address & 0xFF
+        else:
+            bytecode[offset:offset + 2] = address.to_bytes(2, "big")
     return bytecode
 
 
@@ -161,7 +243,10 @@ def main():
     with open(args.input, "r") as f:
         program_str = f.read()
 
-    bytecode = assemble_chip8_program(program_str)
+    try:
+        bytecode = assemble_chip8_program(program_str)
+    except ValueError as e:
+        sys.exit(f"{args.input}: {e}")
 
     write_to_file(args.output, bytecode)
     print(f"Program assembled and written to {args.output}")
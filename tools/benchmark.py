@@ -0,0 +1,224 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chip8 import PROGRAM_START, Chip8  # noqa: E402
+from farm import ROM_DIR, SEED, list_roms, scripted_keys  # noqa: E402
+from library import open_rom  # noqa: E402
+from recompiler import Recompiler  # noqa: E402
+
+# Opcode families for the micro-benchmarks: name -> (setup, stream). The
+# stream is repeated to fill a 256-instruction loop closed by a jump back to
+# the start, after ``setup`` has put the registers in a known state.
+MICRO_FAMILIES = {
+    "LD Vx, byte (6XKK)": ([], [0x6012, 0x6134, 0x6256, 0x6378]),
+    "ADD Vx, byte (7XKK)": ([], [0x7001, 0x7102, 0x7203, 0x7304]),
+    "ALU (8XY0-8XYE)": ([0x6005, 0x6107], [0x8010, 0x8011, 0x8012, 0x8013, 0x8014, 0x8015, 0x8016, 0x8017, 0x801E]),
+    "Skips not taken (3XKK/4XKK/5XY0/9XY0)": ([0x6001], [0x3002, 0x4001, 0x5010, 0x9000]),
+    "JP (1NNN)": ([], None),  # A chain of jumps, each to the next instruction
+    "CALL/RET (2NNN/00EE)": ([], None),  # Calls to a subroutine that returns
+    "LD I (ANNN)": ([], [0xA300, 0xA400]),
+    "JP V0 (BNNN)": ([], None),  # Jumps through V0 = 0 to the next instruction
+    "RND (CXKK)": ([], [0xC0FF, 0xC10F]),
+    "DRW (DXYN)": ([0x600A, 0x610A, 0xA000], [0xD015, 0xD015]),
+    "Key skips not taken (EX9E)": ([0x6003], [0xE09E]),
+    "Timers (FX07/FX15/FX18)": ([0x6010], [0xF015, 0xF007, 0xF018]),
+    "ADD I / LD F (FX1E/FX29)": ([0x6001], [0xF01E, 0xF029]),
+    "BCD (FX33)": ([0x60FF, 0xAE00], [0xF033]),
+    "Store/load (FX55/FX65)": ([0xAE00], [0xF755, 0xF765]),
+}
+
+MICRO_LOOP_LENGTH = 256
+
+
+def build_micro_program(name):
+    """Return the instructions of the synthetic program for a family."""
+    setup, stream = MICRO_FAMILIES[name]
+    start = PROGRAM_START + 2 * len(setup)
+    addresses = [start + 2 * i for i in range(MICRO_LOOP_LENGTH)]
+    if name.startswith("JP (1NNN)"):
+        body = [0x1000 | (addr + 2) for addr in addresses]
+    elif name.startswith("JP V0"):
+        body = [0xB000 | (addr + 2) for addr in addresses]
+    elif name.startswith("CALL/RET"):
+        subroutine = start + 2 * (MICRO_LOOP_LENGTH + 1)
+        body = [0x2000 | subroutine] * MICRO_LOOP_LENGTH
+    else:
+        body = [stream[i % len(stream)] for i in range(MICRO_LOOP_LENGTH)]
+    program = setup + body + [0x1000 | start]
+    if name.startswith("CALL/RET"):
+        program.append(0x00EE)
+    return program
+
+
+def make_runner(chip8, engine):
+    """Return a function executing about ``count`` instructions on ``chip8``.
+
+    The function returns how many instructions it actually executed.
+    """
+    if engine == "recompiler":
+        return Recompiler(chip8).run
+
+    run_cycles = chip8.run_cycles
+
+    def run(count):
+        run_cycles(count)
+        return count
+
+    return run
+
+
+def benchmark_micro(name, cycles, engine="interpreter"):
+    """Run a family's synthetic program; returns instructions per second."""
+    chip8 = Chip8()
+    program = build_micro_program(name)
+    chip8.memory[PROGRAM_START:PROGRAM_START + 2 * len(program)] = b"".join(
+        opcode.to_bytes(2, "big") for opcode in program
+    )
+    run = make_runner(chip8, engine)
+    run(MICRO_LOOP_LENGTH)  # Warm up: setup, decoding and compilation
+
+    start = time.perf_counter()
+    executed = run(cycles)
+    return executed / (time.perf_counter() - start)
+
+
+def run_rom_frames(entry, frames, engine):
+    """Run ``frames`` frames of a ROM headless with the farm's scripted input.
+
+    Returns the number of instructions executed.
+    """
+    chip8 = Chip8(seed=SEED)
+    with open_rom(entry) as data:
+        chip8.load_rom_bytes(data)
+    run = make_runner(chip8, engine)
+    keys = chip8.keys
+    update_timers = chip8.update_timers
+    cycles_per_frame = chip8.cycles_per_frame
+    executed = 0
+    for frame in range(frames):
+        keys[:] = [0] * 16
+        key = scripted_keys(frame)
+        if key is not None:
+            keys[key] = 1
+        executed += run(cycles_per_frame)
+        update_timers()
+    return executed
+
+
+def benchmark_rom(entry, frames, engine="interpreter"):
+    """Benchmark the ROM of a ``library.RomEntry`` headless for ``frames`` frames.
+
+    Returns a dict with instructions and frames per second and the peak
+    memory allocated by the run in KiB. Peak memory is measured in a second
+    run, as tracing allocations slows emulation down.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        executed = run_rom_frames(entry, frames, engine)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        run_rom_frames(entry, frames, engine)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "instructions_per_second": executed / elapsed,
+        "frames_per_second": frames / elapsed,
+        "peak_memory_kib": peak / 1024,
+    }
+
+
+def git_revision():
+    """Return the short hash of the checked out commit, or None."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the relative change of every throughput figure versus a baseline."""
+    for section, key in (("micro", "instructions_per_second"), ("macro", "instructions_per_second")):
+        for name, result in results.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if before:
+                change = (result[key] / before[key] - 1) * 100
+                print(f"{section:<6} {name:<40} {change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Chip-8 core per opcode family and per ROM.")
+    parser.add_argument("--roms", type=str, default=ROM_DIR, help="Directory or zip archive of ROMs to run.")
+    parser.add_argument("--cycles", type=int, default=200_000, help="Instructions per micro-benchmark.")
+    parser.add_argument("--frames", type=int, default=1200, help="Frames to run per ROM.")
+    parser.add_argument(
+        "--engine",
+        choices=("interpreter", "recompiler"),
+        default="interpreter",
+        help="Execution engine to benchmark.",
+    )
+    parser.add_argument("--micro", action="store_true", help="Only run the opcode family micro-benchmarks.")
+    parser.add_argument("--macro", action="store_true", help="Only run the per-ROM macro-benchmarks.")
+    parser.add_argument("--json", type=str, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", type=str, help="JSON results of an earlier run to compare against.")
+    args = parser.parse_args()
+    run_micro = args.micro or not args.macro
+    run_macro = args.macro or not args.micro
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "engine": args.engine,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "cycles": args.cycles,
+            "frames": args.frames,
+        },
+    }
+
+    if run_micro:
+        results["micro"] = {}
+        for name in MICRO_FAMILIES:
+            ips = benchmark_micro(name, args.cycles, args.engine)
+            results["micro"][name] = {"instructions_per_second": ips, "ns_per_instruction": 1e9 / ips}
+            print(f"{name:<40} {ips:>12,.0f} instr/s {1e9 / ips:>8.0f} ns")
+
+    if run_macro:
+        results["macro"] = {}
+        for entry in list_roms(args.roms):
+            result = benchmark_rom(entry, args.frames, args.engine)
+            results["macro"][entry.name] = result
+            print(
+                f"{entry.name:<16} {result['instructions_per_second']:>12,.0f} instr/s "
+                f"{result['frames_per_second']:>10,.0f} fps {result['peak_memory_kib']:>8.1f} KiB peak"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,145 +1,306 @@
 import argparse
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
-def dissassemble_rom(file):
-    with open(file, "rb") as rom:
+from chip8 import PROGRAM_START  # noqa: E402
+from library import DEFAULT_ROM_DIR, RomLibrary, open_rom, read_rom  # noqa: E402
+from tracer import load_trace  # noqa: E402
+
+# How an instruction passes control on, used to follow the program's flow.
+NEXT = 'next'  # Falls through to the following instruction
+JUMP = 'jump'  # Continues at nnn only
+CALL = 'call'  # Continues at nnn and, after returning, the next instruction
+SKIP = 'skip'  # Continues at the next instruction or the one after it
+STOP = 'stop'  # Flow can't be followed past it (RET, JP V0, SYS, EXIT)
+
+# Opcode key -> (mnemonic, description, flow). Mnemonics are written in the
+# syntax tools/assembler.py reads: bare hex numbers and {addr} for an
+# address operand, which becomes a label when the address is in the ROM.
+INSTRUCTIONS = {
+    0x00E0: ('CLS', 'Clear the display.', NEXT),
+    0x00EE: ('RET', 'Return from a subroutine.', STOP),
+    0x00C0: ('SCD {n:X}', 'Scroll the display down {n} pixels.', NEXT),
+    0x00FB: ('SCR', 'Scroll the display right 4 pixels.', NEXT),
+    0x00FC: ('SCL', 'Scroll the display left 4 pixels.', NEXT),
+    0x00FD: ('EXIT', 'Halt the interpreter.', STOP),
+    0x00FE: ('LOW', 'Switch to 64x32 low resolution and clear the display.', NEXT),
+    0x00FF: ('HIGH', 'Switch to 128x64 high resolution and clear the display.', NEXT),
+    0x0000: ('SYS {addr}', 'Call machine code routine at {addr}.', STOP),
+    0x1000: ('JP {addr}', 'Jump to location {addr}.', JUMP),
+    0x2000: ('CALL {addr}', 'Call subroutine at {addr}.', CALL),
+    0x3000: ('SE V{x:X}, {kk:02X}', 'Skip next instruction if V{x:X} = {kk:02X}.', SKIP),
+    0x4000: ('SNE V{x:X}, {kk:02X}', 'Skip next instruction if V{x:X} != {kk:02X}.', SKIP),
+    0x5000: ('SE V{x:X}, V{y:X}', 'Skip next instruction if V{x:X} = V{y:X}.', SKIP),
+    0x6000: ('LD V{x:X}, {kk:02X}', 'Set V{x:X} = {kk:02X}.', NEXT),
+    0x7000: ('ADD V{x:X}, {kk:02X}', 'Set V{x:X} = V{x:X} + {kk:02X}.', NEXT),
+    0x8000: ('LD V{x:X}, V{y:X}', 'Set V{x:X} = V{y:X}.', NEXT),
+    0x8001: ('OR V{x:X}, V{y:X}', 'Set V{x:X} = V{x:X} OR V{y:X}.', NEXT),
+    0x8002: ('AND V{x:X}, V{y:X}', 'Set V{x:X} = V{x:X} AND V{y:X}.', NEXT),
+    0x8003: ('XOR V{x:X}, V{y:X}', 'Set V{x:X} = V{x:X} XOR V{y:X}.', NEXT),
+    0x8004: ('ADD V{x:X}, V{y:X}', 'Set V{x:X} = V{x:X} + V{y:X}, set VF = carry.', NEXT),
+    0x8005: ('SUB V{x:X}, V{y:X}', 'Set V{x:X} = V{x:X} - V{y:X}, set VF = NOT borrow.', NEXT),
+    0x8006: ('SHR V{x:X}, V{y:X}', 'Set V{x:X} = V{x:X} SHR 1.', NEXT),
+    0x8007: ('SUBN V{x:X}, V{y:X}', 'Set V{x:X} = V{y:X} - V{x:X}, set VF = NOT borrow.', NEXT),
+    0x800E: ('SHL V{x:X}, V{y:X}', 'Set V{x:X} = V{x:X} SHL 1.', NEXT),
+    0x9000: ('SNE V{x:X}, V{y:X}', 'Skip next instruction if V{x:X} != V{y:X}.', SKIP),
+    0xA000: ('LD I, {addr}', 'Set I = {addr}.', NEXT),
+    0xB000: ('JP V0, {addr}', 'Jump to location {addr} + V0.', STOP),
+    0xC000: ('RND V{x:X}, {kk:02X}', 'Set V{x:X} = random byte AND {kk:02X}.', NEXT),
+    0xD000: ('DRW V{x:X}, V{y:X}, {n:X}',
+             'Display {n}-byte sprite starting at memory location I at (V{x:X}, V{y:X}), set VF = collision.',
+             NEXT),
+    0xE09E: ('SKP V{x:X}', 'Skip next instruction if key with the value of V{x:X} is pressed.', SKIP),
+    0xE0A1: ('SKNP V{x:X}', 'Skip next instruction if key with the value of V{x:X} is not pressed.', SKIP),
+    0xF007: ('LD V{x:X}, DT', 'Set V{x:X} = delay timer value.', NEXT),
+    0xF00A: ('LD V{x:X}, K', 'Wait for a key press, store the value of the key in V{x:X}.', NEXT),
+    0xF015: ('LD DT, V{x:X}', 'Set delay timer = V{x:X}.', NEXT),
+    0xF018: ('LD ST, V{x:X}', 'Set sound timer = V{x:X}.', NEXT),
+    0xF01E: ('ADD I, V{x:X}', 'Set I = I + V{x:X}.', NEXT),
+    0xF029: ('LD F, V{x:X}', 'Set I = location of sprite for digit V{x:X}.', NEXT),
+    0xF030: ('LD HF, V{x:X}', 'Set I = location of 8x10 sprite for digit V{x:X}.', NEXT),
+    0xF033: ('LD B, V{x:X}', 'Store BCD representation of V{x:X} in memory locations I, I+1, and I+2.', NEXT),
+    0xF055: ('LD [I], V{x:X}', 'Store registers V0 through V{x:X} in memory starting at location I.', NEXT),
+    0xF065: ('LD V{x:X}, [I]', 'Read registers V0 through V{x:X} from memory starting at location I.', NEXT),
+    0xF075: ('LD R, V{x:X}', 'Store registers V0 through V{x:X} in the flag registers.', NEXT),
+    0xF085: ('LD V{x:X}, R', 'Read registers V0 through V{x:X} from the flag registers.', NEXT),
+}
+
+# Bits of an opcode that select its entry in INSTRUCTIONS, by top nibble.
+_KEY_MASKS = (
+    0xF000, 0xF000, 0xF000, 0xF000, 0xF000, 0xF00F, 0xF000, 0xF000,
+    0xF00F, 0xF00F, 0xF000, 0xF000, 0xF000, 0xF000, 0xF0FF, 0xF0FF,
+)
+
+# Lines of a listing are written to the output file in batches this big.
+_WRITE_BATCH = 1024
+
+
+def lookup(oc):
+    """Return the ``INSTRUCTIONS`` entry of opcode ``oc``, or None if invalid."""
+    if oc in INSTRUCTIONS and oc < 0x0100:
+        return INSTRUCTIONS[oc]
+    if oc & 0xFFF0 == 0x00C0:
+        return INSTRUCTIONS[0x00C0]
+    return INSTRUCTIONS.get(oc & _KEY_MASKS[oc >> 12])
+
+
+def _fields(oc, labels=None):
+    """Return the operand fields of ``oc`` for formatting its templates."""
+    nnn = oc & 0x0FFF
+    return {
+        'x': (oc & 0x0F00) >> 8,
+        'y': (oc & 0x00F0) >> 4,
+        'n': oc & 0x000F,
+        'kk': oc & 0x00FF,
+        'addr': labels[nnn] if labels and nnn in labels else '{:03X}'.format(nnn),
+    }
+
+
+def describe(oc):
+    """Return the mnemonic and description of opcode ``oc``.
+
+    Returns None for opcodes that are not valid instructions.
+    """
+    entry = lookup(oc)
+    if entry is None:
+        return None
+    mnemonic, description, _ = entry
+    fields = _fields(oc)
+    return '{} - {} - {}'.format(hex(oc), mnemonic.format(**fields), description.format(**fields))
+
+
+def find_code(data, origin=PROGRAM_START):
+    """Follow control flow through a ROM loaded at ``origin``.
+
+    Starting from ``origin``, every jump, call and skip is followed to find
+    which addresses hold instructions; whatever is never reached is data.
+    Returns ``(code, targets)``: the set of instruction addresses and the
+    set of addresses in the ROM that instructions jump to, call or point I
+    at, which deserve labels.
+    """
+    view = memoryview(data)
+    end = origin + len(view)
+    code = set()
+    targets = set()
+    pending = [origin]
+    while pending:
+        addr = pending.pop()
+        # Straight-line code is followed in this loop; branches go on the
+        # worklist, so deep call chains can't overflow the stack.
+        while origin <= addr < end - 1 and addr not in code:
+            oc = (view[addr - origin] << 8) | view[addr - origin + 1]
+            entry = lookup(oc)
+            if entry is None:
+                break
+            code.add(addr)
+            flow = entry[2]
+            nnn = oc & 0x0FFF
+            if oc & 0xF000 in (0x1000, 0x2000, 0xA000, 0xB000) and origin <= nnn < end:
+                targets.add(nnn)
+            if flow == JUMP:
+                pending.append(nnn)
+                break
+            if flow == CALL:
+                pending.append(nnn)
+            elif flow == SKIP:
+                pending.append(addr + 4)
+            elif flow == STOP:
+                break
+            addr += 2
+    return code, targets
+
+
+def listing(data, origin=PROGRAM_START):
+    """Yield the lines of an assembler listing of ``data``.
+
+    Reachable instructions are listed as mnemonics with labels for the
+    addresses they refer to; everything else, including a trailing odd
+    byte, is listed as ``DB`` data.
+    """
+    view = memoryview(data)
+    end = origin + len(view)
+    code, targets = find_code(view, origin)
+
+    # Lay out the lines first, so labels are only used for addresses that
+    # start a line. An instruction overlapping another one reached at an
+    # odd address is listed as data.
+    layout = []
+    addr = origin
+    while addr < end:
+        if addr in code and addr + 1 not in code:
+            layout.append((addr, 2, True))
+            addr += 2
+        else:
+            start = addr
+            addr += 1
+            while addr < end and addr - start < 8 and addr not in code and addr not in targets:
+                addr += 1
+            layout.append((start, addr - start, False))
+    starts = {addr for addr, _, _ in layout}
+    labels = {addr: 'L{:03X}'.format(addr) for addr in targets if addr in starts}
+
+    for addr, length, is_code in layout:
+        if addr in labels:
+            yield '{}:\n'.format(labels[addr])
+        chunk = view[addr - origin:addr - origin + length]
+        if is_code:
+            oc = (chunk[0] << 8) | chunk[1]
+            text = lookup(oc)[0].format(**_fields(oc, labels))
+            yield '    {:<20} ; {:03X}: {:04X}\n'.format(text, addr, oc)
+        else:
+            text = 'DB ' + ', '.join('{:02X}'.format(byte) for byte in chunk)
+            yield '    {:<20} ; {:03X}\n'.format(text, addr)
+
+
+def dissassemble(data, out=sys.stdout, origin=PROGRAM_START):
+    """Write a listing of ``data`` to the text file ``out``.
+
+    ``data`` can be any bytes-like object, e.g. ROM bytes or a slice of
+    ``Chip8.memory_view``; it is read in place without being copied. Lines
+    are written in batches rather than one at a time.
+    """
+    batch = []
+    for line in listing(data, origin):
+        batch.append(line)
+        if len(batch) >= _WRITE_BATCH:
+            out.write(''.join(batch))
+            batch.clear()
+    out.write(''.join(batch))
+
+
+def dissassemble_rom(file, out=sys.stdout):
+    with open(file, 'rb') as rom:
         data = rom.read()
-    data = list(data)
-
-    opcodes = []
-
-
-    for i in range(0, len(data), 2):
-        # the opcodes are 2 bytes long, as data is stored at 1 byte length
-        #  we have to concatenate it
-        opcodes.append((data[i] << 8) | data[i+1])
-
-    for oc in opcodes:
-        mask = oc & 0xF000
-        x = (oc & 0x0F00) >> 8
-        y = (oc & 0x00F0) >> 4
-        nnn = oc & 0x0FFF
-        kk = oc & 0x00FF
-
-        if mask == 0x0000:
-            if oc == 0x00E0:
-                print('{} - CLS - Clear the display'.format(hex(oc)))
-            elif oc == 0x00EE:
-                print('{} - RET - Return from a subroutine.'.format(hex(oc)))
-        elif mask == 0x1000:
-            print('{} - JP {} - Jump to location {}'.format(hex(oc), hex(nnn), hex(nnn)))
-        elif mask == 0x2000:
-            print(
-                '{} - CALL {} - Call subroutine at {}.'.format(hex(oc), hex(nnn), hex(nnn)))
-        elif mask == 0x3000:
-            print(
-                '{} - SE V{}, {} - Skip next instruction if V{} = {}.'.format(hex(oc), x, kk,  x, kk))
-        elif mask == 0x4000:
-            print('{} - SNE V{}, {} - Skip next instruction if V{} != {}.'.format(
-                hex(oc), x, kk, x, kk))
-        elif mask == 0x5000:
-            print(
-                '{} - SE V{}, V{} - Skip next instruction if V{} = V{}.'.format(hex(oc), x, y, x, y))
-        elif mask == 0x6000:
-            print('{} - LD V{}, {} - Set V{} = {}.'.format(hex(oc), x, kk, x, kk))
-        elif mask == 0x7000:
-            print(
-                '{} - ADD V{}, {} - Set V{} = V{} + {}.'.format(hex(oc), x, kk, x, x, kk))
-        elif mask == 0x8000:
-            mask2 = oc & 0x000F
-            if mask2 == 0x0000:
-                print('{} - LD V{}, V{} - Set V{} = V{}.'.format(hex(oc), x, y, x, y))
-            elif mask2 == 0x0001:
-                print(
-                    '{} - OR V{}, V{} - Set V{} = V{} OR V{}.'.format(hex(oc), x, y, x, x, y))
-            elif mask2 == 0x0002:
-                print(
-                    '{} - AND V{}, V{} - Set V{} = V{} AND V{}.'.format(hex(oc), x, y, x, x, y))
-            elif mask2 == 0x0003:
-                print(
-                    '{} - XOR V{}, V{} - Set V{} = V{} XOR V{}.'.format(hex(oc), x, y, x, x, y))
-            elif mask2 == 0x0004:
-                print(
-                    '{} - ADD V{}, V{} Set V{} = V{} + V{}, set VF = carry.'.format(hex(oc), x, y, x, x, y))
-            elif mask2 == 0x0005:
-                print(
-                    '{} - SUB V{}, V{} - Set V{} = V{} - V{}, set VF = NOT borrow.'.format(hex(oc), x, y, x, x, y))
-            elif mask2 == 0x0006:
-                print(
-                    '{} - SHR V{} [ V{}] Set V{} = V{} SHR 1.'.format(hex(oc), x, y, x, x))
-            elif mask2 == 0x0007:
-                print(
-                    '{} - SUBN V{}, V{} Set V{} = V{} - V{}, set VF = NOT borrow.'.format(hex(oc), x, y, x, y, x))
-            elif mask2 == 0x000E:
-                print(
-                    '{} - SHL V{} [, V{}]Set V{} = V{} SHL 1.'.format(hex(oc), x, y, x, x))
-            else:
-                print('{} - Wrong opcode'.format(hex(oc)))
-        elif mask == 0x9000:
-            if (oc & 0x000F) == 0x0000:
-                print(
-                    '{} - SNE V{}, V{} - Skip next instruction if V{} != V{}.'.format(hex(oc), x, y, x, y))
-            else:
-                print('{} - Wrong opcode'.format(hex(oc)))
-        elif mask == 0xA000:
-            print('{} - LD I, {} - Set I = {}.'.format(hex(oc), nnn, nnn))
-        elif mask == 0xB000:
-            print('{} - JP V0, {} - Jump to location {} + V0.'.format(hex(oc), nnn, nnn))
-        elif mask == 0xC000:
-            print(
-                '{} - RND V{}, {} - Set V{} = random byte AND {}.'.format(hex(oc), x, kk, x, kk))
-        elif mask == 0xD000:
-            print('{} - DRW V{}, V{}, {} - Display {}-byte sprite starting at memory location I at (V{}, V{}), set VF = collision.'.format(
-                hex(oc), x, y, (oc & 0x000F), (oc & 0x000F), x, y))
-        elif mask == 0xE000:
-            mask2 = oc & 0x00FF
-            if mask2 == 0x009E:
-                print(
-                    '{} - SKP V{} - Skip next instruction if key with the value of V{} is pressed.'.format(hex(oc), x, x))
-            elif mask2 == 0x00A1:
-                print(
-                    '{} - SKNP V{} - Skip next instruction if key with the value of V{} is not pressed.'.format(hex(oc), x, x))
-            else:
-                print('{} - Wrong opcode'.format(hex(oc)))
-
-        elif mask == 0xF000:
-            mask2 = oc & 0x00FF
-
-            if mask2 == 0x0007:
-                print(
-                    '{} - LD V{}, DT - Set V{} = delay timer value.'.format(hex(oc), x, x))
-            elif mask2 == 0x000A:
-                print(
-                    '{} - LD V{}, K - Wait for a key press, store the value of the key in V{}.'.format(hex(oc), x, x))
-            elif mask2 == 0x0015:
-                print('{} - LD DT, V{} - Set delay timer = V{}.'.format(hex(oc), x, x))
-            elif mask2 == 0x0018:
-                print('{} - LD ST, V{} - Set sound timer = V{}.'.format(hex(oc), x, x))
-            elif mask2 == 0x001E:
-                print('{} - ADD I, V{} - Set I = I + V{}.'.format(hex(oc), x, x))
-            elif mask2 == 0x0029:
-                print(
-                    '{} - LD F, V{} - Set I = location of sprite for digit V{}.'.format(hex(oc), x, x))
-            elif mask2 == 0x0033:
-                print(
-                    '{} - LD B, V{} - Store BCD representation of V{} in memory locations I, I+1, and I+2.'.format(hex(oc), x, x))
-            elif mask2 == 0x0055:
-                print(
-                    '{} - LD [I], V{} - Store registers V0 through V{} in memory starting at location I.'.format(hex(oc), x, x))
-            elif mask2 == 0x0065:
-                print(
-                    '{} - LD V{}, [I] - Read registers V0 through V{} from memory starting at location I.'.format(hex(oc), x, x))
-            else:
-                print('{} - Wrong opcode'.format(hex(oc)))
+    dissassemble(data, out)
+
+
+def dissassemble_entry(entry, out=sys.stdout):
+    """Disassemble the ROM of a ``library.RomEntry``."""
+    with open_rom(entry) as data:
+        dissassemble(data, out)
+
+
+def _dissassemble_job(job):
+    """Disassemble one ROM of a batch into its output file; returns its name."""
+    entry, output = job
+    with open(output, 'w') as out:
+        dissassemble_entry(entry, out)
+    return os.path.basename(output)
+
+
+def dissassemble_batch(source, output_dir, jobs=None):
+    """Disassemble every distinct ROM in a directory or zip archive in parallel.
+
+    Each ROM's listing is written to ``output_dir`` as ``<name>.s``; ROMs
+    found more than once (say, extracted next to their archive) are
+    disassembled once. Returns the names of the files written.
+    """
+    entries = RomLibrary([source]).unique()
+    os.makedirs(output_dir, exist_ok=True)
+    work = [(entry, os.path.join(output_dir, entry.name + '.s')) for entry in entries]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_dissassemble_job, work))
+
+
+def dissassemble_trace(file, start=0x000, end=0xFFF):
+    """Print the records of a trace file made by ``tracer.Tracer``.
+
+    Each executed instruction is annotated with its cycle number, address,
+    the value of I and the register hash after it ran. Only instructions at
+    addresses from ``start`` to ``end`` inclusive are printed.
+    """
+    for record in load_trace(file):
+        if start <= record.pc <= end:
+            text = describe(record.opcode) or '{} - Wrong opcode'.format(hex(record.opcode))
+            print('{:>10} {:03X}  I={:03X} regs={:08X}  {}'.format(
+                record.cycle, record.pc, record.I, record.registers, text))
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Disassemble a ROM file.')
-    parser.add_argument('file', type=str, help='The ROM file to disassemble.')
+    parser = argparse.ArgumentParser(description='Disassemble ROMs or an execution trace.')
+    parser.add_argument('file', type=str,
+                        help='The ROM file to disassemble, a directory or zip archive of ROMs, '
+                             'or the name or SHA-1 of a ROM in the library.')
+    parser.add_argument('--library', type=str, action='append',
+                        help='Directory or zip archive to look ROM names up in (default: games_roms); repeatable.')
+    parser.add_argument('-o', '--output', type=str,
+                        help='File to write the listing to; for a directory or archive, the output directory.')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Worker processes for a directory or archive (default: all cores).')
+    parser.add_argument('--trace', action='store_true', help='The file is a trace written by tracer.Tracer.')
+    parser.add_argument('--start', type=lambda s: int(s, 16), default=0x000,
+                        help='With --trace, first address to show (hex).')
+    parser.add_argument('--end', type=lambda s: int(s, 16), default=0xFFF,
+                        help='With --trace, last address to show (hex).')
 
     args = parser.parse_args()
 
-    dissassemble_rom(args.file)
+    if args.trace:
+        dissassemble_trace(args.file, args.start, args.end)
+    elif os.path.isdir(args.file) or zipfile.is_zipfile(args.file):
+        if args.output is None:
+            parser.error('disassembling a directory or archive requires --output')
+        names = dissassemble_batch(args.file, args.output, args.jobs)
+        print('Disassembled {} ROMs into {}'.format(len(names), args.output))
+    else:
+        if os.path.isfile(args.file):
+            with open(args.file, 'rb') as rom:
+                data = rom.read()
+        else:
+            try:
+                data = read_rom(RomLibrary(args.library or [DEFAULT_ROM_DIR]).find(args.file))
+            except ValueError as e:
+                parser.error(str(e))
+        if args.output:
+            with open(args.output, 'w') as out:
+                dissassemble(data, out)
+        else:
+            dissassemble(data)
+
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
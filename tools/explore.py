@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chip8 import CYCLES_PER_FRAME, PROGRAM_START, QUIRK_PROFILES, Chip8  # noqa: E402
+from dissambler import describe, find_code  # noqa: E402
+from explorer import MAX_STATES, RANDOM_BRANCHES, SEGMENT_CYCLES, explore  # noqa: E402
+from farm import SEED  # noqa: E402
+from library import DEFAULT_ROM_DIR, load_rom  # noqa: E402
+
+
+def _ranges(addresses):
+    """Group instruction addresses into ``(first, last)`` runs 2 bytes apart."""
+    runs = []
+    for address in sorted(addresses):
+        if runs and address == runs[-1][1] + 2:
+            runs[-1][1] = address
+        else:
+            runs.append([address, address])
+    return runs
+
+
+def report(chip8, exploration, uncovered=False):
+    """Print the search size, coverage of the ROM's code and the crashes found."""
+    print(f"{exploration.states:,} states explored", end="")
+    print(f", {exploration.pending:,} left unexplored" if exploration.pending else ", search complete")
+
+    code, _ = find_code(chip8.memory_view[PROGRAM_START:])
+    covered = exploration.coverage & code
+    print(f"{len(covered)} of {len(code)} reachable instructions executed ({len(covered) / (len(code) or 1):.1%})")
+    elsewhere = exploration.coverage - code
+    if elsewhere:
+        print(f"{len(elsewhere)} executed addresses the disassembler can't reach (computed jumps or data)")
+    if uncovered:
+        for first, last in _ranges(code - exploration.coverage):
+            print(f"  never ran 0x{first:03X}-0x{last + 1:03X}")
+
+    for crash in sorted(exploration.crashes, key=lambda crash: crash.pc):
+        text = describe(crash.opcode) or f"{crash.opcode:04X}"
+        print(f"CRASH at 0x{crash.pc:03X} ({text}): {crash.message}")
+        print("  after " + (", ".join(crash.path) if crash.path else "no input"))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Explore the states a ROM can reach, forking at every key test and random draw, "
+                    "and report code coverage and crashes."
+    )
+    parser.add_argument("file", type=str, help="The ROM file to explore, or the name or SHA-1 of a ROM in the library.")
+    parser.add_argument("--library", type=str, action="append",
+                        help="Directory or zip archive of ROMs to look the ROM up in (default: games_roms); repeatable.")
+    parser.add_argument("--states", type=int, default=MAX_STATES, help="Distinct states to explore at most.")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--segment", type=int, default=SEGMENT_CYCLES,
+                        help="Instructions run without a decision before a state is recorded anyway.")
+    parser.add_argument("--random", type=int, default=RANDOM_BRANCHES,
+                        help="Values to try at most for each random draw.")
+    parser.add_argument("--speed", type=int, default=CYCLES_PER_FRAME, help="Instructions executed per 60 Hz frame.")
+    parser.add_argument("--quirks", type=str, default="default", choices=list(QUIRK_PROFILES),
+                        help="Interpreter whose behaviour to emulate where they differ.")
+    parser.add_argument("--uncovered", action="store_true", help="List the reachable code that never ran.")
+    parser.add_argument("--save-crashes", type=str, metavar="DIR",
+                        help="Write the machine state before each crash to DIR, for Chip8.load_state.")
+    args = parser.parse_args()
+
+    chip8 = Chip8(cycles_per_frame=args.speed, seed=SEED, quirks=args.quirks)
+    try:
+        name = load_rom(chip8, args.file, args.library or [DEFAULT_ROM_DIR])
+    except ValueError as e:
+        parser.error(str(e))
+
+    def progress(explored, pending):
+        print(f"\r{explored:,} states explored, {pending:,} pending", end="", file=sys.stderr, flush=True)
+
+    exploration = explore(chip8, max_states=args.states, jobs=args.jobs, segment_cycles=args.segment,
+                          random_branches=args.random, progress=progress)
+    print(file=sys.stderr)
+    report(chip8, exploration, args.uncovered)
+
+    if args.save_crashes and exploration.crashes:
+        os.makedirs(args.save_crashes, exist_ok=True)
+        for crash in exploration.crashes:
+            path = os.path.join(args.save_crashes, f"{name}-{crash.pc:03X}.state")
+            with open(path, "wb") as f:
+                f.write(crash.state)
+        print(f"Wrote {len(exploration.crashes)} crash states to {args.save_crashes}")
+    sys.exit(1 if exploration.crashes else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chip8 import Chip8  # noqa: E402
+from library import DEFAULT_ROM_DIR as ROM_DIR, RomLibrary, open_rom  # noqa: E402
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_FILE = os.path.join(TOOLS_DIR, "farm_golden.json")
+
+SEED = 0xC8C8C8C8
+CHECKPOINTS = (60, 300, 600, 1200)
+# Speed for the fast-forward check; run_frame only skips idle loops at 50
+# instructions per frame or more.
+FAST_FORWARD_SPEED = 100
+FAST_FORWARD_FRAMES = 600
+
+
+def list_roms(source):
+    """Return a ``library.RomEntry`` for each distinct ROM in a directory or
+    zip archive, preferring plain files to copies in archives."""
+    return RomLibrary([source]).unique()
+
+
+def scripted_keys(frame):
+    """Return the key held during ``frame``, or None.
+
+    Each key is held for 10 frames in turn, followed by 20 frames with no
+    key down, so every ROM sees the same input on every run.
+    """
+    if frame % 30 < 10:
+        return (frame // 30) % 16
+    return None
+
+
+def run_rom(entry, checkpoints=CHECKPOINTS, seed=SEED):
+    """Run the ROM of a ``library.RomEntry`` headless with scripted input.
+
+    Returns a dict with the framebuffer hash at each checkpoint frame, the
+    instructions per second achieved, and the error that stopped the ROM,
+    if any. Checkpoints after an error are recorded as that error.
+    """
+    chip8 = Chip8(seed=seed)
+    with open_rom(entry) as data:
+        chip8.load_rom_bytes(data)
+    keys = chip8.keys
+    hashes = {}
+    error = None
+    frame = 0
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            for checkpoint in sorted(checkpoints):
+                while frame < checkpoint:
+                    keys[:] = [0] * 16
+                    key = scripted_keys(frame)
+                    if key is not None:
+                        keys[key] = 1
+                    chip8.run_frame()
+                    frame += 1
+                hashes[str(checkpoint)] = chip8.framebuffer_hash()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            for checkpoint in checkpoints:
+                hashes.setdefault(str(checkpoint), "error: " + error)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rom": entry.name,
+        "hashes": hashes,
+        "error": error,
+        "instructions_per_second": frame * chip8.cycles_per_frame / elapsed if elapsed else 0.0,
+    }
+
+
+def check_fast_forward(entry, frames=FAST_FORWARD_FRAMES, speed=FAST_FORWARD_SPEED, seed=SEED):
+    """Check that skipping idle loops changes nothing for a ``library.RomEntry``.
+
+    Runs the ROM at ``speed`` instructions per frame with scripted input,
+    once through ``run_frame`` and once through ``run_cycles`` plus a timer
+    tick, and compares the save states after every frame. Returns the first
+    frame where they differ, or None.
+    """
+    machines = [Chip8(cycles_per_frame=speed, seed=seed) for _ in range(2)]
+    with open_rom(entry) as data:
+        for chip8 in machines:
+            chip8.load_rom_bytes(data)
+    fast, plain = machines
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for frame in range(frames):
+            errors = []
+            for chip8 in machines:
+                chip8.keys[:] = [0] * 16
+                key = scripted_keys(frame)
+                if key is not None:
+                    chip8.keys[key] = 1
+            try:
+                fast.run_frame()
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            try:
+                plain.run_cycles(speed)
+                plain.update_timers()
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            if errors:
+                # Both must fail the same way, and then the ROM is done.
+                return None if len(errors) == 2 and errors[0] == errors[1] else frame
+            if fast.save_state() != plain.save_state():
+                return frame
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run every ROM headless in parallel and compare framebuffer hashes to a golden file."
+    )
+    parser.add_argument("--roms", type=str, default=ROM_DIR, help="Directory or zip archive of ROMs to run.")
+    parser.add_argument("--golden", type=str, default=GOLDEN_FILE, help="Golden hash file.")
+    parser.add_argument("--update", action="store_true", help="Rewrite the golden file from this run.")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: all cores).")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    roms = list_roms(args.roms)
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(run_rom, roms))
+        diverged = list(pool.map(check_fast_forward, roms))
+    elapsed = time.perf_counter() - start
+
+    if args.update:
+        golden = {result["rom"]: result["hashes"] for result in results}
+        with open(args.golden, "w") as f:
+            json.dump(golden, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Wrote golden hashes for {len(golden)} ROMs to {args.golden}")
+        return
+
+    with open(args.golden) as f:
+        golden = json.load(f)
+
+    mismatches = 0
+    for result, frame in zip(results, diverged):
+        expected = golden.get(result["rom"])
+        if expected is None:
+            status = "NEW"
+        else:
+            failed = [frame for frame, digest in result["hashes"].items() if expected.get(frame) != digest]
+            status = "ok" if not failed else "MISMATCH at frame " + ", ".join(failed)
+            mismatches += bool(failed)
+        if frame is not None:
+            status += f", FAST-FORWARD DIVERGES at frame {frame}"
+            mismatches += 1
+        print(f"{result['rom']:<16} {result['instructions_per_second']:>12,.0f} instr/s  {status}")
+
+    print(f"{len(results)} ROMs, {mismatches} mismatched, {elapsed:.2f}s")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import contextlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from chip8 import Chip8  # noqa: E402
+from dissambler import describe  # noqa: E402
+from farm import SEED, scripted_keys  # noqa: E402
+from library import load_rom  # noqa: E402
+from profiler import Profiler  # noqa: E402
+
+
+def profile_rom(rom, frames, seed=SEED):
+    """Run ``frames`` frames of a ROM under the profiler with scripted input.
+
+    ``rom`` is a file path, or the name or hash of a ROM in the default
+    library.
+    """
+    chip8 = Chip8(seed=seed)
+    load_rom(chip8, rom)
+    profiler = Profiler(chip8)
+    keys = chip8.keys
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for frame in range(frames):
+            keys[:] = [0] * 16
+            key = scripted_keys(frame)
+            if key is not None:
+                keys[key] = 1
+            profiler.run_frame()
+    return profiler
+
+
+def report(profiler, top=20):
+    """Print time per opcode family and the hottest addresses with mnemonics."""
+    executed = sum(profiler.opcode_counts.values()) or 1
+    total_time = sum(profiler.family_time.values()) or 1
+
+    print(f"{'handler':<12} {'executions':>12} {'share':>7} {'time':>7} {'ns/op':>7}")
+    for name, executions, ns in profiler.families():
+        print(
+            f"{name:<12} {executions:>12,} {executions / executed:>7.1%} "
+            f"{ns / total_time:>7.1%} {ns / executions:>7.0f}"
+        )
+
+    print()
+    print(f"{'address':<8} {'executions':>12} {'share':>7}  instruction")
+    for pc, executions, opcode in profiler.hotspots(top):
+        text = describe(opcode) or f"{hex(opcode)} - Wrong opcode"
+        print(f"0x{pc:03X}    {executions:>12,} {executions / executed:>7.1%}  {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Profile a ROM headless and report opcode families and hot addresses."
+    )
+    parser.add_argument("file", type=str, help="The ROM file to profile, or the name or SHA-1 of a bundled ROM.")
+    parser.add_argument("--frames", type=int, default=1200, help="Frames to run.")
+    parser.add_argument("--top", type=int, default=20, help="Hot addresses to list.")
+    args = parser.parse_args()
+
+    try:
+        profiler = profile_rom(args.file, args.frames)
+    except ValueError as e:
+        parser.error(str(e))
+    report(profiler, args.top)
+
+
+if __name__ == "__main__":
+    main()
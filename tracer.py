@@ -0,0 +1,134 @@
+import struct
+import zlib
+from collections import namedtuple
+
+
+TRACE_MAGIC = b"C8TR"
+TRACE_VERSION = 1
+_HEADER = struct.Struct(">4sB")
+
+# One executed instruction: cycle number, pc, opcode, I after execution and
+# a CRC-32 of V0-VF after execution, so a change in any register shows up as
+# a change in the hash.
+_RECORD = struct.Struct(">QHHHI")
+RECORD_SIZE = _RECORD.size
+
+# Records are packed into memory and written to or read from files in chunks
+# of this many.
+_CHUNK_RECORDS = 4096
+
+TraceRecord = namedtuple("TraceRecord", "cycle pc opcode I registers")
+
+
+class Tracer:
+    """Execution path that records every instruction a Chip8 executes.
+
+    Records are packed binary structs, kept in a ring buffer holding the
+    last ``capacity`` instructions and, if ``path`` is given, appended to a
+    trace file through an in-memory buffer. Like ``Profiler`` it runs its
+    own loop, so untraced machines are unaffected. Close the tracer (or use
+    it as a context manager) to flush the file.
+    """
+
+    def __init__(self, chip8, capacity=65536, path=None):
+        self.chip8 = chip8
+        self.capacity = capacity
+        self.ring = bytearray(capacity * RECORD_SIZE)
+        self.cycle = 0  # Instructions traced so far
+        self.file = None
+        self.pending = bytearray()
+        if path is not None:
+            self.file = open(path, "wb")
+            self.file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run_cycles(self, count):
+        """Execute ``count`` instructions, recording each one."""
+        chip8 = self.chip8
+        memory = chip8.memory
+        V = chip8.V
+        pack = _RECORD.pack
+        crc32 = zlib.crc32
+        ring = self.ring
+        capacity = self.capacity
+        pending = self.pending
+        writing = self.file is not None
+        table = chip8.decode_table
+        cycle = self.cycle
+        try:
+            for _ in range(count):
+                pc = chip8.pc
+                opcode = (memory[pc] << 8) | memory[pc + 1]
+                table[opcode](chip8)
+                record = pack(cycle, pc, opcode, chip8.I & 0xFFFF, crc32(bytes(V)))
+                if capacity:
+                    offset = (cycle % capacity) * RECORD_SIZE
+                    ring[offset:offset + RECORD_SIZE] = record
+                if writing:
+                    pending += record
+                    if len(pending) >= _CHUNK_RECORDS * RECORD_SIZE:
+                        self.file.write(pending)
+                        pending.clear()
+                cycle += 1
+        finally:
+            self.cycle = cycle
+
+    def run_frame(self):
+        """Trace one 60 Hz frame, like ``Chip8.run_frame``."""
+        self.run_cycles(self.chip8.cycles_per_frame)
+        self.chip8.update_timers()
+
+    def records(self):
+        """Return the records in the ring buffer, oldest first."""
+        held = min(self.cycle, self.capacity)
+        first = self.cycle - held
+        return [
+            TraceRecord(*_RECORD.unpack_from(self.ring, (cycle % self.capacity) * RECORD_SIZE))
+            for cycle in range(first, self.cycle)
+        ]
+
+    def dump(self, path):
+        """Write the ring buffer's records to a trace file at ``path``."""
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+            for record in self.records():
+                f.write(_RECORD.pack(*record))
+
+    def flush(self):
+        """Write buffered records to the trace file."""
+        if self.file is not None:
+            self.file.write(self.pending)
+            self.pending.clear()
+            self.file.flush()
+
+    def close(self):
+        """Flush and close the trace file, if any."""
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+def load_trace(path):
+    """Yield the ``TraceRecord``s of a trace file in execution order.
+
+    Raises ``ValueError`` if the file is not a trace.
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size or _HEADER.unpack(header) != (TRACE_MAGIC, TRACE_VERSION):
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} Chip8 trace")
+        while True:
+            chunk = f.read(_CHUNK_RECORDS * RECORD_SIZE)
+            # Only the last chunk can be short; a partial record left by a
+            # run that was killed mid-write is dropped.
+            whole = len(chunk) - len(chunk) % RECORD_SIZE
+            if not whole:
+                break
+            for record in _RECORD.iter_unpack(memoryview(chunk)[:whole]):
+                yield TraceRecord(*record)